@@ -1,7 +1,8 @@
 import requests
+from upstream import UpstreamConfig
 
 def upload_to_thingspeak(temperature, humidity, steps, x, y, z, magnitude, user_feeling):
-    API_KEY = 'AVURSRXZ07INDOZO'  # Replace with your actual ThingSpeak Write API Key
+    API_KEY = UpstreamConfig.load().thingspeak_key  # [thingspeak] write_api_key in upstream.ini
     url = "https://api.thingspeak.com/update"
     params = {
         'api_key': API_KEY,
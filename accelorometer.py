@@ -3,24 +3,19 @@ import math
 import random
 import csv
 import os
+from log_setup import setup_logging, get_logger
+from posture import PostureTracker
+from orientation import orientation, is_moving
 from telegram_bot import send_telegram_message
-from led_alert import blink_led
-from buzzer_alert import buzz_buzzer
+
+log = get_logger('accel')
 
 # Fall detection with debug and low threshold
 def detect_fall(prev_magnitude, curr_magnitude, threshold=0.1):
     diff = abs(curr_magnitude - prev_magnitude)
-    print(f"[DEBUG] Magnitude: {curr_magnitude:.5f}, Prev: {prev_magnitude:.5f}, Diff: {diff:.5f}")
+    log.debug("Magnitude: %.5f, prev: %.5f, diff: %.5f", curr_magnitude, prev_magnitude, diff)
     return diff > threshold
 
-# GPIO and LCD setup
-try:
-    import RPi.GPIO as GPIO
-    import I2C_LCD_driver
-except ImportError:
-    GPIO = None
-    I2C_LCD_driver = None
-
 # Accelerometer import or mock
 try:
     import adxl345
@@ -53,7 +48,16 @@ MATRIX = [[1, 2, 3], [4, 5, 6], [7, 8, 9], ['*', 0, '#']]
 ROW = [6, 20, 19, 13]
 COL = [12, 5, 16]
 
-if GPIO:
+# CSV setup
+csv_filename = 'activity_log.csv'
+
+def setup_hardware():
+    """Import GPIO and the LCD driver; (None, None) off the Pi"""
+    try:
+        import RPi.GPIO as GPIO
+        import I2C_LCD_driver
+    except ImportError:
+        return None, None
     GPIO.setmode(GPIO.BCM)
     GPIO.setwarnings(False)
     for i in range(3):
@@ -61,119 +65,133 @@ if GPIO:
         GPIO.output(COL[i], 1)
     for j in range(4):
         GPIO.setup(ROW[j], GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-# LCD setup
-LCD = I2C_LCD_driver.lcd() if I2C_LCD_driver else None
-
-# CSV setup
-csv_filename = 'activity_log.csv'
-write_header = not os.path.exists(csv_filename)
-
-# Accelerometer setup
-acc = adxl345.ADXL345(i2c_port=1, address=0x53)
-acc.load_calib_value()
-acc.set_data_rate(adxl345.DataRate.R_100)
-acc.set_range(adxl345.Range.G_16, full_res=True)
-acc.measure_start()
-
-# Variables
-step_count = 0
-inactive_seconds = 0
-prev_z = None
-step_threshold = 0.0015
-prev_magnitude = None
-fall_alert_sent = False
+    return GPIO, I2C_LCD_driver.lcd()
 
 def get_magnitude(x, y, z):
     return math.sqrt(x**2 + y**2 + z**2)
 
-# Main loop
-with open(csv_filename, mode='a', newline='') as csvfile:
-    fieldnames = ['timestamp', 'x', 'y', 'z', 'posture', 'step_count', 'inactive_seconds']
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-    if write_header:
-        writer.writeheader()
-
-    while True:
-        x, y, z = acc.get_3_axis_adjusted()
-
-        # Step detection
-        if prev_z is not None and abs(z - prev_z) > step_threshold:
-            step_count += 1
-            print(f"Step detected! Total steps: {step_count}")
-        prev_z = z
-
-        # Posture detection
-        pitch = math.degrees(math.atan2(x, math.sqrt(y*y + z*z)))
-        roll = math.degrees(math.atan2(y, math.sqrt(x*x + z*z)))
-
-        if abs(pitch) < 30 and abs(roll) < 30:
-            posture = "Standing or Walking"
-        elif abs(roll) > 60:
-            posture = "Lying Down"
-        else:
-            posture = "Sitting"
-
-        # Inactivity detection
-        magnitude = get_magnitude(x, y, z)
-        if magnitude < 0.02:
-            inactive_seconds += 1
-        else:
-            inactive_seconds = 0
-
-        # Fall detection
-        fall_cooldown_seconds = 10
-        last_fall_time = 0
-
-        # Inside main loop
-        current_time = time.time()
-        if prev_magnitude is not None:
-            diff = abs(magnitude - prev_magnitude)
-            if detect_fall(prev_magnitude, magnitude):
-                if current_time - last_fall_time > fall_cooldown_seconds:
-                    print("⚠️ Fall detected! Sending Telegram alert...")
-                    send_telegram_message("⚠️ Fall detected for the elderly! Please check immediately.")
-                    if GPIO:
-                        buzz_buzzer(5)
-                        blink_led(5)
-                    last_fall_time = current_time  # start cooldown
-                    print(f"[FallCheck] Diff: {diff:.5f}, Time since last: {current_time - last_fall_time:.2f}s")
-        prev_magnitude = magnitude
-
-
-        if inactive_seconds > 60:
-            print("⚠️ Inactivity detected for over 60 seconds!")
-
-        # Print current status
-        print(f"X:{x:.5f}, Y:{y:.5f}, Z:{z:.5f}, Posture: {posture}")
-        print(f"Steps taken so far: {step_count}")
-
-        # Write to CSV
-        writer.writerow({
-            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
-            'x': round(x, 5),
-            'y': round(y, 5),
-            'z': round(z, 5),
-            'posture': posture,
-            'step_count': step_count,
-            'inactive_seconds': inactive_seconds
-        })
-        csvfile.flush()
-
-        # Keypad check to display step count
-        if GPIO and LCD:
-            key_pressed = None
-            for i in range(3):
-                GPIO.output(COL[i], 0)
-                for j in range(4):
-                    if GPIO.input(ROW[j]) == 0:
-                        key_pressed = MATRIX[j][i]
-                        while GPIO.input(ROW[j]) == 0:
-                            time.sleep(0.1)
-                GPIO.output(COL[i], 1)
-            if key_pressed == 1:
-                LCD.lcd_clear()
-                LCD.lcd_display_string("Steps taken:", 1)
-                LCD.lcd_display_string(str(step_count), 2)
-
-        time.sleep(0.1)  # Prevent crash from too-fast looping
+def main():
+    # Accelerometer first so sampling starts before the slower peripherals load
+    acc = adxl345.ADXL345(i2c_port=1, address=0x53)
+    acc.load_calib_value()
+    acc.set_data_rate(adxl345.DataRate.R_100)
+    acc.set_range(adxl345.Range.G_16, full_res=True)
+    acc.measure_start()
+
+    GPIO, LCD = setup_hardware()
+
+    # Non-blocking alert outputs so sampling continues while they play
+    if GPIO:
+        from buzzer_alert import BuzzerAlert
+        from led_alert import LedAlert
+        buzzer = BuzzerAlert()
+        led = LedAlert()
+    else:
+        buzzer = led = None
+
+    write_header = not os.path.exists(csv_filename)
+
+    # Variables
+    step_count = 0
+    inactive_seconds = 0
+    prev_z = None
+    step_threshold = 0.0015
+    prev_magnitude = None
+    fall_alert_sent = False
+    posture_tracker = PostureTracker()
+
+    with open(csv_filename, mode='a', newline='') as csvfile:
+        fieldnames = ['timestamp', 'x', 'y', 'z', 'posture', 'step_count', 'inactive_seconds']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        if write_header:
+            writer.writeheader()
+
+        while True:
+            x, y, z = acc.get_3_axis_adjusted()
+
+            # Step detection
+            if prev_z is not None and abs(z - prev_z) > step_threshold:
+                step_count += 1
+                log.debug("Step detected, total steps: %d", step_count)
+            prev_z = z
+
+            # Orientation computed once per sample, shared below
+            pitch, roll, magnitude = orientation(x, y, z)
+
+            # Posture detection (filtered, with hysteresis and minimum dwell time)
+            transition = posture_tracker.update(pitch, roll)
+            posture = posture_tracker.posture
+            if transition:
+                log.info("Posture changed: %s -> %s after %.0fs",
+                         transition.previous, transition.posture, transition.duration)
+
+            # Inactivity detection
+            if not is_moving(magnitude):
+                inactive_seconds += 1
+            else:
+                inactive_seconds = 0
+
+            # Fall detection
+            fall_cooldown_seconds = 10
+            last_fall_time = 0
+
+            # Inside main loop
+            current_time = time.time()
+            if prev_magnitude is not None:
+                diff = abs(magnitude - prev_magnitude)
+                if detect_fall(prev_magnitude, magnitude):
+                    if current_time - last_fall_time > fall_cooldown_seconds:
+                        log.warning("Fall detected, sending Telegram alert")
+                        send_telegram_message("⚠️ Fall detected for the elderly! Please check immediately.")
+                        if GPIO:
+                            buzzer.start_alert(duration=5, pattern="urgent")
+                            led.start_fall_alert(duration=5)
+                        last_fall_time = current_time  # start cooldown
+                        log.debug("Fall check diff: %.5f, time since last: %.2fs", diff, current_time - last_fall_time)
+            prev_magnitude = magnitude
+
+
+            if inactive_seconds > 60:
+                log.info("Inactivity detected for over 60 seconds")
+
+            # Print current status
+            log.debug("X: %.5f, Y: %.5f, Z: %.5f, posture: %s", x, y, z, posture)
+            log.debug("Steps taken so far: %d", step_count)
+
+            # Write to CSV
+            writer.writerow({
+                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'x': round(x, 5),
+                'y': round(y, 5),
+                'z': round(z, 5),
+                'posture': posture,
+                'step_count': step_count,
+                'inactive_seconds': inactive_seconds
+            })
+            csvfile.flush()
+
+            # Keypad check to display step count
+            if GPIO and LCD:
+                key_pressed = None
+                for i in range(3):
+                    GPIO.output(COL[i], 0)
+                    for j in range(4):
+                        if GPIO.input(ROW[j]) == 0:
+                            key_pressed = MATRIX[j][i]
+                            while GPIO.input(ROW[j]) == 0:
+                                time.sleep(0.1)
+                    GPIO.output(COL[i], 1)
+                if key_pressed == 1:
+                    LCD.lcd_clear()
+                    LCD.lcd_display_string("Steps taken:", 1)
+                    LCD.lcd_display_string(str(step_count), 2)
+
+            time.sleep(0.1)  # Prevent crash from too-fast looping
+
+
+if __name__ == '__main__':
+    log_listener = setup_logging()
+    try:
+        main()
+    finally:
+        log_listener.stop()  # flush queued records
@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+from collections import namedtuple
+
+from alert_rules import INACTIVITY, ABSENCE, MISSED_CHECKIN
+from orientation import is_moving
+
+# Fused activity states, most to least reassuring
+ACTIVE = 'active'            # moving or using the keypad
+PRESENT_STILL = 'present'    # in front of the device but not moving
+ABSENT = 'absent'            # not seen by the ultrasonic sensor and not moving
+UNKNOWN = 'unknown'          # no usable evidence yet
+
+# confidence is the fused probability of the reported state
+FusedState = namedtuple('FusedState', ['timestamp', 'state', 'confidence', 'activity', 'presence',
+                                       'motion', 'keypad'])
+
+# Which fused score must be low for an alert kind to go out, and how low.
+# Falls and sensor faults are never gated.
+DEFAULT_GATES = {
+    INACTIVITY: ('activity', 0.5),          # no "no movement" alert while keys are being pressed
+    ABSENCE: ('activity', 0.5),             # no "nobody here" alert while the wearer is moving
+    MISSED_CHECKIN: ('keypad', 0.5),        # a key press that raced the check-in timeout counts
+}
+
+
+def _decay(age, time_constant):
+    """1 for fresh evidence, falling exponentially with age"""
+    if age <= 0:
+        return 1.0
+    return math.exp(-age / time_constant)
+
+
+class ActivityFusion(object):
+    """One activity state from the accelerometer, ultrasonic sensor and keypad
+
+    Each source only updates a few timestamps (O(1) per message), so it can
+    sit on the event bus next to the 100Hz accelerometer stream. Evidence
+    decays with age: movement after motion_time_constant, key presses after
+    keypad_time_constant, and ultrasonic confidence drifts back to 0.5 once
+    the sensor stops reporting. Scores are evaluated at a given time, so an
+    alert is judged against the state as of its own timestamp:
+
+        activity = 1 - (1 - motion) * (1 - keypad)
+        presence = 1 - (1 - ultrasonic) * (1 - keypad)
+
+    gate() is the AlertRuleEngine hook: it returns a reason to hold back
+    an inactivity, absence or missed check-in alert that the other
+    sensors contradict.
+    """
+
+    def __init__(self, motion_time_constant=60.0, keypad_time_constant=600.0, presence_max_age=30.0,
+                 gates=None):
+        self.motion_time_constant = motion_time_constant
+        self.keypad_time_constant = keypad_time_constant
+        self.presence_max_age = presence_max_age
+        self.gates = dict(DEFAULT_GATES if gates is None else gates)
+        self.lock = threading.Lock()
+        self.last_motion = None
+        self.last_key = None
+        self.presence_confidence = None
+        self.presence_time = None
+        self.gated = {}
+
+    # Event bus handlers
+
+    def on_accel(self, samples):
+        """ACCEL handler; takes one AccelSample or a batch of them"""
+        if not isinstance(samples, list):
+            samples = (samples,)
+        for sample in reversed(samples):
+            # Same test as the accelerometer thread's inactivity check: away from 1g of gravity
+            if is_moving(sample.magnitude):
+                if self.last_motion is None or sample.timestamp > self.last_motion:
+                    self.last_motion = sample.timestamp
+                break
+
+    def on_distance(self, reading):
+        """DISTANCE handler; readings without a confidence count as 1/0 from person_present"""
+        confidence = reading.confidence
+        if confidence is None:
+            confidence = 1.0 if reading.person_present else 0.0
+        with self.lock:
+            if self.presence_time is None or reading.timestamp >= self.presence_time:
+                self.presence_confidence, self.presence_time = confidence, reading.timestamp
+
+    def on_key(self, press):
+        """KEYPAD handler"""
+        if self.last_key is None or press.timestamp > self.last_key:
+            self.last_key = press.timestamp
+
+    # Evaluation
+
+    def state(self, now=None):
+        """FusedState as of now"""
+        if now is None:
+            now = time.time()
+        motion = 0.0 if self.last_motion is None else _decay(now - self.last_motion, self.motion_time_constant)
+        keypad = 0.0 if self.last_key is None else _decay(now - self.last_key, self.keypad_time_constant)
+        with self.lock:
+            confidence, seen = self.presence_confidence, self.presence_time
+        if confidence is None:
+            ultrasonic = None
+        else:
+            # Stale readings count for less: blend toward "don't know"
+            weight = _decay(now - seen - self.presence_max_age, self.presence_max_age)
+            ultrasonic = 0.5 + (confidence - 0.5) * weight
+
+        activity = 1 - (1 - motion) * (1 - keypad)
+        presence = 1 - (1 - (0.5 if ultrasonic is None else ultrasonic)) * (1 - keypad)
+
+        if activity >= 0.5:
+            state, state_confidence = ACTIVE, activity
+        elif ultrasonic is None and self.last_motion is None and self.last_key is None:
+            state, state_confidence = UNKNOWN, 0.0
+        elif presence >= 0.5:
+            state, state_confidence = PRESENT_STILL, presence * (1 - activity)
+        else:
+            state, state_confidence = ABSENT, (1 - presence) * (1 - activity)
+        return FusedState(now, state, state_confidence, activity, presence, motion, keypad)
+
+    def gate(self, event):
+        """AlertRuleEngine gate: a reason to hold event back, or None to let it through"""
+        gate = self.gates.get(event.kind)
+        if gate is None:
+            return None
+        score_name, limit = gate
+        fused = self.state(event.timestamp)
+        score = getattr(fused, score_name)
+        if score < limit:
+            return None
+        self.gated[event.kind] = self.gated.get(event.kind, 0) + 1
+        return f"{score_name} {score:.2f} (fused state {fused.state})"
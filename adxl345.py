@@ -1,7 +1,14 @@
 import smbus
 import time
 import configparser
-import math
+import struct
+from orientation import orientation
+from calibration import RunningStats, collect_stats
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 CALIB_FILE = 'accel_calib.txt'
@@ -50,16 +57,51 @@ class DataRate(object):
     R_50 = 0b1001
     R_25 = 0b1000
 
+# Output data rate in Hz -> BW_RATE code
+RATE_HZ = {25: DataRate.R_25, 50: DataRate.R_50, 100: DataRate.R_100, 200: DataRate.R_200,
+           400: DataRate.R_400, 800: DataRate.R_800, 1600: DataRate.R_1600, 3200: DataRate.R_3200}
+
+LOW_POWER = 0x10
+
+class PowerCtl(object):
+    LINK = 0x20
+    AUTO_SLEEP = 0x10
+    MEASURE = 0x08
+    SLEEP = 0x04
+
+# Sampling rate while asleep (POWER_CTL wakeup bits)
+WAKEUP_HZ = {8: 0b00, 4: 0b01, 2: 0b10, 1: 0b11}
+
+class Interrupt(object):
+    DATA_READY = 0x80
+    SINGLE_TAP = 0x40
+    DOUBLE_TAP = 0x20
+    ACTIVITY = 0x10
+    INACTIVITY = 0x08
+    FREE_FALL = 0x04
+    WATERMARK = 0x02
+    OVERRUN = 0x01
+
 class Range:
     G_2 = 0x00
     G_4 = 0x01
     G_8 = 0x02
     G_16 = 0x03
 
+class FifoMode(object):
+    BYPASS = 0b00
+    FIFO = 0b01
+    STREAM = 0b10
+    TRIGGER = 0b11
+
+FIFO_DEPTH = 32
+
 class ADXL345(object):
-    def __init__(self, i2c_port=1, address=0x53):
-        self.bus = smbus.SMBus(i2c_port)
+    def __init__(self, i2c_port=1, address=0x53, bus=None, calib_file=CALIB_FILE):
+        # bus: an already open (possibly shared) SMBus, see device_manager.SharedBus
+        self.bus = bus if bus is not None else smbus.SMBus(i2c_port)
         self.i2c_address = address
+        self.calib_file = calib_file
         self.scale_factor = 0.0039
 
         self.x = 0
@@ -74,9 +116,19 @@ class ADXL345(object):
         self.y_gain = 1
         self.z_gain = 1
 
-    def set_data_rate(self, data_rate=DataRate.R_100):
+        # OFSX/OFSY/OFSZ register values (15.6mg/LSB) and last raw reading
+        self.hw_offset = (0, 0, 0)
+        self.raw = (0, 0, 0)
+
+    def set_data_rate(self, data_rate=DataRate.R_100, low_power=False):
+        # LOW_POWER trades a little noise for lower current (12.5-400Hz only)
+        if low_power:
+            data_rate |= LOW_POWER
         self.bus.write_byte_data(self.i2c_address, Regis.BW_RATE, data_rate)
 
+    def set_data_rate_hz(self, rate_hz=100, low_power=False):
+        self.set_data_rate(RATE_HZ[rate_hz], low_power=low_power and rate_hz <= 400)
+
     def set_range(self, g_range=Range.G_16, full_res=True):
         if full_res:
             data = g_range | 0x08
@@ -89,6 +141,14 @@ class ADXL345(object):
         self.bus.write_byte_data(self.i2c_address, Regis.OFSX, 0x00)
         self.bus.write_byte_data(self.i2c_address, Regis.OFSY, 0x00)
         self.bus.write_byte_data(self.i2c_address, Regis.OFSZ, 0x00)
+        self.hw_offset = (0, 0, 0)
+
+    def set_hardware_offset(self, x, y, z):
+        # Signed 8-bit values added by the sensor itself to every sample
+        self.bus.write_byte_data(self.i2c_address, Regis.OFSX, x & 0xFF)
+        self.bus.write_byte_data(self.i2c_address, Regis.OFSY, y & 0xFF)
+        self.bus.write_byte_data(self.i2c_address, Regis.OFSZ, z & 0xFF)
+        self.hw_offset = (x, y, z)
 
     def measure_start(self):
         self.bus.write_byte_data(self.i2c_address, Regis.POWER_CTL, 0x08)
@@ -96,6 +156,40 @@ class ADXL345(object):
     def measure_stop(self):
         self.bus.write_byte_data(self.i2c_address, Regis.POWER_CTL, 0x00)
 
+    def set_power_mode(self, link=False, auto_sleep=False, wakeup_hz=8):
+        # AUTO_SLEEP needs LINK so that activity wakes the part from sleep
+        data = PowerCtl.MEASURE | WAKEUP_HZ[wakeup_hz]
+        if link or auto_sleep:
+            data |= PowerCtl.LINK
+        if auto_sleep:
+            data |= PowerCtl.AUTO_SLEEP
+        self.bus.write_byte_data(self.i2c_address, Regis.POWER_CTL, data)
+
+    def set_activity_detection(self, act_g=0.25, inact_g=0.1875, inact_seconds=30):
+        # 62.5mg/LSB thresholds, 1s/LSB inactivity time, AC-coupled on all axes
+        self.bus.write_byte_data(self.i2c_address, Regis.THRESH_ACT, min(int(act_g / 0.0625), 255))
+        self.bus.write_byte_data(self.i2c_address, Regis.THRESH_INACT, min(int(inact_g / 0.0625), 255))
+        self.bus.write_byte_data(self.i2c_address, Regis.TIME_INACT, min(int(inact_seconds), 255))
+        self.bus.write_byte_data(self.i2c_address, Regis.ACT_INACT_CTL, 0xFF)
+
+    def set_free_fall_detection(self, threshold_g=0.375, time_ms=100):
+        # 62.5mg/LSB threshold, 5ms/LSB time
+        self.bus.write_byte_data(self.i2c_address, Regis.THRESH_FF, min(int(threshold_g / 0.0625), 255))
+        self.bus.write_byte_data(self.i2c_address, Regis.TIME_FF, min(int(time_ms / 5), 255))
+
+    def enable_interrupts(self, mask):
+        self.bus.write_byte_data(self.i2c_address, Regis.INT_ENABLE, mask)
+
+    def get_interrupt_source(self):
+        # Reading INT_SOURCE clears the latched activity/inactivity/free-fall bits
+        return self.bus.read_byte_data(self.i2c_address, Regis.INT_SOURCE)
+
+    def read_activity_flags(self):
+        source = self.get_interrupt_source()
+        return (bool(source & Interrupt.ACTIVITY),
+                bool(source & Interrupt.INACTIVITY),
+                bool(source & Interrupt.FREE_FALL))
+
     def get_an_axis_raw(self, axis=Regis.DATAX0):
         byte_axis = self.bus.read_i2c_block_data(self.i2c_address, axis, 2)
         return self.convert_axis_data_raw(byte_axis[0], byte_axis[1])
@@ -141,7 +235,7 @@ class ADXL345(object):
         return tap
 
     def get_an_axis_adjust(self, axis=Regis.DATAX0):
-        byte_axis = self.bus.read_i2c_block_data(self.i2c_address, axis, 0)
+        byte_axis = self.bus.read_i2c_block_data(self.i2c_address, axis, 2)
         value = self.convert_axis_data_raw(byte_axis[0], byte_axis[1])
 
         if axis == Regis.DATAX0:
@@ -155,14 +249,57 @@ class ADXL345(object):
 
     def get_3_axis_adjusted(self):
         byte_3_axis = self.bus.read_i2c_block_data(self.i2c_address, Regis.DATAX0, 6)
-        self.x = (self.convert_axis_data_raw(byte_3_axis[0], byte_3_axis[1]) - self.x_offset)/self.x_gain
-        self.y = (self.convert_axis_data_raw(byte_3_axis[2], byte_3_axis[3]) - self.y_offset)/self.y_gain
-        self.z = (self.convert_axis_data_raw(byte_3_axis[4], byte_3_axis[5]) - self.z_offset)/self.z_gain
+        self.raw = struct.unpack('<hhh', bytes(byte_3_axis))
+        self.x = (self.raw[0] - self.x_offset)/self.x_gain
+        self.y = (self.raw[1] - self.y_offset)/self.y_gain
+        self.z = (self.raw[2] - self.z_offset)/self.z_gain
 
         return self.x, self.y, self.z
         
     def get_pitch(self):
-        return math.degrees(math.atan2(self.x, math.hypot(self.y, self.z)))
+        return orientation(self.x, self.y, self.z)[0]
+
+    def get_orientation(self):
+        # pitch, roll, magnitude of the last adjusted sample
+        return orientation(self.x, self.y, self.z)
+
+    def set_fifo_mode(self, mode=FifoMode.STREAM, samples=FIFO_DEPTH - 1):
+        self.bus.write_byte_data(self.i2c_address, Regis.FIFO_CTL, (mode << 6) | (samples & 0x1F))
+
+    def get_fifo_count(self):
+        return self.bus.read_byte_data(self.i2c_address, Regis.FIFO_STATUS) & 0x3F
+
+    def get_fifo_bytes(self):
+        # Each 6-byte read of DATAX0..DATAZ1 pops one entry from the FIFO
+        count = self.get_fifo_count()
+        data = bytearray()
+        for _ in range(count):
+            data += bytes(self.bus.read_i2c_block_data(self.i2c_address, Regis.DATAX0, 6))
+        return data
+
+    def get_fifo_raw(self):
+        # Drain the FIFO and return raw counts; an (N, 3) array when NumPy is available
+        data = self.get_fifo_bytes()
+        if np is not None:
+            return np.frombuffer(bytes(data), dtype='<i2').reshape(-1, 3)
+        return list(struct.iter_unpack('<hhh', data))
+
+    def get_fifo_adjusted(self):
+        # Drain the FIFO and return calibrated samples; an (N, 3) array when NumPy is available
+        raw = self.get_fifo_raw()
+        if np is not None:
+            offsets = np.array((self.x_offset, self.y_offset, self.z_offset), dtype=np.float64)
+            gains = np.array((self.x_gain, self.y_gain, self.z_gain), dtype=np.float64)
+            samples = (raw - offsets) / gains
+        else:
+            samples = [((x - self.x_offset)/self.x_gain,
+                        (y - self.y_offset)/self.y_gain,
+                        (z - self.z_offset)/self.z_gain)
+                       for x, y, z in raw]
+        if len(samples):
+            self.raw = tuple(int(v) for v in raw[-1])
+            self.x, self.y, self.z = (float(v) for v in samples[-1])
+        return samples
 
     def convert_axis_data_raw(self, lsb, msb):
         value = lsb | (msb << 8)
@@ -174,16 +311,18 @@ class ADXL345(object):
         return value
 
     def calibrate(self):
-        calib_axis = {'+z': Regis.DATAZ0, '-z': Regis.DATAZ0,
-                      '+y': Regis.DATAY0, '-y': Regis.DATAY0,
-                      '+x': Regis.DATAX0, '-x': Regis.DATAX0
+        # index of the axis in a raw (x, y, z) sample
+        calib_axis = {'+z': 2, '-z': 2,
+                      '+y': 1, '-y': 1,
+                      '+x': 0, '-x': 0
                       }
         axis_sequence = ['+z', '-z', '+y', '-y', '+x', '-x']
-        collected_value = []
         avg_value = []
 
         self.clear_offset()
         self.measure_stop()
+        self.set_data_rate(DataRate.R_100)
+        self.set_fifo_mode(FifoMode.STREAM)
         self.measure_start()
 
         print("Calibration with data rate=100Hz, Please follow step by step")
@@ -195,23 +334,19 @@ class ADXL345(object):
                 time.sleep(1)
                 print(axis, " will start in ", str(i))
 
-            del collected_value[:]
             print("Collecting data for ", axis)
-            for i in range(10):
-                value = self.get_an_axis_raw(axis=calib_axis[axis])
-                collected_value.append(value)
-                time.sleep(0.1)
-
-            avg_value.append(sum(collected_value)/len(collected_value))
+            # ~200 samples from FIFO bursts, averaged with running statistics
+            stats = collect_stats(self, seconds=2.0, stats=RunningStats(3))
+            avg_value.append(stats.mean[calib_axis[axis]])
 
-        self.z_offset = int(round((avg_value[0] + avg_value[1])*0.5, 0))
-        self.z_gain = int(round((avg_value[0] - avg_value[1])*0.5, 0))
+        self.z_offset = round((avg_value[0] + avg_value[1])*0.5, 2)
+        self.z_gain = round((avg_value[0] - avg_value[1])*0.5, 2)
 
-        self.y_offset = int(round((avg_value[2] + avg_value[3]) * 0.5, 0))
-        self.y_gain = int(round((avg_value[2] - avg_value[3]) * 0.5, 0))
+        self.y_offset = round((avg_value[2] + avg_value[3]) * 0.5, 2)
+        self.y_gain = round((avg_value[2] - avg_value[3]) * 0.5, 2)
 
-        self.x_offset = int(round((avg_value[4] + avg_value[5]) * 0.5, 0))
-        self.x_gain = int(round((avg_value[4] - avg_value[5]) * 0.5, 0))
+        self.x_offset = round((avg_value[4] + avg_value[5]) * 0.5, 2)
+        self.x_gain = round((avg_value[4] - avg_value[5]) * 0.5, 2)
         
         self.save_calib_value()
 
@@ -225,17 +360,29 @@ class ADXL345(object):
                           'y_gain': str(self.y_gain),
                           'z_gain': str(self.z_gain)
                           }
-        with open(CALIB_FILE, 'w') as configfile:
+        config['HARDWARE'] = {'x_register': str(self.hw_offset[0]),
+                              'y_register': str(self.hw_offset[1]),
+                              'z_register': str(self.hw_offset[2])
+                              }
+        with open(self.calib_file, 'w') as configfile:
             config.write(configfile)
 
     def load_calib_value(self):
         config = configparser.ConfigParser()
-        config.read(CALIB_FILE)
+        config.read(self.calib_file)
 
-        self.x_offset = int(config['OFFSET']['x_offset'])
-        self.y_offset = int(config['OFFSET']['y_offset'])
-        self.z_offset = int(config['OFFSET']['z_offset'])
+        self.x_offset = float(config['OFFSET']['x_offset'])
+        self.y_offset = float(config['OFFSET']['y_offset'])
+        self.z_offset = float(config['OFFSET']['z_offset'])
 
-        self.x_gain = int(config['GAIN']['x_gain'])
-        self.y_gain = int(config['GAIN']['y_gain'])
-        self.z_gain = int(config['GAIN']['z_gain'])
\ No newline at end of file
+        self.x_gain = float(config['GAIN']['x_gain'])
+        self.y_gain = float(config['GAIN']['y_gain'])
+        self.z_gain = float(config['GAIN']['z_gain'])
+
+        # Offsets applied in the sensor itself (files from older versions have none)
+        if config.has_section('HARDWARE'):
+            self.set_hardware_offset(int(config['HARDWARE']['x_register']),
+                                     int(config['HARDWARE']['y_register']),
+                                     int(config['HARDWARE']['z_register']))
+        else:
+            self.clear_offset()
\ No newline at end of file
@@ -0,0 +1,126 @@
+import heapq
+import itertools
+import threading
+import time
+
+from log_setup import get_logger
+
+log = get_logger('alerts')
+
+# Named patterns: list of (output level, seconds), repeated until the alert ends
+PATTERNS = {
+    'urgent': [(1, 0.1), (0, 0.1)],
+    'warning': [(1, 0.3), (0, 0.7)],
+    'inactive': [(1, 0.2), (0, 0.3), (1, 0.2), (0, 2.3)],
+    'normal': [(1, 0.05), (0, 4.95)],
+}
+
+# Higher priority patterns cannot be replaced by lower ones while playing
+PRIORITY = {'normal': 0, 'inactive': 1, 'warning': 2, 'urgent': 3}
+
+
+class PatternScheduler(object):
+    """Single timer thread that steps every pattern output"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []
+        self.counter = itertools.count()
+        self.thread = None
+
+    def schedule(self, when, output, generation):
+        with self.cond:
+            heapq.heappush(self.heap, (when, next(self.counter), output, generation))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='alert-patterns', daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    self.cond.wait(timeout)
+                when, _, output, generation = heapq.heappop(self.heap)
+            try:
+                output._step(generation, when)
+            except Exception as e:
+                log.exception("Alert pattern error: %s", e)
+
+
+SCHEDULER = PatternScheduler()
+
+
+class PatternOutput(object):
+    """Plays named on/off patterns on one output without blocking the caller"""
+
+    def __init__(self, write, scheduler=None):
+        self.write = write  # callable taking 0/1
+        self.scheduler = scheduler or SCHEDULER
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.pattern = None
+        self.end_time = None
+        self.step_index = 0
+        self.background = None  # pattern resumed when an alert ends
+
+    @property
+    def is_alerting(self):
+        return self.pattern is not None and self.pattern != self.background
+
+    def start_alert(self, duration=None, pattern='urgent'):
+        """Start a pattern for duration seconds (None = until stopped); returns False if outranked"""
+        with self.lock:
+            if self.is_alerting and PRIORITY[pattern] < PRIORITY[self.pattern]:
+                return False
+            self._play(pattern, duration)
+            return True
+
+    def stop_alert(self):
+        """Stop the current alert and fall back to the background pattern (if any)"""
+        with self.lock:
+            if self.background:
+                self._play(self.background, None)
+            else:
+                self._stop()
+
+    def set_background(self, pattern):
+        with self.lock:
+            alerting = self.is_alerting
+            self.background = pattern
+            if alerting:
+                return  # resumed once the alert ends
+            if pattern is None:
+                self._stop()
+            elif self.pattern != pattern:
+                self._play(pattern, None)
+
+    def _play(self, pattern, duration):
+        self.generation += 1
+        self.pattern = pattern
+        self.step_index = 0
+        now = time.monotonic()
+        self.end_time = now + duration if duration else None
+        self.scheduler.schedule(now, self, self.generation)
+
+    def _stop(self):
+        self.generation += 1
+        self.pattern = None
+        self.write(0)
+
+    def _step(self, generation, when):
+        with self.lock:
+            if generation != self.generation:
+                return  # superseded by a newer start/stop
+            if self.end_time is not None and when >= self.end_time:
+                if self.background and self.pattern != self.background:
+                    self._play(self.background, None)
+                else:
+                    self._stop()
+                return
+            steps = PATTERNS[self.pattern]
+            level, seconds = steps[self.step_index]
+            self.step_index = (self.step_index + 1) % len(steps)
+            self.write(level)
+            self.scheduler.schedule(when + seconds, self, generation)
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import namedtuple, deque
+from log_setup import get_logger
+
+log = get_logger('alerts')
+
+# Event kinds
+FALL = 'fall'
+INACTIVITY = 'inactivity'
+ABSENCE = 'absence'
+MISSED_CHECKIN = 'missed_checkin'
+SENSOR_OFFLINE = 'sensor_offline'
+
+# key groups repeated events that describe the same incident (e.g. one absence episode)
+AlertEvent = namedtuple('AlertEvent', ['kind', 'message', 'timestamp', 'key', 'data'])
+
+
+def make_event(kind, message, key=None, timestamp=None, **data):
+    return AlertEvent(kind, message, timestamp if timestamp is not None else time.time(), key, data)
+
+
+# Escalation tier: applies once `after` alerts of the same kind were sent within the rule's window
+Tier = namedtuple('Tier', ['after', 'channels', 'prefix'])
+
+# What the engine decided to send
+AlertAction = namedtuple('AlertAction', ['channel', 'message', 'event', 'tier'])
+
+
+class TokenBucket(object):
+    """burst tokens, refilled at one token every per_seconds/burst seconds"""
+
+    def __init__(self, burst, per_seconds):
+        self.capacity = burst
+        self.rate = burst / per_seconds
+        self.tokens = float(burst)
+        self.updated = None
+
+    def take(self, now):
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class AlertRule(object):
+    """Declarative alert policy for one event kind"""
+
+    def __init__(self, kind, channels=('telegram',), rate=(3, 3600), dedup_window=300,
+                 quiet_hours=False, tiers=(), escalation_window=3600, rate_per_key=False):
+        self.kind = kind
+        self.channels = tuple(channels)
+        self.rate = rate                  # (burst, per_seconds) token bucket, None for no rate limit
+        self.rate_per_key = rate_per_key  # one bucket per key instead of one for the kind
+        self.dedup_window = dedup_window  # same key within this many seconds is dropped
+        self.quiet_hours = quiet_hours    # suppressed while the engine's is_quiet() is true
+        self.tiers = sorted(tiers, key=lambda tier: tier.after)
+        self.escalation_window = escalation_window
+
+
+DEFAULT_RULES = [
+    # Falls are never rate limited; the 30s dedup only folds one incident's repeated candidates
+    AlertRule(FALL, channels=('telegram', 'local'), rate=None, dedup_window=30,
+              tiers=[Tier(3, ('telegram', 'local'), "REPEATED FALLS - ")], escalation_window=3600),
+    AlertRule(INACTIVITY, rate=(2, 3600), dedup_window=900, quiet_hours=True,
+              tiers=[Tier(3, ('telegram', 'local'), "STILL NO MOVEMENT - ")], escalation_window=3 * 3600),
+    AlertRule(ABSENCE, rate=(2, 3600), dedup_window=24 * 3600, quiet_hours=True),
+    AlertRule(MISSED_CHECKIN, rate=(3, 3600), dedup_window=600, quiet_hours=True,
+              tiers=[Tier(2, ('telegram', 'local'), "SECOND MISSED CHECK-IN - ")], escalation_window=12 * 3600),
+    # Each sensor (key) has its own limit, so one offline sensor cannot hide another
+    AlertRule(SENSOR_OFFLINE, rate=(1, 3600), dedup_window=3600, rate_per_key=True),
+]
+
+
+class _RuleState(object):
+    def __init__(self, rule):
+        self.rule = rule
+        self.buckets = {}
+        self.last_by_key = {}
+        self.sent = deque()  # send times inside the escalation window
+        self.suppressed_until = 0
+
+    def bucket(self, key):
+        """Token bucket for an event key; shared by all keys unless the rule limits per key
+
+        None when the rule has no rate limit.
+        """
+        if self.rule.rate is None:
+            return None
+        if not self.rule.rate_per_key:
+            key = None
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(*self.rule.rate)
+        return bucket
+
+
+class AlertRuleEngine(object):
+    """Evaluates alert events against the rules and dispatches the resulting actions"""
+
+    def __init__(self, rules=DEFAULT_RULES, is_quiet=None, gate=None):
+        self.rules = {rule.kind: rule for rule in rules}
+        self.state = {kind: _RuleState(rule) for kind, rule in self.rules.items()}
+        self.is_quiet = is_quiet
+        self.gate = gate  # gate(event) -> reason to hold the event back, or None
+        self.notifiers = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def add_notifier(self, channel, func):
+        """func(message, event) is called for each action on channel"""
+        self.notifiers[channel] = func
+
+    def suppress(self, kind, seconds, now=None):
+        """Drop events of kind for a while (e.g. inactivity right after a check-in)"""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            state = self.state[kind]
+            state.suppressed_until = max(state.suppressed_until, now + seconds)
+
+    def _count(self, kind, outcome):
+        key = (kind, outcome)
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+    def evaluate(self, event):
+        """Decide what to send for one event; returns a list of AlertAction"""
+        rule = self.rules.get(event.kind)
+        if rule is None:
+            return []
+        now = event.timestamp
+        with self.lock:
+            state = self.state[event.kind]
+            if now < state.suppressed_until or (rule.quiet_hours and self.is_quiet and self.is_quiet()):
+                self._count(event.kind, 'suppressed')
+                return []
+            reason = self.gate(event) if self.gate else None
+            if reason:
+                self._count(event.kind, 'gated')
+                log.debug("Holding back %s alert: %s", event.kind, reason)
+                return []
+
+            last = state.last_by_key.get(event.key)
+            if last is not None and now - last < rule.dedup_window:
+                self._count(event.kind, 'deduplicated')
+                return []
+            bucket = state.bucket(event.key)
+            if bucket is not None and not bucket.take(now):
+                self._count(event.kind, 'rate_limited')
+                return []
+            state.last_by_key[event.key] = now
+            if len(state.last_by_key) > 64:
+                # Forget keys whose dedup window has passed
+                state.last_by_key = {k: t for k, t in state.last_by_key.items() if now - t < rule.dedup_window}
+
+            while state.sent and now - state.sent[0] > rule.escalation_window:
+                state.sent.popleft()
+            state.sent.append(now)
+
+            channels, prefix, tier_index = rule.channels, "", 0
+            for index, tier in enumerate(rule.tiers, 1):
+                if len(state.sent) >= tier.after:
+                    channels, prefix, tier_index = tier.channels, tier.prefix, index
+            self._count(event.kind, 'sent')
+
+        return [AlertAction(channel, prefix + event.message, event, tier_index) for channel in channels]
+
+    def submit(self, event):
+        """Evaluate an event and call the notifiers; returns the actions taken"""
+        actions = self.evaluate(event)
+        for action in actions:
+            notifier = self.notifiers.get(action.channel)
+            if notifier is None:
+                continue
+            try:
+                notifier(action.message, action.event)
+            except Exception as e:
+                log.exception("Alert notifier %s failed: %s", action.channel, e)
+        return actions
@@ -0,0 +1,115 @@
+"""Run the benchmark suite and write machine-readable results
+
+    python -m benchmarks                         # all default benchmarks, JSON to stdout
+    python -m benchmarks pipeline lcd --quick    # a subset with shorter runs
+    python -m benchmarks -o new.json --compare old.json
+
+--compare prints every numeric result next to the baseline with the
+new/old ratio, so regressions between versions show up at a glance.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import platform
+import subprocess
+import sys
+
+# name -> (module, quick keyword arguments); pwm drives a real pin, so it only runs when named
+BENCHMARKS = {
+    'orientation': ('benchmarks.bench_orientation', {'seconds': 2}),
+    'conversion': ('benchmarks.bench_conversion', {'blocks': 200}),
+    'pipeline': ('benchmarks.bench_pipeline', {'samples': 2000}),
+    'logging': ('benchmarks.bench_logging', {'rows': 1000}),
+    'upload': ('benchmarks.bench_upload', {'count': 30}),
+    'lcd': ('benchmarks.bench_lcd', {'screens': 50}),
+    'devices': ('benchmarks.bench_devices', {'passes': 30}),
+    'i2c': ('benchmarks.bench_i2c', {'seconds': 1.0}),
+    'fall_latency': ('benchmarks.bench_fall_latency', {'trials': 1, 'confirm_seconds': 1.0}),
+    'fusion': ('benchmarks.bench_fusion', {}),
+    'fall_classifier': ('benchmarks.bench_fall_classifier', {'count': 140}),
+    'gateway': ('benchmarks.bench_gateway', {'devices': 10, 'readings': 500}),
+    'pwm': ('benchmarks.bench_pwm', {}),
+}
+DEFAULT = [name for name in BENCHMARKS if name != 'pwm']
+
+
+def environment():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        revision = ''
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        'revision': revision,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'numpy': numpy_version,
+    }
+
+
+def flatten(results, prefix=''):
+    values = {}
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(new, old):
+    new_values, old_values = flatten(new['results']), flatten(old['results'])
+    print(f"{'metric':60} {'old':>14} {'new':>14} {'new/old':>8}", file=sys.stderr)
+    for name, value in new_values.items():
+        if name not in old_values:
+            continue
+        base = old_values[name]
+        ratio = f'{value / base:8.2f}' if base else '       -'
+        print(f'{name:60} {base:14.4g} {value:14.4g} {ratio}', file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.split('\n')[0])
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='benchmarks to run: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--quick', action='store_true', help='shorter runs for a smoke check')
+    parser.add_argument('-o', '--output', help='write JSON here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON from an earlier run to compare against')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmark: ' + ', '.join(unknown))
+
+    report = {'environment': environment(), 'quick': args.quick, 'results': {}}
+    for name in args.names or DEFAULT:
+        module_name, quick_args = BENCHMARKS[name]
+        print(f'running {name}...', file=sys.stderr)
+        module = importlib.import_module(module_name)
+        try:
+            report['results'][name] = module.run(**(quick_args if args.quick else {}))
+        except Exception as e:
+            report['results'][name] = {'error': f'{type(e).__name__}: {e}'}
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Raw-to-g conversion cost: per-axis convert_axis_data_raw vs struct vs NumPy blocks
+
+Run from the repository root:  python -m benchmarks.bench_conversion
+"""
+import struct
+import time
+
+from benchmarks import fakes
+
+fakes.install()
+
+import adxl345  # noqa: E402
+from adxl345 import np  # noqa: E402
+
+
+def make_blocks(count, burst=32):
+    acc = fakes.fake_accelerometer()
+    return [bytes(acc.get_fifo_bytes()) for _ in range(count)], burst
+
+
+def run(blocks=2000):
+    """Per-sample cost in ns of each conversion path, plus a full read through the driver"""
+    data, burst = make_blocks(blocks)
+    samples = blocks * burst
+    acc = fakes.fake_accelerometer()
+    results = {'samples': samples, 'numpy': np is not None}
+
+    start = time.perf_counter_ns()
+    for block in data:
+        for i in range(0, len(block), 2):
+            acc.convert_axis_data_raw(block[i], block[i + 1])
+    results['convert_axis_data_raw_ns'] = (time.perf_counter_ns() - start) / samples
+
+    start = time.perf_counter_ns()
+    for block in data:
+        list(struct.iter_unpack('<hhh', block))
+    results['struct_ns'] = (time.perf_counter_ns() - start) / samples
+
+    if np is not None:
+        start = time.perf_counter_ns()
+        for block in data:
+            (np.frombuffer(block, dtype='<i2').reshape(-1, 3) - 0.0) / 256.0
+        results['numpy_block_ns'] = (time.perf_counter_ns() - start) / samples
+
+    # Through the driver, including the (fake) bus call per transaction
+    reads = samples // 4
+    start = time.perf_counter_ns()
+    for _ in range(reads):
+        acc.get_3_axis_adjusted()
+    results['get_3_axis_adjusted_ns'] = (time.perf_counter_ns() - start) / reads
+
+    start = time.perf_counter_ns()
+    for _ in range(reads // burst):
+        acc.get_fifo_adjusted()
+    results['get_fifo_adjusted_ns'] = (time.perf_counter_ns() - start) / (reads // burst * burst)
+
+    results['samples_per_s_single'] = 1e9 / results['get_3_axis_adjusted_ns']
+    results['samples_per_s_fifo'] = 1e9 / results['get_fifo_adjusted_ns']
+    return results
+
+
+if __name__ == '__main__':
+    for name, value in run().items():
+        print(f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}")
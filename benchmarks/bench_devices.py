@@ -0,0 +1,45 @@
+"""Polling cost as accelerometers are added to the device manager
+
+Devices alternate between two fake I2C ports; each poll drains every
+FIFO and merges the streams.
+
+Run from the repository root:  python -m benchmarks.bench_devices
+"""
+import os
+import tempfile
+import time
+
+from benchmarks import fakes
+
+fakes.install()
+
+from device_manager import DeviceManager  # noqa: E402
+
+ADDRESSES = [0x53, 0x1D]
+
+
+def measure(count, passes):
+    manager = DeviceManager(bus_factory=lambda port: fakes.FakeSMBus(port))
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(count):
+            manager.add(f'dev{i}', port=1 + i % 2, address=ADDRESSES[i // 2 % 2],
+                        calib_file=os.path.join(directory, f'calib{i}.txt'))
+        for device in manager.devices.values():
+            device.acc.x_gain = device.acc.y_gain = device.acc.z_gain = 256
+        now = time.time()
+        samples = 0
+        start = time.perf_counter_ns()
+        for i in range(passes):
+            samples += len(manager.poll(now + i * 0.16))
+        elapsed = time.perf_counter_ns() - start
+    return {'devices': count, 'pass_us': elapsed / passes / 1000, 'per_sample_ns': elapsed / samples}
+
+
+def run(passes=300):
+    return {str(count): measure(count, passes) for count in (1, 2, 4)}
+
+
+if __name__ == '__main__':
+    for result in run().values():
+        print(f"{result['devices']} devices: {result['pass_us']:.0f} us per pass, "
+              f"{result['per_sample_ns']:.0f} ns per sample")
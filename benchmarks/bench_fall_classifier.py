@@ -0,0 +1,154 @@
+"""Fall classifier accuracy and inference time on synthetic candidate windows
+
+Windows are generated in fall_capture layout around a candidate, sampled
+at 100Hz on both sides (the monitoring loop drains the ADXL345 FIFO into
+the capture ring, so it records the device data rate). Falls drop through a low-g phase into
+an impact and end lying, still or struggling. The non-falls are events
+the per-sample rules also nominate: sitting down hard, lying down on
+purpose, a stumble that is caught, walking, and a resting sensor that
+reads low through calibration drift.
+
+A model is trained on one seed and evaluated on another. It is compared
+with the rules alone, confirming as the monitoring loop does without a
+model: the criteria must still hold after the confirmation time.
+
+Run from the repository root:  python -m benchmarks.bench_fall_classifier
+"""
+import math
+
+import numpy as np
+
+from fall_classifier import FEATURES, FallClassifier, window_features, train, evaluate, time_inference
+from fall_detection import FallDetector
+from orientation import orientation_batch
+
+CONFIRM_SECONDS = 5.0
+PRE_RATE = 100
+POST_RATE = 100
+
+LYING = ((1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0))
+
+
+def _offsets(pre=2.0, post=CONFIRM_SECONDS):
+    return np.concatenate((np.arange(-pre, 0, 1 / PRE_RATE), np.arange(0, post + 1e-9, 1 / POST_RATE)))
+
+
+def _rotate(start, end, fraction):
+    """Unit vector between start and end (fraction 0..1), straight-line then normalized"""
+    vector = np.outer(1 - fraction, start) + np.outer(fraction, end)
+    return vector / np.linalg.norm(vector, axis=1, keepdims=True)
+
+
+def _window(rng, kind):
+    t = _offsets()
+    upright = np.array((rng.normal(0, 0.05), rng.normal(0, 0.05), 1.0))
+    end = upright
+    gravity = np.tile(upright / np.linalg.norm(upright), (len(t), 1))
+    scale = np.ones(len(t))
+    noise = 0.02
+
+    if kind in ('fall', 'fall_struggle'):
+        end = np.array(LYING[rng.integers(len(LYING))], dtype=float) + rng.normal(0, 0.1, 3)
+        dip = rng.uniform(0.25, 0.5)
+        scale[(t >= -0.4) & (t < 0)] = rng.uniform(0.1, 0.45)
+        scale[(t >= 0) & (t < dip)] = rng.uniform(1.8, 4.0)
+        turning = (t >= -0.4) & (t < dip)
+        gravity[turning] = _rotate(upright, end, (t[turning] + 0.4) / (dip + 0.4))
+        gravity[t >= dip] = end / np.linalg.norm(end)
+        if kind == 'fall_struggle':
+            scale[t >= 1.5] += 0.15 * np.sin(9 * t[t >= 1.5]) * rng.uniform(0.5, 1.5)
+    elif kind == 'sit_hard':
+        end = upright + np.array((rng.uniform(0.2, 0.5), 0, 0))
+        scale[(t >= 0) & (t < 0.15)] = rng.uniform(1.4, 2.0)
+        scale[(t >= -0.3) & (t < 0)] = rng.uniform(0.6, 0.8)
+        gravity[t >= 0] = end / np.linalg.norm(end)
+    elif kind == 'lie_down':
+        end = np.array(LYING[rng.integers(len(LYING))], dtype=float)
+        turning = (t >= 0) & (t < 3)
+        gravity[turning] = _rotate(upright, end, t[turning] / 3)
+        gravity[t >= 3] = end
+    elif kind == 'stumble':
+        scale[(t >= 0) & (t < 0.1)] = rng.uniform(1.5, 2.5)
+        scale[(t >= -0.2) & (t < 0)] = rng.uniform(0.5, 0.8)
+    elif kind == 'walking':
+        scale += 0.3 * np.sin(2 * math.pi * rng.uniform(1.6, 2.2) * t)
+        noise = 0.05
+    elif kind == 'drift':
+        scale[:] = rng.uniform(0.3, 0.49)
+        noise = 0.005
+
+    xyz = gravity * scale[:, None] + rng.normal(0, noise, (len(t), 3))
+    pitch, roll, magnitude = orientation_batch(xyz)
+    values = np.column_stack((xyz, pitch, roll, magnitude))
+    return t, values
+
+
+FALLS = ('fall', 'fall_struggle')
+NON_FALLS = ('sit_hard', 'lie_down', 'stumble', 'walking', 'drift')
+
+
+def dataset(count, seed):
+    rng = np.random.default_rng(seed)
+    windows, labels, kinds = [], [], []
+    for i in range(count):
+        kind = (FALLS + NON_FALLS)[i % (len(FALLS) + len(NON_FALLS))]
+        windows.append(_window(rng, kind))
+        labels.append(kind in FALLS)
+        kinds.append(kind)
+    return windows, np.array(labels), kinds
+
+
+def rules_confirm(offsets, values):
+    """The monitoring loop without a model: the criteria must still hold after CONFIRM_SECONDS"""
+    detector = FallDetector()
+    start = None
+    for t, (_, _, _, pitch, roll, magnitude) in zip(offsets, values):
+        detected, _ = detector.check(magnitude, pitch, roll)
+        if detected and start is None:
+            start = t
+        elif start is not None and not detected:
+            start = None
+        elif start is not None and t - start >= CONFIRM_SECONDS - 0.01:
+            return True
+    return False
+
+
+def _rates(predicted, labels, kinds):
+    predicted = np.asarray(predicted, dtype=bool)
+    by_kind = {kind: float(np.mean(predicted[[k == kind for k in kinds]])) for kind in sorted(set(kinds))}
+    return {
+        'recall': float(predicted[labels].mean()),
+        'false_positive_rate': float(predicted[~labels].mean()),
+        'predicted_fall_by_kind': by_kind,
+    }
+
+
+def run(count=700):
+    train_windows, train_labels, _ = dataset(count, seed=1)
+    test_windows, test_labels, test_kinds = dataset(count, seed=2)
+    train_matrix = np.array([window_features(t, v) for t, v in train_windows])
+    test_matrix = np.array([window_features(t, v) for t, v in test_windows])
+
+    model = FallClassifier.from_dict(train(train_matrix, train_labels).to_dict())
+    model_eval = evaluate(model, test_matrix, test_labels)
+    predicted = model.probabilities(test_matrix) >= model.threshold
+    rules = [rules_confirm(t, v) for t, v in test_windows]
+
+    offsets, values = test_windows[0]
+    return {
+        'windows': len(test_windows),
+        'samples_per_window': len(offsets),
+        'model': dict(_rates(predicted, test_labels, test_kinds), precision=model_eval['precision']),
+        'rules': _rates(rules, test_labels, test_kinds),
+        'inference_us': time_inference(model, offsets, values) * 1e6,
+        'weights': dict(zip(FEATURES, model.weights.round(2).tolist())),
+    }
+
+
+if __name__ == '__main__':
+    result = run()
+    for name in ('rules', 'model'):
+        r = result[name]
+        print(f"{name}: recall {r['recall']:.0%}, false positives {r['false_positive_rate']:.0%}  "
+              + ', '.join(f"{kind} {rate:.0%}" for kind, rate in r['predicted_fall_by_kind'].items()))
+    print(f"inference {result['inference_us']:.0f} us per {result['samples_per_window']}-sample window")
@@ -0,0 +1,105 @@
+"""End-to-end fall alert latency with a simulated accelerometer
+
+A fake ADXL345 switches from upright to a sustained low-g signal; the
+loop mirrors main.accelerometer_monitoring_thread (poll, orientation,
+fall criteria, confirmation window) and publishes to the event bus, where
+the alert rule engine calls a notifier. Latency is measured from the
+switch to the first detection and to the notifier call.
+
+Run from the repository root:  python -m benchmarks.bench_fall_latency
+"""
+import statistics
+import threading
+import time
+
+from benchmarks import fakes
+
+fakes.install()
+
+from alert_rules import AlertRuleEngine, make_event, FALL  # noqa: E402
+from event_bus import EventBus, ALERT  # noqa: E402
+from fall_detection import FallDetector  # noqa: E402
+from orientation import orientation  # noqa: E402
+
+# About 0.2g: well inside the free-fall criterion
+FALLING = (0, 10, 50)
+
+
+def _monitor(acc, detector, bus, confirm_seconds, poll_interval, times, stop):
+    potential_fall_start = None
+    while not stop.is_set():
+        x, y, z = acc.get_3_axis_adjusted()
+        pitch, roll, magnitude = orientation(x, y, z)
+        fall_detected, fall_reason = detector.check(magnitude, pitch, roll)
+        now = time.perf_counter()
+        if fall_detected:
+            if potential_fall_start is None:
+                potential_fall_start = now
+                times.setdefault('detected', now)
+            elif now - potential_fall_start >= confirm_seconds:
+                bus.publish(ALERT, make_event(FALL, fall_reason))
+                potential_fall_start = None
+        else:
+            potential_fall_start = None
+        stop.wait(poll_interval)
+
+
+def trial(confirm_seconds, poll_interval):
+    state = {'falling': False}
+    acc = fakes.fake_accelerometer(lambda t: FALLING if state['falling'] else fakes.upright(t))
+    times = {}
+    alerted = threading.Event()
+
+    def notify(message, event):
+        times.setdefault('alerted', time.perf_counter())
+        alerted.set()
+
+    engine = AlertRuleEngine()
+    engine.add_notifier('telegram', notify)
+    bus = EventBus()
+    bus.subscribe(ALERT, engine.submit, name='alert_engine')
+    stop = threading.Event()
+    thread = threading.Thread(target=_monitor, daemon=True,
+                              args=(acc, FallDetector(), bus, confirm_seconds, poll_interval, times, stop))
+    thread.start()
+    time.sleep(0.5)  # settle on the upright signal first
+
+    times['fall'] = time.perf_counter()
+    state['falling'] = True
+    alerted.wait(confirm_seconds + 5)
+    stop.set()
+    thread.join()
+    bus.close()
+
+    if 'alerted' not in times:
+        return None
+    return times['detected'] - times['fall'], times['alerted'] - times['fall']
+
+
+def run(trials=3, confirm_seconds=5.0, poll_interval=0.1):
+    results = [trial(confirm_seconds, poll_interval) for _ in range(trials)]
+    completed = [result for result in results if result is not None]
+    if not completed:
+        return {'trials': trials, 'missed': trials}
+    detected = [result[0] for result in completed]
+    alerted = [result[1] for result in completed]
+    return {
+        'trials': trials,
+        'missed': trials - len(completed),
+        'confirm_seconds': confirm_seconds,
+        'poll_interval': poll_interval,
+        'detect_ms': statistics.mean(detected) * 1000,
+        'alert_ms': statistics.mean(alerted) * 1000,
+        'alert_max_ms': max(alerted) * 1000,
+        # What the pipeline adds on top of the deliberate confirmation window
+        'overhead_ms': (statistics.mean(alerted) - confirm_seconds) * 1000,
+    }
+
+
+if __name__ == '__main__':
+    result = run()
+    if 'detect_ms' not in result:
+        print(f"no alert in {result['trials']} trials")
+    else:
+        print(f"detected after {result['detect_ms']:.0f} ms, alerted after {result['alert_ms']:.0f} ms "
+              f"(confirmation {result['confirm_seconds']:.1f} s, overhead {result['overhead_ms']:.0f} ms)")
@@ -0,0 +1,156 @@
+"""Edge gateway throughput, deduplication and upstream request count
+
+Many simulated devices publish signed sensor frames (and a few events)
+through GatewayClient. In-process they go through LocalBroker, with a
+share of batches delivered twice as a reconnecting client would resend
+them; over loopback TCP each device has its own connection to a
+GatewayServer. The gateway flushes before the clients close, so every
+client should end with nothing left unacknowledged. A
+stub upstream counts the requests the gateway makes, against one HTTP
+request per reading and per message when devices call the services
+themselves.
+
+Run from the repository root:  python -m benchmarks.bench_gateway
+"""
+import random
+import threading
+import time
+
+from gateway import Gateway, GatewayServer, GatewayClient, LocalBroker, TcpTransport
+from upstream import UpstreamConfig
+
+SECRET = 'bench-secret'
+
+
+class CountingUpstream(object):
+    def __init__(self):
+        self.config = UpstreamConfig(thingspeak_channel='1', thingspeak_key='KEY')
+        self.requests = 0
+        self.readings = 0
+        self.events = 0
+
+    def send_telegram(self, text):
+        self.requests += 1
+        self.events += text.count('\n') + 1
+        return True
+
+    def bulk_update_thingspeak(self, channel, api_key, updates):
+        self.requests += 1
+        self.readings += len(updates)
+        return True
+
+
+class DuplicatingBroker(LocalBroker):
+    """LocalBroker that delivers some messages twice"""
+
+    def __init__(self, duplicate_fraction, seed=1):
+        super().__init__()
+        self.duplicate_fraction = duplicate_fraction
+        self.rng = random.Random(seed)
+        self.duplicated = 0
+
+    def deliver(self, data, reply):
+        super().deliver(data, reply)
+        if self.rng.random() < self.duplicate_fraction:
+            self.duplicated += 1
+            super().deliver(data, reply)
+
+
+def _publish(client, readings, events_every):
+    for i in range(readings):
+        client.publish_sensor(time.time(), 21.5, 45.0, i, 0.01, 0.02, 0.98, 0.98, 5, 120.0)
+        if events_every and i % events_every == 0:
+            client.publish_event('inactivity', f'No movement on device {client.device_id}')
+
+
+def _drive(gateway, clients, readings, events_every):
+    threads = [threading.Thread(target=_publish, args=(client, readings, events_every)) for client in clients]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    publish_seconds = time.perf_counter() - start
+    for client in clients:
+        client.flush()
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and any(client.backlog for client in clients):
+        time.sleep(0.01)
+    # Flush the gateway until every client has heard that all it sent was forwarded
+    while True:
+        gateway.flush()
+        if time.monotonic() > deadline or not any(client.backlog_bytes for client in clients):
+            break
+        time.sleep(0.05)
+    for client in clients:
+        client.close(30)
+    unacked = sum(1 for client in clients if client.backlog_bytes)
+    return publish_seconds, time.perf_counter() - start, unacked
+
+
+def run_local(devices=40, readings=2500, events_every=500, duplicate_fraction=0.05):
+    upstream = CountingUpstream()
+    # Everything is held until the final flush, so the pending limit must cover the whole run
+    gateway = Gateway(upstream, secret=SECRET, flush_interval=3600, max_pending=10 ** 7)
+    broker = DuplicatingBroker(duplicate_fraction)
+    broker.subscribe(gateway.submit)
+    clients = [GatewayClient(device, broker.connect(), SECRET) for device in range(1, devices + 1)]
+    publish_seconds, total_seconds, unacked = _drive(gateway, clients, readings, events_every)
+    messages = devices * (readings + (readings // events_every if events_every else 0))
+    return {
+        'devices': devices,
+        'messages': messages,
+        'publish_per_s': messages / publish_seconds,
+        'delivered_per_s': messages / total_seconds,
+        'batches_duplicated': broker.duplicated,
+        'readings_forwarded': upstream.readings,
+        'events_forwarded': upstream.events,
+        'lost_or_duplicated': messages - upstream.readings - upstream.events,
+        'clients_unacked': unacked,
+        'upstream_requests': upstream.requests,
+        'direct_requests': messages,
+    }
+
+
+def run_tcp(devices=20, readings=5000):
+    upstream = CountingUpstream()
+    gateway = Gateway(upstream, secret=SECRET, flush_interval=3600, max_pending=10 ** 7)
+    server = GatewayServer(gateway, ('127.0.0.1', 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        clients = [GatewayClient(device, TcpTransport(server.server_address), SECRET)
+                   for device in range(1, devices + 1)]
+        publish_seconds, total_seconds, unacked = _drive(gateway, clients, readings, 0)
+        received = upstream.readings
+    finally:
+        server.shutdown()
+        server.server_close()
+    messages = devices * readings
+    return {
+        'devices': devices,
+        'messages': messages,
+        'received': received,
+        'clients_unacked': unacked,
+        'publish_per_s': messages / publish_seconds,
+        'delivered_per_s': messages / total_seconds,
+    }
+
+
+def run(devices=40, readings=2500):
+    return {
+        'local': run_local(devices, readings),
+        'tcp': run_tcp(devices // 2, readings * 2),
+    }
+
+
+if __name__ == '__main__':
+    result = run()
+    local, tcp = result['local'], result['tcp']
+    print(f"local broker: {local['devices']} devices, {local['publish_per_s']:.0f} msg/s published, "
+          f"{local['delivered_per_s']:.0f} msg/s delivered, {local['batches_duplicated']} batches resent, "
+          f"{local['lost_or_duplicated']} lost or duplicated, {local['clients_unacked']} clients left unacked")
+    print(f"  upstream requests: {local['upstream_requests']} through the gateway vs "
+          f"{local['direct_requests']} direct")
+    print(f"tcp: {tcp['devices']} devices, {tcp['received']}/{tcp['messages']} received, "
+          f"{tcp['publish_per_s']:.0f} msg/s published, {tcp['delivered_per_s']:.0f} msg/s delivered, "
+          f"{tcp['clients_unacked']} clients left unacked")
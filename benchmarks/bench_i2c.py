@@ -0,0 +1,93 @@
+"""Accelerometer read delays while the LCD refreshes on the same I2C bus
+
+A sensor thread reads 6 bytes at 100Hz while another thread redraws the
+16x2 LCD nonstop. Transfers sleep for their real 100kHz duration. Three
+ways of sharing the bus are compared:
+
+    screen_lock   one lock held for a whole screen refresh
+    arbiter       i2c_arbiter, one acquisition per transaction
+    arbiter_batch i2c_arbiter, LCD refreshes inside batch()
+
+Run from the repository root:  python -m benchmarks.bench_i2c
+"""
+import statistics
+import threading
+import time
+
+from benchmarks import fakes
+from i2c_arbiter import I2CArbiter, SENSOR, DISPLAY
+
+SCREEN = ("T:22.0C H:45.0%", "1.Eaten 2.Walked")
+
+
+def _render(lcd):
+    lcd.lcd_clear()
+    lcd.lcd_display_string(SCREEN[0], 1)
+    lcd.lcd_display_string(SCREEN[1], 2)
+
+
+def measure(mode, seconds):
+    bus = fakes.FakeSMBus(real_time=True)
+    arbiter = I2CArbiter(bus)
+    screen_lock = threading.Lock()
+    if mode == 'screen_lock':
+        sensor_bus, display_bus = bus, bus
+    else:
+        sensor_bus, display_bus = arbiter.client(SENSOR), arbiter.client(DISPLAY)
+    lcd = fakes.FakeLCD(display_bus, sleep=True)
+    stop = threading.Event()
+    delays = []
+    screens = [0]
+
+    def sensor():
+        while not stop.is_set():
+            start = time.perf_counter()
+            if mode == 'screen_lock':
+                with screen_lock:
+                    sensor_bus.read_i2c_block_data(0x53, fakes.DATAX0, 6)
+            else:
+                sensor_bus.read_i2c_block_data(0x53, fakes.DATAX0, 6)
+            # Time beyond the transfer itself is time spent waiting for the bus
+            delays.append(time.perf_counter() - start - 8 * 9 * fakes.I2C_BIT_SECONDS)
+            stop.wait(0.01)
+
+    def display():
+        while not stop.is_set():
+            if mode == 'screen_lock':
+                with screen_lock:
+                    _render(lcd)
+            elif mode == 'arbiter_batch':
+                with display_bus.batch():
+                    _render(lcd)
+            else:
+                _render(lcd)
+            screens[0] += 1
+
+    threads = [threading.Thread(target=sensor), threading.Thread(target=display)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    delays.sort()
+    return {
+        'reads': len(delays),
+        'screens_per_s': screens[0] / seconds,
+        'read_delay_mean_ms': statistics.mean(delays) * 1000,
+        'read_delay_p99_ms': delays[int(len(delays) * 0.99) - 1] * 1000,
+        'read_delay_max_ms': delays[-1] * 1000,
+        'bus': arbiter.stats() if mode != 'screen_lock' else None,
+    }
+
+
+def run(seconds=3.0):
+    return {mode: measure(mode, seconds) for mode in ('screen_lock', 'arbiter', 'arbiter_batch')}
+
+
+if __name__ == '__main__':
+    for mode, result in run().items():
+        print(f"{mode}: sensor delay mean {result['read_delay_mean_ms']:.2f} ms, "
+              f"p99 {result['read_delay_p99_ms']:.2f} ms, max {result['read_delay_max_ms']:.2f} ms, "
+              f"{result['screens_per_s']:.1f} screens/s")
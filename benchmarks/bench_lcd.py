@@ -0,0 +1,61 @@
+"""Cost of rendering one 16x2 screen through the I2C LCD driver
+
+I2C_LCD_driver is not part of this repository, so fakes.FakeLCD replays
+its byte-by-byte nibble protocol on a fake bus. Reported: Python time per
+screen, bus writes, the wall time the real driver would take (its fixed
+delays plus the transfers at 100kHz), and how often a screen has to
+acquire the I2C arbiter with and without main.py's batched refresh.
+
+Run from the repository root:  python -m benchmarks.bench_lcd
+"""
+import time
+from contextlib import nullcontext
+
+from benchmarks import fakes
+from i2c_arbiter import I2CArbiter, DISPLAY
+
+SCREEN = ("T:22.0C H:45.0%", "1.Eaten 2.Walked")
+
+
+def render(lcd, screen=SCREEN, client=None):
+    """One screen refresh; with a client, as main.show_screen batches it"""
+    with client.batch() if client else nullcontext():
+        lcd.lcd_clear()
+        lcd.lcd_display_string(screen[0], 1)
+        lcd.lcd_display_string(screen[1], 2)
+
+
+def acquisitions_per_screen(batched, screens=100):
+    arbiter = I2CArbiter(fakes.FakeSMBus())
+    client = arbiter.client(DISPLAY)
+    lcd = fakes.FakeLCD(client)
+    for _ in range(screens):
+        render(lcd, client=client if batched else None)
+    return arbiter.stats()['priorities']['display']['acquisitions'] / screens
+
+
+def run(screens=500):
+    bus = fakes.FakeSMBus()
+    lcd = fakes.FakeLCD(bus)
+    start = time.perf_counter()
+    for _ in range(screens):
+        render(lcd)
+    python_seconds = (time.perf_counter() - start) / screens
+
+    device_seconds = (lcd.delay_seconds + bus.bus_seconds()) / screens
+    return {
+        'screens': screens,
+        'python_us_per_screen': python_seconds * 1e6,
+        'bus_writes_per_screen': bus.transactions / screens,
+        'driver_ms_per_screen': device_seconds * 1000,
+        'arbiter_acquisitions_per_screen': acquisitions_per_screen(False),
+        'batched_acquisitions_per_screen': acquisitions_per_screen(True),
+    }
+
+
+if __name__ == '__main__':
+    result = run()
+    print(f"{result['bus_writes_per_screen']:.0f} bus writes, {result['python_us_per_screen']:.0f} us Python, "
+          f"{result['driver_ms_per_screen']:.1f} ms on the device")
+    print(f"arbiter acquisitions per screen: {result['arbiter_acquisitions_per_screen']:.0f} unbatched, "
+          f"{result['batched_acquisitions_per_screen']:.0f} batched")
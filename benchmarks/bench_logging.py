@@ -0,0 +1,77 @@
+"""Rows per second for the monitoring log: CSV as main.py writes it vs a binary record file
+
+Run from the repository root:  python -m benchmarks.bench_logging
+"""
+import csv
+import os
+import random
+import struct
+import tempfile
+import time
+
+HEADER = ['Timestamp', 'Temperature', 'Humidity', 'User_Status', 'User_Feeling',
+          'Steps', 'X_Axis', 'Y_Axis', 'Z_Axis', 'Magnitude', 'Posture', 'Distance_cm', 'Person_Present']
+
+POSTURES = ["Standing or Walking", "Sitting", "Lying Down"]
+
+# time, temperature, humidity, status, feeling, steps, x, y, z, magnitude, posture code, distance, present
+RECORD = struct.Struct('<dffBBIffffBf?')
+
+
+def make_rows(count):
+    rows = []
+    now = time.time()
+    for i in range(count):
+        x, y, z = random.uniform(-1, 1), random.uniform(-1, 1), random.uniform(0, 1)
+        rows.append((now + i, 22.0, 45.0, random.choice(('eaten', 'walked')), random.randint(1, 9),
+                     i, x, y, z, (x*x + y*y + z*z) ** 0.5, random.choice(POSTURES),
+                     random.uniform(20, 300), random.random() > 0.5))
+    return rows
+
+
+def csv_reopen(path, rows):
+    # write_data_to_csv: existence check, open, write one row, close
+    for row in rows:
+        file_exists = os.path.isfile(path)
+        with open(path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if not file_exists:
+                writer.writerow(HEADER)
+            writer.writerow(row)
+
+
+def csv_open(path, rows):
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for row in rows:
+            writer.writerow(row)
+
+
+def binary(path, rows):
+    statuses = {'eaten': 1, 'walked': 2}
+    postures = {name: code for code, name in enumerate(POSTURES)}
+    pack = RECORD.pack
+    with open(path, 'ab') as f:
+        for row in rows:
+            f.write(pack(row[0], row[1], row[2], statuses[row[3]], row[4], row[5], row[6], row[7],
+                         row[8], row[9], postures[row[10]], row[11], row[12]))
+
+
+def run(rows=5000):
+    data = make_rows(rows)
+    results = {'rows': rows}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, writer in (('csv_reopen', csv_reopen), ('csv_open', csv_open), ('binary', binary)):
+            path = os.path.join(directory, name)
+            start = time.perf_counter()
+            writer(path, data)
+            elapsed = time.perf_counter() - start
+            results[name] = {'rows_per_s': rows / elapsed, 'bytes_per_row': os.path.getsize(path) / rows}
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        if isinstance(result, dict):
+            print(f"{name}: {result['rows_per_s']:.0f} rows/s, {result['bytes_per_row']:.1f} bytes/row")
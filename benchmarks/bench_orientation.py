@@ -0,0 +1,66 @@
+"""Per-sample cost of the pitch/roll/magnitude computation
+
+Run from the repository root:  python -m benchmarks.bench_orientation
+"""
+import math
+import random
+import time
+
+from orientation import orientation, orientation_batch, np
+
+# (rate in Hz, samples drained per FIFO burst)
+RATES = [(100, 10), (800, 32)]
+
+
+def legacy_orientation(x, y, z):
+    # What the monitoring thread used to do per sample: posture and
+    # handle_fall_detection each computed pitch/roll, plus get_magnitude
+    for _ in range(2):
+        pitch = math.degrees(math.atan2(x, math.sqrt(y*y + z*z)))
+        roll = math.degrees(math.atan2(y, math.sqrt(x*x + z*z)))
+    magnitude = math.sqrt(x*x + y*y + z*z)
+    return pitch, roll, magnitude
+
+
+def make_samples(count):
+    return [(random.uniform(-2, 2), random.uniform(-2, 2), random.uniform(-2, 2)) for _ in range(count)]
+
+
+def time_scalar(func, samples):
+    start = time.perf_counter_ns()
+    for x, y, z in samples:
+        func(x, y, z)
+    return (time.perf_counter_ns() - start) / len(samples)
+
+
+def time_batch(samples, burst):
+    blocks = [samples[i:i + burst] for i in range(0, len(samples) - burst + 1, burst)]
+    if np is not None:
+        blocks = [np.array(block) for block in blocks]
+    start = time.perf_counter_ns()
+    for block in blocks:
+        orientation_batch(block)
+    return (time.perf_counter_ns() - start) / (len(blocks) * burst)
+
+
+def run(seconds=10):
+    """Returns per-sample cost in ns for each rate and code path"""
+    results = {}
+    for rate, burst in RATES:
+        samples = make_samples(rate * seconds)
+        results[f'{rate}hz'] = {
+            'legacy_ns': time_scalar(legacy_orientation, samples),
+            'scalar_ns': time_scalar(orientation, samples),
+            'batch_ns': time_batch(samples, burst),
+            'burst': burst,
+        }
+    return results
+
+
+if __name__ == '__main__':
+    print(f"NumPy available: {np is not None}")
+    for name, result in run().items():
+        print(f"{name}: legacy {result['legacy_ns']:.0f} ns/sample, "
+              f"scalar {result['scalar_ns']:.0f} ns/sample, "
+              f"batch({result['burst']}) {result['batch_ns']:.0f} ns/sample, "
+              f"CPU at rate {result['batch_ns'] * int(name[:-2]) / 1e7:.4f}%")
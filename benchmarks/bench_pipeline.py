@@ -0,0 +1,88 @@
+"""Samples per second through the accelerometer detection pipeline
+
+Read -> orientation -> posture -> fall criteria -> event bus, the same
+stages as main.accelerometer_monitoring_thread, once per sample and once
+per drained FIFO block.
+
+Run from the repository root:  python -m benchmarks.bench_pipeline
+"""
+import time
+
+from benchmarks import fakes
+
+fakes.install()
+
+from event_bus import EventBus, ACCEL, AccelSample  # noqa: E402
+from fall_detection import FallDetector  # noqa: E402
+from orientation import orientation, orientation_batch  # noqa: E402
+from posture import PostureTracker  # noqa: E402
+
+
+def _consumer(batch):
+    pass
+
+
+def _as_list(values):
+    # Per-element work is faster on Python floats than on NumPy scalars
+    return values.tolist() if hasattr(values, 'tolist') else values
+
+
+def per_sample(samples):
+    acc = fakes.fake_accelerometer()
+    tracker, detector, bus = PostureTracker(), FallDetector(), EventBus()
+    bus.subscribe(ACCEL, _consumer, name='sink', maxsize=100000, batch_size=32)
+    now = time.time()
+    start = time.perf_counter_ns()
+    for i in range(samples):
+        x, y, z = acc.get_3_axis_adjusted()
+        pitch, roll, magnitude = orientation(x, y, z)
+        t = now + i * 0.01
+        tracker.update(pitch, roll, t)
+        detector.check(magnitude, pitch, roll)
+        bus.publish(ACCEL, AccelSample(t, x, y, z, pitch, roll, magnitude))
+    elapsed = time.perf_counter_ns() - start
+    bus.close()
+    return elapsed
+
+
+def per_block(samples, burst=32):
+    acc = fakes.fake_accelerometer()
+    tracker, detector, bus = PostureTracker(), FallDetector(), EventBus()
+    bus.subscribe(ACCEL, _consumer, name='sink', maxsize=100000, batch_size=32)
+    now = time.time()
+    done = 0
+    start = time.perf_counter_ns()
+    while done < samples:
+        block = acc.get_fifo_adjusted()
+        pitches, rolls, magnitudes = (_as_list(values) for values in orientation_batch(block))
+        block = _as_list(block)
+        messages = []
+        for i in range(len(block)):
+            t = now + (done + i) * 0.01
+            tracker.update(pitches[i], rolls[i], t)
+            detector.check(magnitudes[i], pitches[i], rolls[i])
+            x, y, z = block[i]
+            messages.append(AccelSample(t, x, y, z, pitches[i], rolls[i], magnitudes[i]))
+        bus.publish_many(ACCEL, messages)
+        done += len(block)
+    elapsed = time.perf_counter_ns() - start
+    bus.close()
+    return elapsed, done
+
+
+def run(samples=20000):
+    single = per_sample(samples)
+    block, block_samples = per_block(samples)
+    return {
+        'samples': samples,
+        'per_sample_ns': single / samples,
+        'per_sample_samples_per_s': samples / single * 1e9,
+        'fifo_block_ns': block / block_samples,
+        'fifo_block_samples_per_s': block_samples / block * 1e9,
+    }
+
+
+if __name__ == '__main__':
+    result = run()
+    print(f"per sample: {result['per_sample_samples_per_s']:.0f} samples/s ({result['per_sample_ns']:.0f} ns)")
+    print(f"FIFO blocks: {result['fifo_block_samples_per_s']:.0f} samples/s ({result['fifo_block_ns']:.0f} ns)")
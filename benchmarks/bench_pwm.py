@@ -0,0 +1,74 @@
+"""Update jitter and CPU cost of each PWM backend
+
+Run on the Pi from the repository root:  python -m benchmarks.bench_pwm [pin]
+Backends that cannot be opened (no pwmchip, no pigpiod, no RPi.GPIO) are
+reported as unavailable; the 'null' backend measures the sequencer alone.
+"""
+import statistics
+import sys
+import time
+
+from pwm_actuators import BACKENDS, PwmActuator, Ramp, beeps
+
+
+class NullPWM(object):
+    name = 'null'
+
+    def __init__(self, pin, frequency):
+        pass
+
+    def set_frequency(self, frequency):
+        pass
+
+    def set_duty(self, percent):
+        pass
+
+    def stop(self):
+        pass
+
+
+def measure(backend_cls, pin=18, seconds=2.0):
+    """Returns update jitter (us) of a ramp + tone sequence and CPU use while holding 50% duty"""
+    try:
+        actuator = PwmActuator(backend_cls(pin, 1000))
+    except Exception as e:
+        return {'available': False, 'error': str(e)}
+
+    sequence = [Ramp(0, 100, 1.0, 100)] + beeps(2000, 10, on=0.05, off=0.05)
+    actuator.play(sequence, blocking=True)
+    lateness = [(actual - due) * 1e6 for due, actual in actuator.updates]
+
+    # Software PWM toggles the pin from a background thread, which shows up as process CPU time
+    actuator.pwm.set_duty(50)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    time.sleep(seconds)
+    cpu = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start) * 100
+    actuator.close()
+
+    return {
+        'available': True,
+        'updates': len(lateness),
+        'jitter_mean_us': statistics.mean(lateness),
+        'jitter_stdev_us': statistics.pstdev(lateness),
+        'jitter_max_us': max(lateness),
+        'cpu_percent_at_50_duty': cpu,
+    }
+
+
+def run(pin=18):
+    results = {'null': measure(NullPWM, pin)}
+    for name, backend_cls in BACKENDS.items():
+        results[name] = measure(backend_cls, pin)
+    return results
+
+
+if __name__ == '__main__':
+    pin = int(sys.argv[1]) if len(sys.argv) > 1 else 18
+    for name, result in run(pin).items():
+        if not result['available']:
+            print(f"{name}: unavailable ({result['error']})")
+            continue
+        print(f"{name}: {result['updates']} updates, lateness mean {result['jitter_mean_us']:.0f} us, "
+              f"stdev {result['jitter_stdev_us']:.0f} us, max {result['jitter_max_us']:.0f} us, "
+              f"CPU {result['cpu_percent_at_50_duty']:.2f}%")
@@ -0,0 +1,91 @@
+"""Latency of the ThingSpeak/Telegram upload path against a local stub server
+
+main.py opens a new connection per request (requests.get/post); this
+also measures a pooled requests.Session for comparison.
+
+Run from the repository root:  python -m benchmarks.bench_upload
+"""
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real services
+    wbufsize = -1  # headers and body in one segment; split writes stall on delayed ACKs
+
+    def _reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(b'1')  # ThingSpeak answers with the entry id
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply(b'{"ok":true}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _params(i):
+    return {'api_key': 'BENCH', 'field1': 22.0, 'field2': 45.0, 'field3': i, 'field4': 0.01,
+            'field5': 0.02, 'field6': 0.98, 'field7': 0.98, 'field8': 5}
+
+
+def _summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        'requests_per_s': len(latencies) / sum(latencies),
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def run(count=200):
+    if requests is None:
+        return {'available': False, 'error': 'requests is not installed'}
+    server = start_stub()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    results = {'available': True, 'count': count}
+    try:
+        for name, client in (('per_request', requests), ('session', requests.Session())):
+            upload, telegram = [], []
+            for i in range(count):
+                start = time.perf_counter()
+                client.get(f'{base}/update', params=_params(i), timeout=5)
+                upload.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                client.post(f'{base}/botTOKEN/sendMessage', data={'chat_id': '1', 'text': 'bench'}, timeout=5)
+                telegram.append(time.perf_counter() - start)
+            results[name] = {'thingspeak': _summary(upload), 'telegram': _summary(telegram)}
+    finally:
+        server.shutdown()
+    return results
+
+
+if __name__ == '__main__':
+    result = run()
+    if not result['available']:
+        print(f"unavailable ({result['error']})")
+    else:
+        for name in ('per_request', 'session'):
+            for service, stats in result[name].items():
+                print(f"{name} {service}: {stats['mean_ms']:.2f} ms mean, {stats['p95_ms']:.2f} ms p95")
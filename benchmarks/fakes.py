@@ -0,0 +1,231 @@
+"""Simulated hardware for running benchmarks on a plain Linux box
+
+install() registers stand-ins for smbus and RPi.GPIO only when the real
+modules cannot be imported, so driver modules import cleanly anywhere.
+Benchmarks still hand the fakes to the drivers explicitly, so nothing on
+a real Pi is touched.
+"""
+import math
+import struct
+import sys
+import time
+import types
+
+# ADXL345 registers the fake answers
+DATAX0 = 0x32
+FIFO_STATUS = 0x39
+
+# I2C standard mode: roughly 9 bit times per byte plus start/stop
+I2C_BIT_SECONDS = 1 / 100_000
+
+
+def upright(t):
+    """Counts (256 LSB/g full resolution) of a device worn upright, with a little sway"""
+    return (int(6 * math.sin(7 * t)), int(4 * math.cos(5 * t)), 256)
+
+
+class FakeSMBus(object):
+    """SMBus stand-in backed by a signal function of time
+
+    signal(t) returns raw (x, y, z) counts; t advances by one sample period
+    per DATAX0 read, so FIFO drains and single reads see a continuous stream.
+    With real_time=True each transaction also sleeps for its 100kHz transfer time.
+    """
+
+    def __init__(self, port=1, signal=upright, rate_hz=100, fifo_level=32, real_time=False):
+        self.port = port
+        self.real_time = real_time
+        self.signal = signal
+        self.period = 1.0 / rate_hz
+        self.fifo_level = fifo_level
+        self.t = 0.0
+        self.registers = {}
+        self.transactions = 0
+        self.bytes = 0
+
+    def _transfer(self, count):
+        self.transactions += 1
+        self.bytes += count
+        if self.real_time:
+            time.sleep(count * 9 * I2C_BIT_SECONDS)
+
+    def write_byte_data(self, address, register, value):
+        self.registers[register] = value
+        self._transfer(3)
+
+    def write_byte(self, address, value):
+        self._transfer(2)
+
+    def read_byte_data(self, address, register):
+        self._transfer(3)
+        if register == FIFO_STATUS:
+            return self.fifo_level
+        return self.registers.get(register, 0)
+
+    def read_i2c_block_data(self, address, register, length):
+        self._transfer(2 + length)
+        if register == DATAX0:
+            x, y, z = self.signal(self.t)
+            self.t += self.period
+            return list(struct.pack('<hhh', x, y, z))[:length]
+        return [self.registers.get(register + i, 0) for i in range(length)]
+
+    def bus_seconds(self):
+        """Time the recorded traffic would occupy a 100kHz bus"""
+        return self.bytes * 9 * I2C_BIT_SECONDS
+
+    def close(self):
+        pass
+
+
+class FakeGPIO(object):
+    """The subset of RPi.GPIO used by this project; echo pulses come from echo_seconds"""
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_UP = 22
+    PUD_DOWN = 21
+
+    def __init__(self, echo_seconds=0.0058):
+        self.levels = {}
+        self.echo_seconds = echo_seconds  # ~1m round trip
+        self.echo_pins = set()
+        self.echo_start = None
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, pull_up_down=None, initial=None):
+        if mode == self.IN:
+            self.echo_pins.add(pin)
+        self.levels[pin] = initial or 0
+
+    def output(self, pin, level):
+        if self.levels.get(pin) and not level:
+            # Falling edge on the trigger: start an echo pulse shortly afterwards
+            self.echo_start = time.perf_counter() + 0.0002
+        self.levels[pin] = level
+
+    def input(self, pin):
+        if pin in self.echo_pins and self.echo_start is not None:
+            elapsed = time.perf_counter() - self.echo_start
+            return self.HIGH if 0 <= elapsed < self.echo_seconds else self.LOW
+        return self.levels.get(pin, 0)
+
+    def cleanup(self, *pins):
+        self.levels.clear()
+
+    def PWM(self, pin, frequency):
+        gpio = self
+
+        class _PWM(object):
+            def start(self, duty):
+                gpio.levels[pin] = duty
+
+            def ChangeDutyCycle(self, duty):
+                gpio.levels[pin] = duty
+
+            def ChangeFrequency(self, frequency):
+                pass
+
+            def stop(self):
+                gpio.levels[pin] = 0
+
+        return _PWM()
+
+
+class FakeLCD(object):
+    """HD44780 behind a PCF8574 backpack, driven the way I2C_LCD_driver.lcd does it
+
+    Every byte goes out as two 4-bit nibbles, each a plain write plus an
+    enable strobe (three bus writes), with the driver's fixed delays. The
+    delays are accumulated in delay_seconds instead of slept unless
+    sleep=True.
+    """
+
+    ENABLE = 0b00000100
+    REGISTER_SELECT = 0b00000001
+    BACKLIGHT = 0x08
+    LINE_ADDRESS = {1: 0x80, 2: 0xC0, 3: 0x94, 4: 0xD4}
+    CLEAR = 0x01
+    HOME = 0x02
+
+    def __init__(self, bus=None, address=0x27, sleep=False):
+        self.bus = bus if bus is not None else FakeSMBus()
+        self.address = address
+        self.sleep = sleep
+        self.delay_seconds = 0.0
+        self.backlight_bit = self.BACKLIGHT
+
+    def _delay(self, seconds):
+        self.delay_seconds += seconds
+        if self.sleep:
+            time.sleep(seconds)
+
+    def _write_cmd(self, data):
+        self.bus.write_byte(self.address, data | self.backlight_bit)
+        self._delay(0.0001)
+
+    def _strobe(self, data):
+        self._write_cmd(data | self.ENABLE)
+        self._delay(0.0005)
+        self._write_cmd(data & ~self.ENABLE)
+        self._delay(0.0001)
+
+    def _write_four_bits(self, data):
+        self._write_cmd(data)
+        self._strobe(data)
+
+    def lcd_write(self, cmd, mode=0):
+        self._write_four_bits(mode | (cmd & 0xF0))
+        self._write_four_bits(mode | ((cmd << 4) & 0xF0))
+
+    def lcd_display_string(self, string, line=1, pos=0):
+        self.lcd_write(self.LINE_ADDRESS[line] + pos)
+        for char in string:
+            self.lcd_write(ord(char) & 0xFF, self.REGISTER_SELECT)
+
+    def lcd_clear(self):
+        self.lcd_write(self.CLEAR)
+        self.lcd_write(self.HOME)
+
+    def backlight(self, on):
+        self.backlight_bit = self.BACKLIGHT if on else 0
+        self._write_cmd(0)
+
+
+def fake_accelerometer(signal=upright, rate_hz=100):
+    """adxl345.ADXL345 wired to a FakeSMBus, calibrated to output g"""
+    import adxl345
+    acc = adxl345.ADXL345(bus=FakeSMBus(signal=signal, rate_hz=rate_hz))
+    acc.x_gain = acc.y_gain = acc.z_gain = 256
+    return acc
+
+
+def install():
+    """Register fake smbus and RPi.GPIO modules where the real ones are missing"""
+    try:
+        import smbus  # noqa: F401
+    except ImportError:
+        module = types.ModuleType('smbus')
+        module.SMBus = FakeSMBus
+        sys.modules['smbus'] = module
+    try:
+        import RPi.GPIO  # noqa: F401
+    except (ImportError, RuntimeError):
+        gpio = FakeGPIO()
+        package = types.ModuleType('RPi')
+        module = types.ModuleType('RPi.GPIO')
+        for name in dir(gpio):
+            if not name.startswith('_'):
+                setattr(module, name, getattr(gpio, name))
+        package.GPIO = module
+        sys.modules['RPi'] = package
+        sys.modules['RPi.GPIO'] = module
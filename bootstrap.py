@@ -0,0 +1,98 @@
+import importlib
+import os
+import threading
+import time
+
+from log_setup import get_logger
+
+log = get_logger('startup')
+
+# As close to process start as Python code gets when imported first
+STARTED = time.perf_counter()
+
+
+def seconds_since_exec():
+    """Seconds since the process was exec'd (interpreter startup included), None off Linux"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 is the start time in clock ticks after boot; the command name may contain spaces
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def lazy_import(name):
+    """Import a module on first use; later calls are a dictionary lookup"""
+    return importlib.import_module(name)
+
+
+class Startup(object):
+    """Times application startup phase by phase
+
+    mark() records a milestone, step() times a single call and parallel()
+    runs independent initializers in threads. report() logs the timeline.
+    """
+
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.exec_offset = None
+        since_exec = seconds_since_exec()
+        if since_exec is not None:
+            # Time from exec to STARTED (interpreter and module imports)
+            self.exec_offset = max(since_exec - (time.perf_counter() - started), 0.0)
+        self.events = []  # (name, at_seconds, took_seconds)
+        self.lock = threading.Lock()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def mark(self, name, took=None):
+        at = self.elapsed()
+        with self.lock:
+            self.events.append((name, at, took))
+        return at
+
+    def step(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.mark(name, time.perf_counter() - start)
+
+    def parallel(self, tasks, timeout=None):
+        """Run {name: callable} concurrently; returns {name: result}, None for failures"""
+        results = {}
+
+        def run(name, func):
+            try:
+                results[name] = self.step(name, func)
+            except Exception as e:
+                results[name] = None
+                log.error("Startup task %s failed: %s", name, e)
+
+        threads = [threading.Thread(target=run, args=item, name=f'init-{item[0]}', daemon=True)
+                   for item in tasks.items()]
+        for thread in threads:
+            thread.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+            if thread.is_alive():
+                log.warning("Startup task %s still running, continuing without it", thread.name[5:])
+        return results
+
+    def report(self):
+        """Logs the startup timeline and returns it as {name: at_seconds}"""
+        if self.exec_offset is not None:
+            log.info("Interpreter and imports: %.3fs", self.exec_offset)
+        timeline = {}
+        for name, at, took in sorted(self.events, key=lambda event: event[1]):
+            timeline[name] = at
+            if took is None:
+                log.info("%-24s at %.3fs", name, at)
+            else:
+                log.info("%-24s at %.3fs (took %.3fs)", name, at, took)
+        return timeline
@@ -1,14 +1,39 @@
 import RPi.GPIO as GPIO
 from time import sleep
+from alert_patterns import PatternOutput
+from pwm_actuators import open_pwm
+
+BUZZER_PIN = 18
 
 def buzz_buzzer(duration=5):
     GPIO.setmode(GPIO.BCM)
     GPIO.setwarnings(False)
-    GPIO.setup(18, GPIO.OUT)
+    GPIO.setup(BUZZER_PIN, GPIO.OUT)
     end_time = duration
     while end_time > 0:
-        GPIO.output(18, 1)
+        GPIO.output(BUZZER_PIN, 1)
         sleep(0.5)
-        GPIO.output(18, 0)
+        GPIO.output(BUZZER_PIN, 0)
         sleep(0.5)
         end_time -= 1
+
+
+class BuzzerAlert(PatternOutput):
+    """Non-blocking buzzer: start_alert(duration, pattern) returns immediately
+
+    With tone set (Hz) a passive buzzer is driven through pwm_actuators,
+    using hardware PWM when the pin supports it.
+    """
+
+    def __init__(self, pin=BUZZER_PIN, scheduler=None, tone=None):
+        self.pin = pin
+        self.pwm = None
+        if tone:
+            self.pwm = open_pwm(pin, tone)
+            write = lambda level: self.pwm.set_duty(50 if level else 0)
+        else:
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setwarnings(False)
+            GPIO.setup(pin, GPIO.OUT)
+            write = lambda level: GPIO.output(pin, level)
+        super().__init__(write, scheduler)
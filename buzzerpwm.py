@@ -1,13 +1,11 @@
-import RPi.GPIO as GPIO #import RPi.GPIO module
-from time import sleep #used to create delays
+from pwm_actuators import open_pwm, PwmActuator, Ramp, Hold
 
-GPIO.setmode(GPIO.BCM) #choose BCM mode
-GPIO.setwarnings(False)
-GPIO.setup(18,GPIO.OUT) #set GPIO 18 as output
+# Hardware PWM on GPIO 18 when available, RPi.GPIO software PWM otherwise
+buzzer = PwmActuator(open_pwm(18, 100)) #100Hz PWM output at GPIO 18
+print('PWM backend:', buzzer.pwm.name)
 
-PWM = GPIO.PWM(18,100) #set 100Hz PWM output at GPIO 18
-
-while True: #loops the next 3 lines
-    for i in range(0,101,20):
-        PWM.start(i)
-        sleep(0.5)
+try:
+    while True: #ramp duty cycle 0 -> 100% in 20% steps, 0.5 s each
+        buzzer.play([Ramp(0, 100, 2.5, 5), Hold(100, 0.5)], blocking=True)
+except KeyboardInterrupt:
+    buzzer.close()
@@ -0,0 +1,229 @@
+import math
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from log_setup import get_logger
+
+log = get_logger('calibration')
+
+# One OFSX/OFSY/OFSZ LSB (15.6mg) is 4 full-resolution LSBs (3.9mg)
+HW_OFFSET_SCALE = 4
+
+# Plausible full-resolution calibration (about 256 LSB/g)
+GAIN_RANGE = (200, 320)
+MAX_OFFSET = 150
+
+
+class RunningStats(object):
+    """Welford running mean/variance over vectors of a fixed size"""
+
+    def __init__(self, size=3):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = [0.0] * self.size
+        self.m2 = [0.0] * self.size
+
+    def add(self, values):
+        self.count += 1
+        n = self.count
+        for i, value in enumerate(values):
+            delta = value - self.mean[i]
+            self.mean[i] += delta / n
+            self.m2[i] += delta * (value - self.mean[i])
+
+    def add_batch(self, block):
+        """Merge a block of samples (Chan et al. parallel update)"""
+        if np is None:
+            for values in block:
+                self.add(values)
+            return
+        block = np.asarray(block, dtype=np.float64)
+        n_b = len(block)
+        if n_b == 0:
+            return
+        mean_b = block.mean(axis=0)
+        m2_b = ((block - mean_b) ** 2).sum(axis=0)
+        n_a = self.count
+        n = n_a + n_b
+        for i in range(self.size):
+            delta = mean_b[i] - self.mean[i]
+            self.mean[i] += delta * n_b / n
+            self.m2[i] += m2_b[i] + delta * delta * n_a * n_b / n
+        self.count = n
+
+    def variance(self):
+        if self.count < 2:
+            return [0.0] * self.size
+        return [m2 / (self.count - 1) for m2 in self.m2]
+
+    def std(self):
+        return [math.sqrt(v) for v in self.variance()]
+
+
+def collect_stats(acc, seconds=1.0, stats=None):
+    """Drain FIFO bursts for the given time into a RunningStats of raw counts"""
+    if stats is None:
+        stats = RunningStats(3)
+    acc.get_fifo_raw()  # discard anything older than this window
+    end = time.time() + seconds
+    while time.time() < end:
+        # 32 entries last 320ms at 100Hz, so 250ms between drains never overflows
+        time.sleep(0.25)
+        stats.add_batch(uncorrected(acc, acc.get_fifo_raw()))
+    return stats
+
+
+def uncorrected(acc, block):
+    """Remove the hardware offset registers from raw samples"""
+    ox, oy, oz = (HW_OFFSET_SCALE * v for v in acc.hw_offset)
+    if not (ox or oy or oz):
+        return block
+    if np is not None:
+        return np.asarray(block) - (ox, oy, oz)
+    return [(x - ox, y - oy, z - oz) for x, y, z in block]
+
+
+def _solve(rows, rhs):
+    """Least squares for small systems via the normal equations (no NumPy needed)"""
+    n = len(rows[0])
+    ata = [[sum(r[i] * r[j] for r in rows) for j in range(n)] for i in range(n)]
+    atb = [sum(r[i] * b for r, b in zip(rows, rhs)) for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda k: abs(ata[k][col]))
+        if abs(ata[pivot][col]) < 1e-12:
+            return None
+        ata[col], ata[pivot] = ata[pivot], ata[col]
+        atb[col], atb[pivot] = atb[pivot], atb[col]
+        for k in range(col + 1, n):
+            factor = ata[k][col] / ata[col][col]
+            for j in range(col, n):
+                ata[k][j] -= factor * ata[col][j]
+            atb[k] -= factor * atb[col]
+    result = [0.0] * n
+    for i in range(n - 1, -1, -1):
+        result[i] = (atb[i] - sum(ata[i][j] * result[j] for j in range(i + 1, n))) / ata[i][i]
+    return result
+
+
+def fit_ellipsoid(points):
+    """Axis-aligned ellipsoid through static gravity readings
+
+    Solves a*x^2 + b*y^2 + c*z^2 + d*x + e*y + f*z = 1 and returns
+    (offsets, gains) in raw counts, gains being counts per g.
+    Needs at least six well spread orientations.
+    """
+    if len(points) < 6:
+        return None
+    scale = 256.0  # keep the normal equations well conditioned
+    rows = [(x*x, y*y, z*z, x, y, z) for x, y, z in ((px / scale, py / scale, pz / scale) for px, py, pz in points)]
+    if np is not None:
+        solution, _, rank, _ = np.linalg.lstsq(np.array(rows), np.ones(len(rows)), rcond=None)
+        if rank < 6:
+            return None
+        params = [float(v) for v in solution]
+    else:
+        params = _solve(rows, [1.0] * len(rows))
+        if params is None:
+            return None
+    a, b, c, d, e, f = params
+    if a <= 0 or b <= 0 or c <= 0:
+        return None
+    g = 1 + d*d / (4*a) + e*e / (4*b) + f*f / (4*c)
+    offsets = [-d / (2*a) * scale, -e / (2*b) * scale, -f / (2*c) * scale]
+    gains = [math.sqrt(g / a) * scale, math.sqrt(g / b) * scale, math.sqrt(g / c) * scale]
+    return offsets, gains
+
+
+def plausible(offsets, gains):
+    return (all(GAIN_RANGE[0] <= gain <= GAIN_RANGE[1] for gain in gains)
+            and all(abs(offset) <= MAX_OFFSET for offset in offsets))
+
+
+def apply_calibration(acc, offsets, gains, hardware=True, save=True):
+    """Write offsets to OFSX/OFSY/OFSZ and keep only the residual and gain in software"""
+    if hardware:
+        registers = [max(-128, min(127, int(round(-offset / HW_OFFSET_SCALE)))) for offset in offsets]
+        acc.set_hardware_offset(*registers)
+        residual = [offset + HW_OFFSET_SCALE * reg for offset, reg in zip(offsets, registers)]
+    else:
+        acc.clear_offset()
+        residual = offsets
+    acc.x_offset, acc.y_offset, acc.z_offset = residual
+    acc.x_gain, acc.y_gain, acc.z_gain = gains
+    if save:
+        acc.save_calib_value()
+
+
+class AutoCalibrator(object):
+    """Collects still orientations during normal wear and refits the calibration
+
+    Samples are fed in raw counts (single reads or FIFO blocks). Each window
+    of `window` samples whose per-axis standard deviation stays under
+    `still_lsb` is a gravity reading; readings at least `min_separation`
+    degrees apart from each other are kept for the ellipsoid fit.
+    """
+
+    def __init__(self, acc, window=50, still_lsb=6.0, min_separation=25, max_points=24):
+        self.acc = acc
+        self.window = window
+        self.still_lsb = still_lsb
+        self.min_cos = math.cos(math.radians(min_separation))
+        self.max_points = max_points
+        self.stats = RunningStats(3)
+        self.points = []
+        self.fits = 0
+
+    def add_sample(self, x, y, z):
+        ox, oy, oz = (HW_OFFSET_SCALE * v for v in self.acc.hw_offset)
+        self.stats.add((x - ox, y - oy, z - oz))
+        if self.stats.count >= self.window:
+            self._close_window()
+
+    def add_block(self, block):
+        self.stats.add_batch(uncorrected(self.acc, block))
+        if self.stats.count >= self.window:
+            self._close_window()
+
+    def _close_window(self):
+        if max(self.stats.std()) <= self.still_lsb:
+            self._add_point(tuple(self.stats.mean))
+        self.stats.reset()
+
+    def _add_point(self, point):
+        norm = math.sqrt(sum(v*v for v in point))
+        if norm == 0:
+            return
+        for existing in self.points:
+            existing_norm = math.sqrt(sum(v*v for v in existing))
+            cos = sum(a*b for a, b in zip(point, existing)) / (norm * existing_norm)
+            if cos > self.min_cos:
+                return
+        self.points.append(point)
+        if len(self.points) > self.max_points:
+            self.points.pop(0)
+
+    def refine(self, hardware=True, save=True):
+        """Refit when enough orientations were seen; returns True if the calibration changed"""
+        result = fit_ellipsoid(self.points)
+        if result is None or not plausible(*result):
+            return False
+        apply_calibration(self.acc, result[0], result[1], hardware=hardware, save=save)
+        self.fits += 1
+        return True
+
+    def run(self, seconds=60, hardware=True):
+        """Non-interactive calibration: rest the board in a few orientations while this runs"""
+        self.acc.set_fifo_mode()
+        end = time.time() + seconds
+        while time.time() < end:
+            time.sleep(0.25)
+            self.add_block(self.acc.get_fifo_raw())
+        log.info("Calibration collected %d orientations", len(self.points))
+        return self.refine(hardware=hardware)
@@ -0,0 +1,259 @@
+"""Event-driven scheduled check-ins
+
+A household's schedule lives in an INI file (MONITOR_HOUSEHOLD_CONFIG,
+default household.ini); every key is optional:
+
+    [checkin]
+    # Either a fixed interval during wake hours...
+    interval_hours = 4
+    # ...or fixed times of day (interval_hours is then ignored)
+    times = 09:00, 13:00, 18:30
+    wake_hours = 6-22
+    response_timeout_minutes = 5
+    # A key press this recently before a check-in is due counts as the check-in
+    recent_interaction_minutes = 30
+    # Postpone a due check-in while the person is visibly active...
+    defer_when_active = yes
+    defer_minutes = 20
+    # ...but never by more than this in total
+    max_defer_minutes = 90
+"""
+import configparser
+import datetime
+import os
+import threading
+import time
+
+from log_setup import get_logger
+
+log = get_logger('checkin')
+
+CONFIG_ENV = 'MONITOR_HOUSEHOLD_CONFIG'
+DEFAULT_CONFIG_FILE = 'household.ini'
+
+# Outcomes of a due check-in
+PROMPTED = 'prompted'
+COMPLETED = 'completed'
+MISSED = 'missed'
+SKIPPED = 'skipped'    # recent interaction made the prompt pointless
+DEFERRED = 'deferred'  # person was active, asked again later
+
+
+def _parse_time(text):
+    hour, minute = text.strip().split(':')
+    return datetime.time(int(hour), int(minute))
+
+
+class CheckinConfig(object):
+    def __init__(self, interval=4 * 3600, times=(), wake_start=6, wake_end=22, response_timeout=300,
+                 recent_interaction=1800, defer_when_active=True, defer=1200, max_defer=5400,
+                 activity_threshold=0.5):
+        self.interval = interval
+        self.times = sorted(times)
+        self.wake_start = wake_start
+        self.wake_end = wake_end
+        self.response_timeout = response_timeout
+        self.recent_interaction = recent_interaction
+        self.defer_when_active = defer_when_active
+        self.defer = defer
+        self.max_defer = max_defer
+        self.activity_threshold = activity_threshold
+
+    @classmethod
+    def load(cls, path=None):
+        """Config from the household INI file; defaults when it does not exist"""
+        path = path or os.environ.get(CONFIG_ENV, DEFAULT_CONFIG_FILE)
+        parser = configparser.ConfigParser()
+        if not parser.read(path) or not parser.has_section('checkin'):
+            return cls()
+        section = parser['checkin']
+        wake_start, wake_end = (int(hour) for hour in section.get('wake_hours', '6-22').split('-'))
+        times = [_parse_time(text) for text in section.get('times', '').split(',') if text.strip()]
+        config = cls(
+            interval=section.getfloat('interval_hours', 4) * 3600,
+            times=times,
+            wake_start=wake_start,
+            wake_end=wake_end,
+            response_timeout=section.getfloat('response_timeout_minutes', 5) * 60,
+            recent_interaction=section.getfloat('recent_interaction_minutes', 30) * 60,
+            defer_when_active=section.getboolean('defer_when_active', True),
+            defer=section.getfloat('defer_minutes', 20) * 60,
+            max_defer=section.getfloat('max_defer_minutes', 90) * 60,
+            activity_threshold=section.getfloat('activity_threshold', 0.5),
+        )
+        log.info("Check-in schedule from %s: %s", path,
+                 ', '.join(t.strftime('%H:%M') for t in times) if times else f"every {config.interval / 3600:g}h")
+        return config
+
+
+class CheckinScheduler(object):
+    """Sleeps until the next check-in is due, a response deadline passes, or something relevant happens
+
+    notify_interaction() (a key press) answers a pending prompt and, in
+    interval mode, restarts the interval. When a check-in comes due it is
+    skipped if the person interacted within recent_interaction, deferred
+    while activity(now) is at least activity_threshold (up to max_defer),
+    and prompted otherwise. Callbacks run on the scheduler thread, outside
+    its lock:
+
+        on_prompt(now), on_completed(now, response_seconds),
+        on_missed(now), on_skipped(now), on_schedule(next_due, waiting)
+    """
+
+    def __init__(self, config=None, activity=None, heartbeat=None, heartbeat_interval=30.0,
+                 on_prompt=None, on_completed=None, on_missed=None, on_skipped=None, on_schedule=None,
+                 clock=time.time):
+        self.config = config or CheckinConfig()
+        self.activity = activity
+        self.heartbeat = heartbeat
+        self.heartbeat_interval = heartbeat_interval
+        self.on_prompt = on_prompt
+        self.on_completed = on_completed
+        self.on_missed = on_missed
+        self.on_skipped = on_skipped
+        self.on_schedule = on_schedule
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.changed = False
+        self.calls = []  # callbacks collected under the lock, run outside it
+        now = clock()
+        self.last_checkin = now
+        self.last_interaction = 0.0
+        self.prompted_at = None
+        self.deferred = 0.0
+        self.next_due = self._next_due(now)
+        self.outcomes = {}
+
+    # Events
+
+    def notify_interaction(self, timestamp=None):
+        with self.cond:
+            self.last_interaction = timestamp if timestamp is not None else self.clock()
+            self.changed = True
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.changed = True
+            self.cond.notify()
+
+    @property
+    def waiting(self):
+        return self.prompted_at is not None
+
+    # Schedule
+
+    def _in_wake_hours(self, when):
+        hour = datetime.datetime.fromtimestamp(when).hour
+        return self.config.wake_start <= hour < self.config.wake_end
+
+    def _next_wake_start(self, when):
+        moment = datetime.datetime.fromtimestamp(when)
+        start = moment.replace(hour=self.config.wake_start, minute=0, second=0, microsecond=0)
+        if start <= moment:
+            start += datetime.timedelta(days=1)
+        return start.timestamp()
+
+    def _next_due(self, after):
+        """Next check-in time after the last one (interval mode) or after `after` (fixed times)"""
+        config = self.config
+        if config.times:
+            moment = datetime.datetime.fromtimestamp(after)
+            for days in (0, 1):
+                day = moment.date() + datetime.timedelta(days=days)
+                for at in config.times:
+                    due = datetime.datetime.combine(day, at)
+                    if due > moment:
+                        return due.timestamp()
+        due = self.last_checkin + config.interval
+        return due if self._in_wake_hours(due) else self._next_wake_start(due)
+
+    def _reschedule(self, now):
+        self.deferred = 0.0
+        self.next_due = self._next_due(now)
+        self._emit(self.on_schedule, self.next_due, False)
+
+    def _emit(self, func, *args):
+        if func:
+            self.calls.append((func, args))
+
+    def _finish(self, outcome, now):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.last_checkin = now
+        self.prompted_at = None
+        self._reschedule(now)
+
+    def _step(self, now):
+        """Handle whatever is due at now; returns the next time something is due"""
+        config = self.config
+        if self.prompted_at is not None:
+            if self.last_interaction > self.prompted_at:
+                response = self.last_interaction - self.prompted_at
+                log.info("Check-in completed after %.0fs", response)
+                self._finish(COMPLETED, now)
+                self._emit(self.on_completed, now, response)
+            elif now >= self.prompted_at + config.response_timeout:
+                log.warning("Check-in timed out")
+                self._finish(MISSED, now)
+                self._emit(self.on_missed, now)
+            else:
+                return self.prompted_at + config.response_timeout
+            return self.next_due
+
+        if not config.times and self.last_interaction > self.last_checkin:
+            # Interval mode: any interaction restarts the interval
+            self.last_checkin = self.last_interaction
+            self._reschedule(now)
+
+        if now < self.next_due:
+            return self.next_due
+
+        if now - self.last_interaction <= config.recent_interaction:
+            log.info("Check-in skipped, last interaction %.0fs ago", now - self.last_interaction)
+            self._finish(SKIPPED, now)
+            self._emit(self.on_skipped, now)
+            return self.next_due
+
+        if (config.defer_when_active and self.activity and self.deferred + config.defer <= config.max_defer
+                and self.activity(now) >= config.activity_threshold):
+            self.deferred += config.defer
+            self.next_due = now + config.defer
+            self.outcomes[DEFERRED] = self.outcomes.get(DEFERRED, 0) + 1
+            log.info("Person is active, check-in deferred %.0f minutes", config.defer / 60)
+            self._emit(self.on_schedule, self.next_due, False)
+            return self.next_due
+
+        self.prompted_at = now
+        self.outcomes[PROMPTED] = self.outcomes.get(PROMPTED, 0) + 1
+        log.info("Scheduled check-in triggered, waiting for user response")
+        self._emit(self.on_schedule, now + config.response_timeout, True)
+        self._emit(self.on_prompt, now)
+        return now + config.response_timeout
+
+    def run(self):
+        """Scheduler loop; returns after stop() or when heartbeat() returns False"""
+        self._emit(self.on_schedule, self.next_due, False)
+        while True:
+            with self.cond:
+                if self.stopped:
+                    return
+                self.changed = False
+                due = self._step(self.clock())
+                calls, self.calls = self.calls, []
+            # Callbacks drive the LCD and Telegram; the keypad must not wait on them
+            for func, args in calls:
+                try:
+                    func(*args)
+                except Exception as e:
+                    log.exception("Check-in callback %s failed: %s", getattr(func, '__name__', func), e)
+            if self.heartbeat and not self.heartbeat():
+                return
+            with self.cond:
+                # Wake for the deadline, an interaction, stop(), or (only) to heartbeat the supervisor
+                timeout = due - self.clock()
+                if self.heartbeat:
+                    timeout = min(timeout, self.heartbeat_interval)
+                if timeout > 0 and not self.changed:
+                    self.cond.wait(timeout)
@@ -4,6 +4,7 @@ from threading import Thread
 import queue
 import time
 import requests 
+from upstream import UpstreamConfig
 import dht11
 import datetime
 from time import sleep
@@ -225,8 +226,11 @@ def is_sleep_time():
     current_hour = datetime.datetime.now().hour
     return current_hour >= 22 or current_hour < 6
 
+# Credentials from upstream.ini or the environment
+upstream_config = UpstreamConfig.load()
+
 def upload_to_thingspeak(temperature, humidity, steps, x, y, z, magnitude, user_feeling, distance=None):
-    API_KEY = 'AVURSRXZ07INDOZO'  # Replace with your actual ThingSpeak Write API Key
+    API_KEY = upstream_config.thingspeak_key
     url = "https://api.thingspeak.com/update"
     params = {
         'api_key': API_KEY,
@@ -249,8 +253,8 @@ def upload_to_thingspeak(temperature, humidity, steps, x, y, z, magnitude, user_
         return False
 
 def send_telegram_message(message):
-    TELEGRAM_BOT_TOKEN = '7885273126:AAEpr5Dy9bUXYE3kf9lEH1ww2bXsByE9y5c'
-    TELEGRAM_CHAT_ID = '6101168212'
+    TELEGRAM_BOT_TOKEN = upstream_config.telegram_token
+    TELEGRAM_CHAT_ID = upstream_config.telegram_chat_id
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     data = {"chat_id": TELEGRAM_CHAT_ID, "text": message}
     try:
@@ -0,0 +1,184 @@
+import datetime
+import threading
+from bisect import bisect_right
+
+# Histogram bin edges per metric (None = no histogram)
+FEELING_BINS = (1.5, 2.5, 3.5, 4.5, 5.5, 6.5, 7.5, 8.5)
+
+METRICS = {
+    'feeling': FEELING_BINS,
+    'steps': None,
+    'active_minutes': None,
+    'presence_seconds': None,
+}
+
+# Posture durations are stored as 'posture:<label>' metrics
+POSTURE_PREFIX = 'posture:'
+
+
+class MetricAggregate(object):
+    """Running count/sum/min/max/histogram for one metric"""
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'bins', 'histogram')
+
+    def __init__(self, bins=None):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self.bins = bins
+        self.histogram = [0] * (len(bins) + 1) if bins else None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        if self.histogram is not None:
+            self.histogram[bisect_right(self.bins, value)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.minimum,
+            'max': self.maximum,
+            'mean': self.mean,
+            'histogram': list(self.histogram) if self.histogram is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data, bins=None):
+        aggregate = cls(bins)
+        aggregate.count = data['count']
+        aggregate.total = data['sum']
+        aggregate.minimum = data['min']
+        aggregate.maximum = data['max']
+        if aggregate.histogram is not None and data.get('histogram') is not None:
+            aggregate.histogram = list(data['histogram'])
+        return aggregate
+
+
+class DayAggregates(object):
+    """Aggregates for a single day, plus one bucket per hour of that day"""
+
+    def __init__(self, date):
+        self.date = date
+        self.metrics = {}
+        self.hours = [dict() for _ in range(24)]
+
+    def _get(self, table, metric):
+        aggregate = table.get(metric)
+        if aggregate is None:
+            aggregate = MetricAggregate(METRICS.get(metric))
+            table[metric] = aggregate
+        return aggregate
+
+    def add(self, metric, value, hour):
+        self._get(self.metrics, metric).add(value)
+        self._get(self.hours[hour], metric).add(value)
+
+    def get(self, metric):
+        """Day aggregate for metric (an empty one if nothing was recorded)"""
+        return self.metrics.get(metric) or MetricAggregate(METRICS.get(metric))
+
+    def hourly(self, metric):
+        """List of 24 hourly aggregates for metric"""
+        return [hour.get(metric) or MetricAggregate(METRICS.get(metric)) for hour in self.hours]
+
+    def posture_durations(self):
+        """Seconds spent in each posture today"""
+        return {name[len(POSTURE_PREFIX):]: aggregate.total
+                for name, aggregate in self.metrics.items()
+                if name.startswith(POSTURE_PREFIX)}
+
+    def summary(self):
+        return {
+            'date': self.date,
+            'steps': int(self.get('steps').total),
+            'avg_feeling': self.get('feeling').mean,
+            'feeling_count': self.get('feeling').count,
+            'active_minutes': self.get('active_minutes').total,
+            'presence_minutes': self.get('presence_seconds').total / 60,
+            'posture_seconds': self.posture_durations(),
+        }
+
+    def to_dict(self):
+        return {
+            'date': self.date.isoformat(),
+            'metrics': {name: aggregate.to_dict() for name, aggregate in self.metrics.items()},
+            'hours': [{name: aggregate.to_dict() for name, aggregate in hour.items()} for hour in self.hours],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        day = cls(datetime.date.fromisoformat(data['date']))
+        day.metrics = {name: MetricAggregate.from_dict(values, METRICS.get(name))
+                       for name, values in data['metrics'].items()}
+        day.hours = [{name: MetricAggregate.from_dict(values, METRICS.get(name)) for name, values in hour.items()}
+                     for hour in data['hours']]
+        return day
+
+
+class DailyAggregates(object):
+    """Per-day and per-hour aggregates, updated in O(1) per event"""
+
+    def __init__(self, keep_days=2):
+        self.keep_days = keep_days
+        self.days = {}
+        self.lock = threading.Lock()
+
+    def record(self, metric, value, when=None):
+        if when is None:
+            when = datetime.datetime.now()
+        date = when.date()
+        with self.lock:
+            day = self.days.get(date)
+            if day is None:
+                day = self._start_day(date)
+            day.add(metric, value, when.hour)
+
+    def record_posture(self, posture, seconds, when=None):
+        self.record(POSTURE_PREFIX + posture, seconds, when)
+
+    def _start_day(self, date):
+        day = DayAggregates(date)
+        self.days[date] = day
+        # Drop the oldest days so memory stays bounded
+        for old in sorted(self.days)[:-self.keep_days]:
+            del self.days[old]
+        return day
+
+    def day(self, date=None):
+        if date is None:
+            date = datetime.date.today()
+        with self.lock:
+            day = self.days.get(date)
+            if day is None:
+                day = self._start_day(date)
+            return day
+
+    def summary(self, date=None):
+        day = self.day(date)
+        with self.lock:
+            return day.summary()
+
+    def to_dict(self):
+        """JSON-serializable snapshot of every kept day"""
+        with self.lock:
+            return {'days': [day.to_dict() for day in self.days.values()]}
+
+    def restore(self, data):
+        """Load a to_dict() snapshot, replacing days it contains"""
+        days = [DayAggregates.from_dict(day) for day in data.get('days', ())]
+        with self.lock:
+            for day in days:
+                self.days[day.date] = day
+            for old in sorted(self.days)[:-self.keep_days]:
+                del self.days[old]
@@ -0,0 +1,147 @@
+import heapq
+import os
+import threading
+import time
+from collections import namedtuple
+
+import adxl345
+from i2c_arbiter import I2CArbiter, ArbitratedBus, SENSOR
+
+# One accelerometer sample, timestamped from its position in the device FIFO
+DeviceSample = namedtuple('DeviceSample', ['timestamp', 'device', 'x', 'y', 'z'])
+
+
+def calib_file_for(name):
+    """Per-device calibration file, e.g. accel_calib_wrist.txt"""
+    return f'accel_calib_{name}.txt'
+
+
+class SharedBus(ArbitratedBus):
+    """Sensor-priority handle on one I2C port, shared by every device on it
+
+    Transactions go through the port's I2CArbiter, the same serialization
+    point the LCD uses when it shares the port, so threads never interleave
+    inside a transfer. hold() keeps the bus across a sequence (e.g. a FIFO
+    drain) so other devices cannot split it.
+    """
+
+    def __init__(self, port, arbiter, priority=SENSOR):
+        super().__init__(arbiter, priority)
+        self.port = port
+
+
+class _Device(object):
+    def __init__(self, name, acc, bus, rate_hz):
+        self.name = name
+        self.acc = acc
+        self.bus = bus
+        self.period = 1.0 / rate_hz
+        self.last_timestamp = None
+        self.samples = 0
+
+
+class DeviceManager(object):
+    """Several ADXL345s on one or more I2C buses, read in a single polling pass
+
+    Every device streams into its own 32-sample FIFO; poll() drains all of
+    them in one pass and merges the blocks by timestamp. The wakeup, the
+    scheduling and the merge are shared, so adding a device adds only its
+    bus transfers rather than another thread and loop.
+    """
+
+    def __init__(self, bus_factory=None, arbiters=None):
+        self.bus_factory = bus_factory  # port -> raw SMBus; defaults to smbus.SMBus
+        self.arbiters = dict(arbiters or {})  # port -> I2CArbiter already shared with other users
+        self.owned = []  # arbiters opened here, closed with the manager
+        self.buses = {}
+        self.devices = {}
+        self.lock = threading.Lock()
+
+    def bus(self, port):
+        with self.lock:
+            shared = self.buses.get(port)
+            if shared is None:
+                arbiter = self.arbiters.get(port)
+                if arbiter is None:
+                    arbiter = I2CArbiter(self.bus_factory(port) if self.bus_factory else None, port)
+                    self.arbiters[port] = arbiter
+                    self.owned.append(arbiter)
+                shared = self.buses[port] = SharedBus(port, arbiter)
+            return shared
+
+    def add(self, name, port=1, address=0x53, calib_file=None, rate_hz=100, g_range=adxl345.Range.G_16):
+        """Open, calibrate and start one accelerometer streaming into its FIFO"""
+        if name in self.devices:
+            raise ValueError(f"Device '{name}' already exists")
+        bus = self.bus(port)
+        acc = adxl345.ADXL345(i2c_port=port, address=address, bus=bus,
+                              calib_file=calib_file or calib_file_for(name))
+        with bus.hold():
+            if os.path.exists(acc.calib_file):
+                acc.load_calib_value()
+            acc.set_range(g_range, full_res=True)
+            acc.set_data_rate_hz(rate_hz)
+            acc.set_fifo_mode(adxl345.FifoMode.STREAM)
+            acc.measure_start()
+        self.devices[name] = _Device(name, acc, bus, rate_hz)
+        return acc
+
+    def remove(self, name):
+        device = self.devices.pop(name)
+        device.acc.measure_stop()
+
+    def _timestamps(self, device, count, now):
+        # The newest FIFO entry was sampled about now; the rest are one period apart before it.
+        # Keep the stream monotonic when a drain finishes faster than the data rate.
+        first = now - (count - 1) * device.period
+        if device.last_timestamp is not None and first <= device.last_timestamp:
+            first = device.last_timestamp + device.period
+        return [first + i * device.period for i in range(count)]
+
+    def _drain(self, device, now):
+        with device.bus.hold():
+            block = device.acc.get_fifo_adjusted()
+        count = len(block)
+        if not count:
+            return []
+        if hasattr(block, 'tolist'):
+            block = block.tolist()
+        timestamps = self._timestamps(device, count, now)
+        device.last_timestamp = timestamps[-1]
+        device.samples += count
+        name = device.name
+        return [DeviceSample(t, name, x, y, z) for t, (x, y, z) in zip(timestamps, block)]
+
+    def poll(self, now=None):
+        """Drain every device once; returns their samples merged in timestamp order"""
+        if now is None:
+            now = time.time()
+        streams = [self._drain(device, now) for device in list(self.devices.values())]
+        if len(streams) == 1:
+            return streams[0]
+        return list(heapq.merge(*streams))
+
+    def poll_interval(self, fill=0.5):
+        """Seconds between polls so the fastest FIFO is at most `fill` full"""
+        if not self.devices:
+            return 0.1
+        fastest = min(device.period for device in self.devices.values())
+        return adxl345.FIFO_DEPTH * fastest * fill
+
+    def run(self, handler, stop_event, interval=None):
+        """Call handler(samples) after every polling pass until stop_event is set"""
+        while not stop_event.is_set():
+            started = time.monotonic()
+            samples = self.poll()
+            if samples:
+                handler(samples)
+            wait = (interval or self.poll_interval()) - (time.monotonic() - started)
+            stop_event.wait(max(wait, 0))
+
+    def close(self):
+        for name in list(self.devices):
+            self.remove(name)
+        for arbiter in self.owned:
+            arbiter.bus.close()
+        self.owned.clear()
+        self.buses.clear()
@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import namedtuple, deque
+from log_setup import get_logger
+
+log = get_logger('bus')
+
+# Topics
+ACCEL = 'accel'
+DISTANCE = 'distance'
+CLIMATE = 'climate'
+KEYPAD = 'keypad'
+ALERT = 'alert'
+OCCUPANCY = 'occupancy'  # presence.OccupancyEvent on room entry/exit
+FALL_CAPTURE = 'fall_capture'  # fall_capture.FallSnapshot around each fall candidate
+
+# Message types (alerts use alert_rules.AlertEvent)
+AccelSample = namedtuple('AccelSample', ['timestamp', 'x', 'y', 'z', 'pitch', 'roll', 'magnitude'])
+# confidence: presence.OccupancyEngine confidence that someone is there, None if not known
+DistanceReading = namedtuple('DistanceReading', ['timestamp', 'distance', 'person_present', 'confidence'],
+                             defaults=(None,))
+ClimateReading = namedtuple('ClimateReading', ['timestamp', 'temperature', 'humidity', 'valid'])
+KeyPress = namedtuple('KeyPress', ['timestamp', 'key'])
+
+# What a full subscriber queue does with a new message
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+BLOCK = 'block'  # backpressure: the publisher waits (up to block_timeout, None for no limit) for room
+
+
+class Subscription(object):
+    """Bounded queue plus worker thread delivering one topic to one handler"""
+
+    def __init__(self, bus, topic, handler, name, maxsize, policy, batch_size, max_latency, block_timeout):
+        self.bus = bus
+        self.topic = topic
+        self.handler = handler
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch_size = batch_size      # >1: handler receives a list of messages
+        self.max_latency = max_latency    # seconds a partial batch may wait
+        self.block_timeout = block_timeout
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.active = True
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name=f'bus-{name}', daemon=True)
+        self.thread.start()
+
+    def offer(self, message):
+        with self.cond:
+            if len(self.queue) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.policy == DROP_OLDEST:
+                    self.queue.popleft()
+                    self.dropped += 1
+                else:
+                    deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+                    while len(self.queue) >= self.maxsize and self.active:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.dropped += 1
+                            return False
+                        self.cond.wait(remaining)
+            self.queue.append(message)
+            if len(self.queue) == 1 or len(self.queue) >= self.batch_size:
+                self.cond.notify_all()
+            return True
+
+    def offer_many(self, messages):
+        """Queue a whole batch under one lock acquisition"""
+        if self.policy == BLOCK:
+            for message in messages:
+                self.offer(message)
+            return
+        with self.cond:
+            self.queue.extend(messages)
+            overflow = len(self.queue) - self.maxsize
+            if overflow > 0:
+                drop = self.queue.popleft if self.policy == DROP_OLDEST else self.queue.pop
+                for _ in range(overflow):
+                    drop()
+                self.dropped += overflow
+            self.cond.notify_all()
+
+    def _take(self):
+        with self.cond:
+            while self.active and not self.queue:
+                self.cond.wait()
+            if self.batch_size > 1:
+                # First message is in: give the batch up to max_latency to fill
+                deadline = time.monotonic() + self.max_latency
+                while self.active and len(self.queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            count = min(len(self.queue), self.batch_size)
+            batch = [self.queue.popleft() for _ in range(count)]
+            self.cond.notify_all()  # wake blocked publishers
+            return batch
+
+    def _run(self):
+        while self.active or self.queue:
+            batch = self._take()
+            if not batch:
+                if not self.active:
+                    break
+                continue
+            try:
+                if self.batch_size > 1:
+                    self.handler(batch)
+                else:
+                    self.handler(batch[0])
+                self.delivered += len(batch)
+            except Exception as e:
+                self.errors += 1
+                log.exception("Subscriber %s failed: %s", self.name, e)
+
+    def stop(self):
+        """Ask the worker to finish what is already queued and exit; does not wait"""
+        with self.cond:
+            self.active = False
+            self.cond.notify_all()
+
+    def close(self, timeout=None):
+        """Stop after delivering what is already queued"""
+        self.stop()
+        self.thread.join(timeout)
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+
+class EventBus(object):
+    """In-process publish/subscribe with per-subscriber bounded queues"""
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+        self.published = {}
+        self.started = time.monotonic()
+
+    def subscribe(self, topic, handler, name=None, maxsize=1000, policy=DROP_OLDEST,
+                  batch_size=1, max_latency=0.5, block_timeout=1.0):
+        subscription = Subscription(self, topic, handler, name or getattr(handler, '__name__', topic),
+                                    maxsize, policy, batch_size, max_latency, block_timeout)
+        with self.lock:
+            # Copy-on-write so publish can read the subscriptions without the lock
+            subscriptions = dict(self.subscriptions)
+            subscriptions[topic] = subscriptions.get(topic, ()) + (subscription,)
+            self.subscriptions = subscriptions
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = dict(self.subscriptions)
+            subscriptions[subscription.topic] = tuple(s for s in subscriptions.get(subscription.topic, ())
+                                                      if s is not subscription)
+            self.subscriptions = subscriptions
+        subscription.close()
+
+    def publish(self, topic, message):
+        """Hand a message to every subscriber of topic; never runs handlers in the caller"""
+        # Several sensor threads publish, so the counter is updated under the lock
+        with self.lock:
+            self.published[topic] = self.published.get(topic, 0) + 1
+        for subscription in self.subscriptions.get(topic, ()):
+            subscription.offer(message)
+
+    def publish_many(self, topic, messages):
+        """Publish a burst (e.g. a FIFO drain) with one queue operation per subscriber"""
+        messages = list(messages)
+        with self.lock:
+            self.published[topic] = self.published.get(topic, 0) + len(messages)
+        for subscription in self.subscriptions.get(topic, ()):
+            subscription.offer_many(messages)
+
+    def published_count(self, topic):
+        with self.lock:
+            return self.published.get(topic, 0)
+
+    def stats(self):
+        """Per-topic message counts/rates and per-subscriber queue state"""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self.lock:
+            published = dict(self.published)
+        topics = {}
+        for topic, count in published.items():
+            topics[topic] = {
+                'published': count,
+                'rate_per_s': count / elapsed,
+                'subscribers': {s.name: {'depth': s.depth, 'delivered': s.delivered,
+                                         'dropped': s.dropped, 'errors': s.errors}
+                                for s in self.subscriptions.get(topic, ())},
+            }
+        return topics
+
+    def close(self, timeout=None):
+        """Stop every subscription; timeout bounds the whole close, not each subscription"""
+        subscriptions = [s for topic in self.subscriptions.values() for s in topic]
+        for subscription in subscriptions:
+            subscription.stop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for subscription in subscriptions:
+            subscription.thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
@@ -0,0 +1,291 @@
+"""Pre/post-trigger waveform capture for fall candidates
+
+Every accelerometer sample goes into a preallocated ring buffer. When a
+fall candidate starts, trigger() marks the time; once post_seconds have
+passed, the samples from pre_seconds before the trigger onwards are copied
+out as one FallSnapshot and handed to on_snapshot (main publishes it on the
+event bus, where a CaptureStore writes it to disk).
+
+On disk a capture is fall_captures/fall_<time>.bin:
+
+    header  '<4sHHdI'  magic b'FALL', version, fields per row (7), trigger time, rows
+    rows    '<7f'      seconds from the trigger, x, y, z, pitch, roll, magnitude
+
+plus one line per capture in fall_captures/index.csv with the trigger
+reason, whether the fall was confirmed, and the peak/minimum magnitude.
+"""
+import csv
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import metrics
+from log_setup import get_logger
+
+log = get_logger('capture')
+
+CAPTURES = metrics.counter('fall_captures_total', 'Fall candidate waveforms saved', ('label',))
+CAPTURE_BYTES = metrics.counter('fall_capture_bytes_total', 'Bytes of fall capture files written')
+
+# Values stored per sample, after the time offset
+FIELDS = ('x', 'y', 'z', 'pitch', 'roll', 'magnitude')
+WIDTH = len(FIELDS)
+MAGNITUDE = FIELDS.index('magnitude')
+
+MAGIC = b'FALL'
+VERSION = 1
+HEADER = struct.Struct('<4sHHdI')
+
+DEFAULT_DIRECTORY = 'fall_captures'
+INDEX_FILE = 'index.csv'
+INDEX_COLUMNS = ['File', 'Trigger_Time', 'Reason', 'Confirmed', 'Label_Reason', 'Samples',
+                 'Pre_Seconds', 'Post_Seconds', 'Peak_Magnitude', 'Min_Magnitude']
+
+# offsets: array('f') of seconds from trigger_time; values: array('f') of WIDTH values per sample.
+# confirmed is True/False once the detector decided, None if it never did.
+FallSnapshot = namedtuple('FallSnapshot', ['trigger_time', 'reason', 'confirmed', 'label_reason',
+                                           'offsets', 'values'])
+
+
+def magnitudes(snapshot):
+    return snapshot.values[MAGNITUDE::WIDTH]
+
+
+class FallCapture(object):
+    """Rolling pre-trigger buffer that snapshots the waveform around a fall candidate
+
+    The ring holds (pre_seconds + post_seconds) * max_rate_hz samples plus
+    headroom, in two flat arrays allocated up front; add() only overwrites
+    slots, so the 100Hz accelerometer loop allocates nothing per sample.
+    max_rate_hz must be the highest rate samples can arrive at (the burst
+    profile after a free-fall interrupt), or the pre-trigger side is
+    overwritten before the capture completes. The monitoring loop feeds it
+    every entry it drains from the ADXL345 FIFO with add_block(), so both
+    sides of the trigger are at the device data rate even in the slow
+    profiles. Not thread-safe: add(), add_block(), trigger() and label()
+    are all called from the accelerometer thread.
+    """
+
+    def __init__(self, pre_seconds=5.0, post_seconds=10.0, max_rate_hz=100, on_snapshot=None):
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.on_snapshot = on_snapshot
+        self.capacity = int((pre_seconds + post_seconds) * max_rate_hz * 1.2)
+        self.times = array('d', bytes(8 * self.capacity))
+        self.values = array('f', bytes(4 * WIDTH * self.capacity))
+        # NumPy views on the same memory, so add_block() copies a whole block per column
+        self.times_view = np.frombuffer(self.times, dtype=np.float64) if np is not None else None
+        self.values_view = (np.frombuffer(self.values, dtype=np.float32).reshape(-1, WIDTH)
+                            if np is not None else None)
+        self.head = 0    # next slot to write
+        self.count = 0   # valid samples in the ring
+        self.trigger_time = None
+        self.reason = None
+        self.confirmed = None
+        self.label_reason = None
+        self.snapshots = 0
+
+    @property
+    def capturing(self):
+        return self.trigger_time is not None
+
+    def add(self, timestamp, x, y, z, pitch, roll, magnitude):
+        """Store one sample; completes the open capture once its post-trigger window has passed"""
+        i = self.head
+        self.times[i] = timestamp
+        j = i * WIDTH
+        values = self.values
+        values[j] = x
+        values[j + 1] = y
+        values[j + 2] = z
+        values[j + 3] = pitch
+        values[j + 4] = roll
+        values[j + 5] = magnitude
+        self.head = i + 1 if i + 1 < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+        if self.trigger_time is not None and timestamp >= self.trigger_time + self.post_seconds:
+            self._complete()
+
+    def add_block(self, times, samples, pitch, roll, magnitude):
+        """Store a block of samples (e.g. one FIFO drain) with one slice copy per column and ring wrap
+
+        samples is the (N, 3) block of x, y, z and the rest are length-N
+        sequences, as orientation_batch returns them (NumPy arrays, or
+        lists without NumPy).
+        """
+        n = len(times)
+        if not n:
+            return
+        start = max(n - self.capacity, 0)  # a block larger than the ring keeps its newest samples
+        while start < n:
+            i = self.head
+            end = min(n, start + self.capacity - i)
+            stop = i + end - start
+            if self.times_view is not None:
+                self.times_view[i:stop] = times[start:end]
+                rows = self.values_view[i:stop]
+                rows[:, :3] = samples[start:end]
+                rows[:, 3] = pitch[start:end]
+                rows[:, 4] = roll[start:end]
+                rows[:, 5] = magnitude[start:end]
+            else:
+                self.times[i:stop] = array('d', times[start:end])
+                rows = samples[start:end]
+                for field in range(3):
+                    self.values[i * WIDTH + field:stop * WIDTH:WIDTH] = array('f', [row[field] for row in rows])
+                for field, column in ((3, pitch), (4, roll), (5, magnitude)):
+                    self.values[i * WIDTH + field:stop * WIDTH:WIDTH] = array('f', column[start:end])
+            self.head = stop if stop < self.capacity else 0
+            self.count = min(self.count + end - start, self.capacity)
+            start = end
+        if self.trigger_time is not None and times[n - 1] >= self.trigger_time + self.post_seconds:
+            self._complete()
+
+    def trigger(self, timestamp, reason=None):
+        """Start a capture at a fall candidate; ignored while one is already open"""
+        if self.trigger_time is not None:
+            return False
+        self.trigger_time = timestamp
+        self.reason = reason
+        self.confirmed = None
+        self.label_reason = None
+        return True
+
+    def label(self, confirmed, reason=None):
+        """Record the detector's verdict for the open capture; the first verdict sticks"""
+        if self.trigger_time is not None and self.confirmed is None:
+            self.confirmed = confirmed
+            self.label_reason = reason
+
+    def window(self, start_time):
+        """Copies of the samples since start_time: (times array('d'), values array('f'))"""
+        # Walk back from the newest sample to the first one inside the window
+        first, n = self.head, 0
+        while n < self.count:
+            previous = first - 1 if first else self.capacity - 1
+            if self.times[previous] < start_time:
+                break
+            first, n = previous, n + 1
+        end = first + n
+        if end <= self.capacity:
+            return self.times[first:end], self.values[first * WIDTH:end * WIDTH]
+        wrapped = end - self.capacity
+        return (self.times[first:] + self.times[:wrapped],
+                self.values[first * WIDTH:] + self.values[:wrapped * WIDTH])
+
+    def snapshot(self):
+        """Copy of the samples from pre_seconds before the trigger up to now"""
+        times, values = self.window(self.trigger_time - self.pre_seconds)
+        offsets = array('f', bytes(4 * len(times)))
+        for k, t in enumerate(times):
+            offsets[k] = t - self.trigger_time
+        return FallSnapshot(self.trigger_time, self.reason, self.confirmed, self.label_reason, offsets, values)
+
+    def _complete(self):
+        snapshot = self.snapshot()
+        self.trigger_time = None
+        self.snapshots += 1
+        if self.on_snapshot:
+            self.on_snapshot(snapshot)
+
+
+def _little_endian(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def write_capture(path, snapshot):
+    """Write snapshot in the binary capture format; returns the number of bytes written"""
+    rows = len(snapshot.offsets)
+    data = array('f', bytes(4 * (WIDTH + 1) * rows))
+    data[0::WIDTH + 1] = snapshot.offsets
+    for field in range(WIDTH):
+        data[field + 1::WIDTH + 1] = snapshot.values[field::WIDTH]
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, WIDTH + 1, snapshot.trigger_time, rows))
+        _little_endian(data).tofile(f)
+    os.replace(tmp, path)
+    return HEADER.size + 4 * len(data)
+
+
+def read_capture(path, reason=None, confirmed=None, label_reason=None):
+    """FallSnapshot from a capture file; reason and label come from the index"""
+    with open(path, 'rb') as f:
+        magic, version, width, trigger_time, rows = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or width != WIDTH + 1:
+            raise ValueError(f"{path} is not a version {VERSION} fall capture")
+        data = array('f')
+        data.fromfile(f, rows * width)
+    data = _little_endian(data)
+    values = array('f', bytes(4 * WIDTH * rows))
+    for field in range(WIDTH):
+        values[field::WIDTH] = data[field + 1::width]
+    return FallSnapshot(trigger_time, reason, confirmed, label_reason, data[0::width], values)
+
+
+def _parse_confirmed(text):
+    return {'True': True, 'False': False}.get(text)
+
+
+class CaptureStore(object):
+    """Directory of capture files plus a CSV index, for review and detector tuning
+
+    save() is an event bus handler for FallSnapshot messages, so disk
+    writes happen on the bus worker rather than the accelerometer thread.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.lock = threading.Lock()
+
+    def save(self, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'fall_{snapshot.trigger_time:.3f}.bin'
+        size = write_capture(os.path.join(self.directory, name), snapshot)
+        peaks = magnitudes(snapshot)
+        offsets = snapshot.offsets
+        row = [name, f'{snapshot.trigger_time:.3f}', snapshot.reason, snapshot.confirmed, snapshot.label_reason,
+               len(offsets), f'{-offsets[0]:.2f}' if offsets else 0, f'{offsets[-1]:.2f}' if offsets else 0,
+               f'{max(peaks):.3f}' if peaks else '', f'{min(peaks):.3f}' if peaks else '']
+        with self.lock:
+            file_exists = os.path.isfile(self.index_path)
+            with open(self.index_path, 'a', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                if not file_exists:
+                    writer.writerow(INDEX_COLUMNS)
+                writer.writerow(row)
+        label = {True: 'confirmed', False: 'rejected'}.get(snapshot.confirmed, 'unlabelled')
+        CAPTURES.labels(label).inc()
+        CAPTURE_BYTES.inc(size)
+        log.info("Saved %s fall capture %s (%d samples, %s)", label, name, len(offsets), snapshot.reason)
+        return name
+
+    def index(self):
+        """Index rows as dicts, oldest first"""
+        try:
+            with open(self.index_path, newline='') as csvfile:
+                return list(csv.DictReader(csvfile))
+        except FileNotFoundError:
+            return []
+
+    def load(self, row):
+        """FallSnapshot for an index row"""
+        return read_capture(os.path.join(self.directory, row['File']), row['Reason'],
+                            _parse_confirmed(row['Confirmed']), row['Label_Reason'] or None)
+
+    def __iter__(self):
+        for row in self.index():
+            yield self.load(row)
@@ -0,0 +1,301 @@
+"""Windowed fall classifier: features around a fall candidate plus logistic regression in NumPy
+
+FallDetector's per-sample rules only nominate candidates. This module
+decides on the window from WINDOW_PRE seconds before the candidate to
+WINDOW_POST seconds after it, using features that separate a fall (a
+low-g dip, a hard impact, a different orientation afterwards and little
+movement once down) from sitting down hard or a sensor reading low through
+calibration drift. Inference is a handful of NumPy reductions and one dot
+product; the model is a JSON file of weights.
+
+Train and evaluate from recorded captures (fall_capture.CaptureStore):
+
+    python fall_classifier.py train  [--captures fall_captures] [--labels reviewed.csv] [-o fall_model.json]
+    python fall_classifier.py evaluate [--captures fall_captures] [--labels reviewed.csv] [-m fall_model.json]
+
+Capture labels come from the Confirmed column of the capture index. A
+--labels CSV with File and Fall (1/0) columns overrides them, for captures
+a person has reviewed.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import metrics
+from log_setup import get_logger
+
+log = get_logger('classifier')
+
+INFERENCE_SECONDS = metrics.histogram('fall_classifier_seconds', 'Feature extraction and inference per window',
+                                      buckets=(0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01))
+
+DEFAULT_MODEL_FILE = 'fall_model.json'
+MODEL_ENV = 'MONITOR_FALL_MODEL'
+
+WINDOW_PRE = 2.0    # seconds before the candidate
+WINDOW_POST = 5.0   # seconds after it; main confirms a candidate after the same time
+
+FEATURES = (
+    'sma',                  # signal magnitude area: mean of |x| + |y| + |z|
+    'svm_peak',             # largest signal vector magnitude (impact)
+    'svm_min',              # smallest magnitude (free-fall depth)
+    'jerk_peak',            # largest change of magnitude per second
+    'orientation_change',   # degrees between the mean gravity vector before and after
+    'post_impact_std',      # magnitude spread from 1s after the impact on (lying still or not)
+    'final_tilt',           # degrees between the final gravity vector and upright (z)
+)
+
+
+def window_features(offsets, values, pre=WINDOW_PRE, post=WINDOW_POST):
+    """Feature vector for one window
+
+    offsets are seconds relative to the candidate, values the samples in
+    fall_capture layout (x, y, z, pitch, roll, magnitude per row, flat or
+    (N, 6)). Samples outside [-pre, post] are ignored.
+    """
+    offsets = np.asarray(offsets, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64).reshape(-1, 6)
+    inside = (offsets >= -pre) & (offsets <= post)
+    if not inside.all():
+        offsets, values = offsets[inside], values[inside]
+    if len(offsets) < 3:
+        raise ValueError(f"window has only {len(offsets)} samples")
+    xyz = values[:, :3]
+    magnitude = values[:, 5]
+
+    sma = np.abs(xyz).sum(axis=1).mean()
+    impact = int(magnitude.argmax())
+    dt = np.maximum(np.diff(offsets), 1e-3)
+    jerk = np.abs(np.diff(magnitude)) / dt
+
+    # Mean gravity vector before the candidate and over the last second
+    before = offsets < -0.5
+    start = xyz[before].mean(axis=0) if before.any() else xyz[0]
+    after = offsets >= offsets[-1] - 1.0
+    end = xyz[after].mean(axis=0)
+    norms = np.linalg.norm(start) * np.linalg.norm(end)
+    cos_change = np.dot(start, end) / norms if norms > 0 else 1.0
+    orientation_change = math.degrees(math.acos(min(max(cos_change, -1.0), 1.0)))
+    end_norm = np.linalg.norm(end)
+    final_tilt = math.degrees(math.acos(min(abs(end[2]) / end_norm, 1.0))) if end_norm > 0 else 0.0
+
+    settled = offsets >= offsets[impact] + 1.0
+    post_impact_std = magnitude[settled].std() if settled.sum() > 1 else 0.0
+
+    return np.array((sma, magnitude[impact], magnitude.min(), jerk.max(), orientation_change,
+                     post_impact_std, final_tilt))
+
+
+class FallClassifier(object):
+    """Standardized logistic regression over FEATURES
+
+    probability() is P(fall) for one feature vector; classify() extracts
+    the features of a window and compares P(fall) with threshold. Models
+    are fitted with train() and stored as JSON.
+    """
+
+    def __init__(self, weights, bias, mean, scale, threshold=0.5, features=FEATURES,
+                 pre=WINDOW_PRE, post=WINDOW_POST, info=None):
+        if tuple(features) != FEATURES:
+            raise ValueError(f"model was trained on features {list(features)}, expected {list(FEATURES)}")
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.threshold = threshold
+        self.pre = pre
+        self.post = post
+        self.info = info or {}
+
+    def probability(self, features):
+        z = np.dot((features - self.mean) / self.scale, self.weights) + self.bias
+        return 1.0 / (1.0 + math.exp(-min(max(z, -30.0), 30.0)))
+
+    def probabilities(self, matrix):
+        z = ((np.asarray(matrix) - self.mean) / self.scale) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-np.clip(z, -30.0, 30.0)))
+
+    def classify(self, times, values, trigger_time=0.0):
+        """(is_fall, probability) for the samples at times around a candidate at trigger_time"""
+        start = time.perf_counter()
+        offsets = np.asarray(times, dtype=np.float64) - trigger_time
+        probability = self.probability(window_features(offsets, values, self.pre, self.post))
+        INFERENCE_SECONDS.observe(time.perf_counter() - start)
+        return probability >= self.threshold, probability
+
+    def to_dict(self):
+        return {
+            'features': list(FEATURES),
+            'weights': self.weights.tolist(),
+            'bias': self.bias,
+            'mean': self.mean.tolist(),
+            'scale': self.scale.tolist(),
+            'threshold': self.threshold,
+            'window': [self.pre, self.post],
+            'info': self.info,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        pre, post = data.get('window', (WINDOW_PRE, WINDOW_POST))
+        return cls(data['weights'], data['bias'], data['mean'], data['scale'], data.get('threshold', 0.5),
+                   data['features'], pre, post, data.get('info'))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path=None):
+        """Model from path (default MONITOR_FALL_MODEL or fall_model.json); None if missing or NumPy is not installed"""
+        path = path or os.environ.get(MODEL_ENV, DEFAULT_MODEL_FILE)
+        if not os.path.isfile(path):
+            return None
+        if np is None:
+            log.warning("NumPy is not installed, ignoring fall model %s", path)
+            return None
+        try:
+            with open(path) as f:
+                model = cls.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Ignoring unusable fall model %s: %s", path, e)
+            return None
+        log.info("Fall classifier loaded from %s (threshold %.2f)", path, model.threshold)
+        return model
+
+
+def train(matrix, labels, l2=0.01, learning_rate=0.5, iterations=2000, threshold=0.5):
+    """Fit a FallClassifier by batch gradient descent; classes are weighted to balance them"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.float64)
+    positives = labels.sum()
+    if positives == 0 or positives == len(labels):
+        raise ValueError("training data needs both falls and non-falls")
+    mean = matrix.mean(axis=0)
+    scale = matrix.std(axis=0)
+    scale[scale == 0] = 1.0
+    standardized = (matrix - mean) / scale
+    sample_weight = np.where(labels == 1, len(labels) / (2 * positives), len(labels) / (2 * (len(labels) - positives)))
+    sample_weight /= sample_weight.sum()
+
+    weights = np.zeros(matrix.shape[1])
+    bias = 0.0
+    for _ in range(iterations):
+        predicted = 1.0 / (1.0 + np.exp(-np.clip(standardized @ weights + bias, -30.0, 30.0)))
+        error = (predicted - labels) * sample_weight
+        weights -= learning_rate * (standardized.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum()
+    info = {'samples': len(labels), 'falls': int(positives), 'l2': l2,
+            'trained_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+    return FallClassifier(weights, bias, mean, scale, threshold, info=info)
+
+
+def evaluate(model, matrix, labels):
+    """Confusion counts, precision, recall and accuracy of model on labelled feature vectors"""
+    labels = np.asarray(labels, dtype=bool)
+    predicted = model.probabilities(matrix) >= model.threshold
+    tp = int((predicted & labels).sum())
+    fp = int((predicted & ~labels).sum())
+    fn = int((~predicted & labels).sum())
+    tn = int((~predicted & ~labels).sum())
+    return {
+        'true_positives': tp,
+        'false_positives': fp,
+        'false_negatives': fn,
+        'true_negatives': tn,
+        'precision': tp / (tp + fp) if tp + fp else 0.0,
+        'recall': tp / (tp + fn) if tp + fn else 0.0,
+        'accuracy': (tp + tn) / len(labels) if len(labels) else 0.0,
+    }
+
+
+def time_inference(model, offsets, values, repeats=200):
+    """Mean seconds for feature extraction plus inference on one window"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.probability(window_features(offsets, values, model.pre, model.post))
+    return (time.perf_counter() - start) / repeats
+
+
+# Training data from recorded captures
+
+def _read_labels(path):
+    with open(path, newline='') as csvfile:
+        return {row['File']: row['Fall'].strip() in ('1', 'True', 'true', 'yes') for row in csv.DictReader(csvfile)}
+
+
+def load_dataset(directory, labels_file=None):
+    """(feature matrix, labels, file names) for every labelled capture in directory"""
+    from fall_capture import CaptureStore
+
+    store = CaptureStore(directory)
+    overrides = _read_labels(labels_file) if labels_file else {}
+    rows, labels, names = [], [], []
+    for row in store.index():
+        label = overrides.get(row['File'])
+        snapshot = store.load(row)
+        if label is None:
+            label = snapshot.confirmed
+        if label is None:
+            continue
+        try:
+            rows.append(window_features(snapshot.offsets, snapshot.values))
+        except ValueError as e:
+            log.warning("Skipping %s: %s", row['File'], e)
+            continue
+        labels.append(bool(label))
+        names.append(row['File'])
+    return np.array(rows).reshape(-1, len(FEATURES)), np.array(labels, dtype=bool), names
+
+
+def split(count, test_fraction=0.25, seed=1):
+    order = np.random.default_rng(seed).permutation(count)
+    cut = int(round(count * (1 - test_fraction)))
+    return order[:cut], order[cut:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train or evaluate the fall classifier on recorded captures')
+    parser.add_argument('command', choices=('train', 'evaluate'))
+    parser.add_argument('--captures', default='fall_captures', help='capture directory (with index.csv)')
+    parser.add_argument('--labels', help='CSV of reviewed labels (File, Fall) overriding the capture index')
+    parser.add_argument('-m', '--model', default=DEFAULT_MODEL_FILE, help='model to evaluate')
+    parser.add_argument('-o', '--output', default=DEFAULT_MODEL_FILE, help='where train writes the model')
+    parser.add_argument('--test-fraction', type=float, default=0.25, help='held out by train for evaluation')
+    parser.add_argument('--l2', type=float, default=0.01)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    args = parser.parse_args(argv)
+    if np is None:
+        parser.error('NumPy is required')
+
+    matrix, labels, names = load_dataset(args.captures, args.labels)
+    print(f"{len(labels)} labelled captures, {int(labels.sum())} falls")
+    if args.command == 'train':
+        train_rows, test_rows = split(len(labels), args.test_fraction)
+        model = train(matrix[train_rows], labels[train_rows], l2=args.l2, threshold=args.threshold)
+        if len(test_rows):
+            model.info['held_out'] = evaluate(model, matrix[test_rows], labels[test_rows])
+            print('held out:', json.dumps(model.info['held_out']))
+        model.save(args.output)
+        print(f"model written to {args.output}")
+    else:
+        model = FallClassifier.load(args.model)
+        if model is None:
+            parser.error(f'no usable model at {args.model}')
+        print(json.dumps(evaluate(model, matrix, labels)))
+        for name, probability, label in zip(names, model.probabilities(matrix), labels):
+            if (probability >= model.threshold) != label:
+                print(f"  misclassified {name}: P(fall)={probability:.2f}, labelled {'fall' if label else 'no fall'}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+class FallDetector(object):
+    """Per-sample fall criteria used by the monitoring loop
+
+    Flags a sample when the magnitude jumps (impact), the body turns
+    sharply into a near-horizontal orientation, or the magnitude drops
+    towards free fall. Confirmation over time is left to the caller.
+    """
+
+    def __init__(self, impact_delta=0.15, lying_angle=70, turn_angle=45, free_fall_g=0.5):
+        self.impact_delta = impact_delta
+        self.lying_angle = lying_angle
+        self.turn_angle = turn_angle
+        self.free_fall_g = free_fall_g
+
+        self.prev_magnitude = None
+        self.prev_pitch = None
+        self.prev_roll = None
+
+    def check(self, magnitude, pitch, roll):
+        """Returns (fall_detected, reason) for one sample"""
+        fall_detected = False
+        fall_reason = ""
+
+        # Criterion 1: High impact detection (sudden change in acceleration)
+        if self.prev_magnitude is not None:
+            magnitude_diff = abs(magnitude - self.prev_magnitude)
+            if magnitude_diff > self.impact_delta:
+                fall_detected = True
+                fall_reason = f"High impact detected (diff: {magnitude_diff:.3f})"
+
+        # Criterion 2: Orientation check (sudden change to a lying position)
+        if (abs(pitch) > self.lying_angle or abs(roll) > self.lying_angle) and self.prev_pitch is not None:
+            pitch_change = abs(pitch - self.prev_pitch)
+            roll_change = abs(roll - self.prev_roll)
+            if pitch_change > self.turn_angle or roll_change > self.turn_angle:
+                fall_detected = True
+                fall_reason = f"Sudden orientation change - Pitch: {pitch:.1f}°, Roll: {roll:.1f}°"
+
+        # Criterion 3: Low magnitude (free fall detection)
+        if magnitude < self.free_fall_g:
+            fall_detected = True
+            fall_reason = f"Free fall detected (magnitude: {magnitude:.3f})"
+
+        self.prev_magnitude = magnitude
+        self.prev_pitch = pitch
+        self.prev_roll = roll
+
+        return fall_detected, fall_reason
+
+    def check_block(self, magnitudes, pitches, rolls):
+        """Checks a block of consecutive samples (e.g. one FIFO drain) in order
+
+        Returns (index, reason) for the first flagged sample, or (None, "").
+        Every sample is checked, so the previous-sample criteria compare
+        neighbours at the device data rate.
+        """
+        first, first_reason = None, ""
+        for k, (magnitude, pitch, roll) in enumerate(zip(magnitudes, pitches, rolls)):
+            detected, reason = self.check(magnitude, pitch, roll)
+            if detected and first is None:
+                first, first_reason = k, reason
+        return first, first_reason
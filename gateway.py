@@ -0,0 +1,872 @@
+"""Edge gateway: many monitoring devices behind one set of upstream connections
+
+Devices (GatewayClient) publish compact binary frames to a gateway
+process (GatewayServer feeding a Gateway) instead of calling Telegram and
+ThingSpeak themselves. The gateway drops duplicate frames, batches each
+device's readings into ThingSpeak bulk updates, coalesces events into
+Telegram messages, and forwards over pooled connections
+(upstream.Upstream). LocalBroker stands in for the TCP link inside one
+process, for tests and benchmarks.
+
+Frames are self-delimiting, so a connection carries them back to back:
+
+    header  '<2sBBIIIdH'  magic b'MG', version, kind, device id, session, seq, timestamp, payload length
+    SENSOR  '<ffIffffff'  temperature, humidity, steps, x, y, z, magnitude, feeling, distance (NaN if unknown)
+    EVENT   utf-8         kind, NUL, message
+    SYNC    (empty)       device to gateway: seq is the oldest frame the device still holds
+    ACK     (empty)       gateway to device: every frame up to seq has been dealt with
+    mac     16 bytes      HMAC-SHA256 of header and payload under the shared secret, truncated
+
+session is the client's start time in whole seconds, so it only grows
+across restarts, and seq counts up from 1. The gateway
+acknowledges a frame once it is finished with it: forwarded upstream,
+or for readings also given up on after a failed upload. Until then the
+client keeps it, and after losing the connection (or hearing nothing
+back for ack_timeout) it reconnects and resends everything unacknowledged;
+the gateway drops the copies by (device, session, seq). Frames with a bad
+MAC are discarded, so only holders of the secret can inject readings or
+alerts, and frames from a session older than the newest one seen for
+the device are discarded as stale, so captured frames cannot be replayed
+after the device restarts. (A gateway restart forgets the sessions; until
+a device's current session arrives again, older ones are not recognised.)
+
+Run a gateway:  python gateway.py [--listen 0.0.0.0:1884] [--config upstream.ini]
+"""
+import argparse
+import hmac
+import math
+import select
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import namedtuple, deque
+
+import metrics
+from log_setup import get_logger
+from upstream import UpstreamConfig, Upstream, parse_address, TELEGRAM_MESSAGE_LIMIT
+
+log = get_logger('gateway')
+
+DEFAULT_PORT = 1884
+
+MAGIC = b'MG'
+VERSION = 3
+HEADER = struct.Struct('<2sBBIIIdH')
+SENSOR_PAYLOAD = struct.Struct('<ffIffffff')
+MAC_SIZE = 16
+SENSOR_FRAME_SIZE = HEADER.size + SENSOR_PAYLOAD.size + MAC_SIZE
+
+# Frame kinds
+SENSOR = 1
+EVENT = 2
+SYNC = 3
+ACK = 4
+
+Frame = namedtuple('Frame', ['kind', 'device', 'session', 'seq', 'timestamp', 'payload'])
+SensorReading = namedtuple('SensorReading', ['temperature', 'humidity', 'steps', 'x', 'y', 'z', 'magnitude',
+                                             'feeling', 'distance'])
+Event = namedtuple('Event', ['kind', 'message'])
+
+FRAMES = metrics.counter('gateway_frames_total', 'Frames received by the gateway', ('result',))
+FRAMES_ACCEPTED = FRAMES.labels('accepted')
+FRAMES_DUPLICATE = FRAMES.labels('duplicate')
+FRAMES_MALFORMED = FRAMES.labels('malformed')
+FRAMES_UNAUTHENTICATED = FRAMES.labels('unauthenticated')
+FRAMES_STALE = FRAMES.labels('stale')
+FORWARDED = metrics.counter('gateway_forwarded_total', 'Readings and events forwarded upstream', ('service', 'result'))
+CLIENT_FRAMES = metrics.counter('gateway_client_frames_total', 'Frames published by this device', ('result',))
+CLIENT_SENT = CLIENT_FRAMES.labels('sent')
+CLIENT_DROPPED = CLIENT_FRAMES.labels('dropped')
+CLIENT_RESENT = CLIENT_FRAMES.labels('resent')
+
+
+def thingspeak_fields(reading):
+    """ThingSpeak channel fields for a reading, as upload_to_thingspeak sends them"""
+    return {
+        'field1': reading.temperature,
+        'field2': reading.humidity,
+        'field3': reading.steps,
+        'field4': reading.x,
+        'field5': reading.y,
+        'field6': reading.z,
+        'field7': reading.magnitude,
+        'field8': reading.feeling,
+    }
+
+
+def _key(secret):
+    if not secret:
+        raise ValueError("the gateway link needs a shared secret")
+    return secret.encode('utf-8') if isinstance(secret, str) else bytes(secret)
+
+
+def sign(key, data):
+    """MAC for the header and payload in data"""
+    return hmac.digest(key, data, 'sha256')[:MAC_SIZE]
+
+
+def encode_frame(key, kind, device, session, seq, timestamp, payload=b''):
+    frame = HEADER.pack(MAGIC, VERSION, kind, device, session, seq, timestamp, len(payload)) + payload
+    return frame + sign(key, frame)
+
+
+def encode_event(key, device, session, seq, timestamp, kind, message):
+    payload = f'{kind}\0{message}'.encode('utf-8')[:0xFFFF]
+    return encode_frame(key, EVENT, device, session, seq, timestamp, payload)
+
+
+def _decode_payload(kind, payload):
+    if kind == SENSOR:
+        reading = SensorReading(*SENSOR_PAYLOAD.unpack(payload))
+        if math.isnan(reading.distance):
+            reading = reading._replace(distance=None)
+        return reading
+    if kind == EVENT:
+        event_kind, _, message = bytes(payload).decode('utf-8', 'replace').partition('\0')
+        return Event(event_kind, message)
+    if kind in (SYNC, ACK):
+        return None
+    raise ValueError(f"unknown frame kind {kind}")
+
+
+class FrameReader(object):
+    """Splits a byte stream into authenticated Frames; keeps a partial frame until the rest arrives"""
+
+    def __init__(self, secret):
+        self.key = _key(secret)
+        self.buffer = bytearray()
+        self.malformed = 0
+        self.rejected = 0
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        offset = 0
+        view = memoryview(buffer)
+        try:
+            while len(buffer) - offset >= HEADER.size:
+                magic, version, kind, device, session, seq, timestamp, length = HEADER.unpack_from(buffer, offset)
+                if magic != MAGIC or version != VERSION:
+                    # Lost sync (or a foreign client): skip to the next magic
+                    self.malformed += 1
+                    FRAMES_MALFORMED.inc()
+                    following = buffer.find(MAGIC, offset + 1)
+                    offset = following if following >= 0 else len(buffer)
+                    continue
+                signed = offset + HEADER.size + length
+                end = signed + MAC_SIZE
+                if end > len(buffer):
+                    break
+                if not hmac.compare_digest(view[signed:end], sign(self.key, view[offset:signed])):
+                    self.rejected += 1
+                    FRAMES_UNAUTHENTICATED.inc()
+                    offset = end
+                    continue
+                try:
+                    payload = _decode_payload(kind, view[offset + HEADER.size:signed])
+                except (ValueError, struct.error):
+                    self.malformed += 1
+                    FRAMES_MALFORMED.inc()
+                else:
+                    frames.append(Frame(kind, device, session, seq, timestamp, payload))
+                offset = end
+        finally:
+            view.release()
+        del buffer[:offset]
+        return frames
+
+
+class Deduplicator(object):
+    """Remembers recent (device, session, seq) keys so resent frames are dropped
+
+    Per device it keeps the newest session, the highest seq and the seqs
+    seen within window of it; anything older than the window counts as a
+    duplicate. A newer session (device restart) starts afresh; frames of
+    an older session are stale and never accepted again.
+    """
+
+    def __init__(self, window=4096):
+        self.window = window
+        self.devices = {}
+
+    def stale(self, device, session):
+        """Whether session is older than the newest one seen from device"""
+        state = self.devices.get(device)
+        return state is not None and session < state[0]
+
+    def accept(self, device, session, seq):
+        state = self.devices.get(device)
+        if state is None or session > state[0]:
+            self.devices[device] = [session, seq, {seq}]
+            return True
+        if session < state[0]:
+            return False
+        highest, seen = state[1], state[2]
+        if seq in seen or seq <= highest - self.window:
+            return False
+        seen.add(seq)
+        if seq > highest:
+            state[1] = seq
+            if len(seen) > 2 * self.window:
+                state[2] = {s for s in seen if s > seq - self.window}
+        return True
+
+    def forgotten(self, device, session, seq):
+        """Whether seq is too far behind the newest to be remembered"""
+        state = self.devices.get(device)
+        return state is not None and state[0] == session and seq <= state[1] - self.window
+
+
+class AckTracker(object):
+    """Per device, the highest seq up to which every frame of its session has been dealt with
+
+    Frames finish out of order (events go out before the readings around
+    them), so finished seqs past the first gap wait in a set until the
+    gap closes. A SYNC from the client moves the mark past frames the
+    client no longer holds.
+    """
+
+    def __init__(self):
+        self.devices = {}  # device -> [session, done_through, finished seqs past it]
+
+    def _state(self, device, session):
+        """State for session, None once the device has moved on to a newer one"""
+        state = self.devices.get(device)
+        if state is None or session > state[0]:
+            state = self.devices[device] = [session, 0, set()]
+        return state if state[0] == session else None
+
+    def skip_to(self, device, session, oldest):
+        """The client holds nothing older than oldest"""
+        state = self._state(device, session)
+        if state is not None and oldest - 1 > state[1]:
+            state[1] = oldest - 1
+            self._advance(state)
+
+    def done(self, device, session, seq):
+        state = self._state(device, session)
+        if state is not None and seq > state[1]:
+            state[2].add(seq)
+            self._advance(state)
+
+    @staticmethod
+    def _advance(state):
+        through, finished = state[1], state[2]
+        while through + 1 in finished:
+            through += 1
+            finished.discard(through)
+        state[1] = through
+        if finished and min(finished) <= through:
+            state[2] = {s for s in finished if s > through}
+
+    def acked(self, device):
+        """(session, done_through) for device, or None before its first frame"""
+        state = self.devices.get(device)
+        return None if state is None else (state[0], state[1])
+
+
+class Gateway(object):
+    """Deduplicates frames from many devices and forwards them upstream in batches
+
+    receive() (or submit() for raw bytes) only appends to in-memory
+    batches; a flusher thread sends readings every flush_interval, one
+    ThingSpeak bulk update per device, and events within event_latency,
+    all events of a flush in one Telegram message. Events whose upload
+    fails are kept for the next flush; readings are dropped. Each batch
+    of frames received from a device is answered with an ACK through the
+    reply callable it came with, and so is every flush that finishes
+    frames of that device.
+    """
+
+    def __init__(self, upstream=None, secret=None, flush_interval=15.0, event_latency=1.0, dedup_window=4096,
+                 max_pending=100000):
+        self.upstream = upstream
+        self.key = _key(secret)
+        self.flush_interval = flush_interval
+        self.event_latency = event_latency
+        self.max_pending = max_pending
+        self.dedup = Deduplicator(dedup_window)
+        self.acks = AckTracker()
+        self.replies = {}      # device -> callable sending bytes back on its latest connection
+        self.cond = threading.Condition()
+        self.readings = {}     # device -> [(timestamp, SensorReading, session, seq)]
+        self.events = []       # (device, timestamp, Event, session, seq)
+        self.pending = 0
+        self.dropped = 0
+        self.thread = None
+        self.running = False
+
+    def submit(self, data, reply=None):
+        """Feed whole frames (e.g. one LocalBroker message); returns the number accepted"""
+        reader = FrameReader(self.key)
+        frames = reader.feed(data)
+        if reader.buffer:
+            FRAMES_MALFORMED.inc()
+        return self.receive_many(frames, reply)
+
+    def receive_many(self, frames, reply=None):
+        accepted = 0
+        devices = set()
+        with self.cond:
+            for frame in frames:
+                if self.dedup.stale(frame.device, frame.session):
+                    # A replay, or a device whose clock went back; it does not take over the replies
+                    FRAMES_STALE.inc()
+                    continue
+                devices.add(frame.device)
+                if frame.kind == SYNC:
+                    self.acks.skip_to(frame.device, frame.session, frame.seq)
+                    continue
+                if frame.kind == ACK:
+                    continue
+                if not self.dedup.accept(frame.device, frame.session, frame.seq):
+                    FRAMES_DUPLICATE.inc()
+                    if self.dedup.forgotten(frame.device, frame.session, frame.seq):
+                        # Too old to tell whether it was forwarded; do not hold the ACK back for it
+                        self.acks.done(frame.device, frame.session, frame.seq)
+                    continue
+                if self.pending >= self.max_pending and frame.kind == SENSOR:
+                    self.dropped += 1
+                    self.acks.done(frame.device, frame.session, frame.seq)
+                    continue
+                accepted += 1
+                self.pending += 1
+                if frame.kind == SENSOR:
+                    self.readings.setdefault(frame.device, []).append(
+                        (frame.timestamp, frame.payload, frame.session, frame.seq))
+                else:
+                    self.events.append((frame.device, frame.timestamp, frame.payload, frame.session, frame.seq))
+                    self.cond.notify()
+            if reply is not None:
+                for device in devices:
+                    self.replies[device] = reply
+        FRAMES_ACCEPTED.inc(accepted)
+        # Acknowledge even when nothing moved: duplicates of finished frames need it, and the
+        # client takes any reply as a sign that the connection is alive
+        self._send_acks(devices)
+        return accepted
+
+    def receive(self, frame, reply=None):
+        return self.receive_many((frame,), reply)
+
+    def disconnect(self, reply):
+        """Forget a connection's reply callable once it closes"""
+        with self.cond:
+            for device in [device for device, r in self.replies.items() if r == reply]:
+                del self.replies[device]
+
+    def _finish(self, frames):
+        """Mark (device, session, seq) frames done and acknowledge them"""
+        with self.cond:
+            for device, session, seq in frames:
+                self.acks.done(device, session, seq)
+        self._send_acks({device for device, _, _ in frames})
+
+    def _send_acks(self, devices):
+        messages = []
+        with self.cond:
+            for device in devices:
+                reply, acked = self.replies.get(device), self.acks.acked(device)
+                if reply is not None and acked is not None:
+                    messages.append((reply, encode_frame(self.key, ACK, device, acked[0], acked[1], time.time())))
+        for reply, frame in messages:
+            try:
+                reply(frame)
+            except OSError as e:
+                log.debug("Could not acknowledge: %s", e)
+
+    def _take(self, readings):
+        with self.cond:
+            events, self.events = self.events, []
+            batches = {}
+            if readings:
+                batches, self.readings = self.readings, {}
+            self.pending -= len(events) + sum(len(batch) for batch in batches.values())
+        return events, batches
+
+    def flush(self, readings=True):
+        """Send pending events (and readings) upstream now"""
+        events, batches = self._take(readings)
+        if events:
+            self._forward_events(events)
+        for device, batch in batches.items():
+            self._forward_readings(device, batch)
+
+    def _forward_events(self, events):
+        config = self.upstream.config
+        lines = []
+        for device, timestamp, event, _, _ in sorted(events, key=lambda item: item[1]):
+            at = time.strftime('%H:%M:%S', time.localtime(timestamp))
+            lines.append(f"[{config.device(device).name} {at}] {event.message}")
+        # One message per flush, split at Telegram's size limit
+        messages, current = [], ''
+        for line in lines:
+            if current and len(current) + len(line) + 1 > TELEGRAM_MESSAGE_LIMIT:
+                messages.append(current)
+                current = ''
+            current = f'{current}\n{line}' if current else line
+        messages.append(current)
+        for text in messages:
+            if not self.upstream.send_telegram(text):
+                FORWARDED.labels('telegram', 'failed').inc(len(events))
+                with self.cond:
+                    # Try again on the next flush, ahead of anything newer; not acknowledged until then
+                    self.events[:0] = events
+                    self.pending += len(events)
+                return
+        FORWARDED.labels('telegram', 'sent').inc(len(events))
+        self._finish([(device, session, seq) for device, _, _, session, seq in events])
+
+    def _forward_readings(self, device, batch):
+        route = self.upstream.config.device(device)
+        updates = [(timestamp, thingspeak_fields(reading)) for timestamp, reading, _, _ in batch]
+        ok = self.upstream.bulk_update_thingspeak(route.thingspeak_channel, route.thingspeak_key, updates)
+        FORWARDED.labels('thingspeak', 'sent' if ok else 'failed').inc(len(batch))
+        # Readings are not retried, so they are finished either way
+        self._finish([(device, session, seq) for _, _, session, seq in batch])
+
+    def _run(self):
+        next_readings = time.monotonic() + self.flush_interval
+        while self.running:
+            with self.cond:
+                while self.running and not self.events:
+                    remaining = next_readings - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            if self.events and self.running:
+                # Give other events of the same incident a moment to arrive
+                time.sleep(self.event_latency)
+            due = time.monotonic() >= next_readings
+            try:
+                self.flush(readings=due or not self.running)
+            except Exception as e:
+                log.exception("Gateway flush failed: %s", e)
+            if due:
+                next_readings = time.monotonic() + self.flush_interval
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='gateway-flush', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the flusher after a last flush of everything pending"""
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def stats(self):
+        return {'pending': self.pending, 'dropped': self.dropped, 'devices': len(self.dedup.devices)}
+
+
+class GatewayServer(socketserver.ThreadingTCPServer):
+    """Accepts device connections and feeds their frame streams to a Gateway"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, gateway, address=('0.0.0.0', DEFAULT_PORT)):
+        self.gateway = gateway
+        super().__init__(address, _ConnectionHandler)
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.send_lock = threading.Lock()
+        self.reply = self._reply
+
+    def _reply(self, data):
+        # Called from the connection thread and the gateway's flusher
+        with self.send_lock:
+            self.request.sendall(data)
+
+    def handle(self):
+        gateway = self.server.gateway
+        reader = FrameReader(gateway.key)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                try:
+                    data = self.request.recv(65536)
+                except OSError:
+                    break
+                if not data:
+                    break
+                frames = reader.feed(data)
+                if frames:
+                    gateway.receive_many(frames, self.reply)
+        finally:
+            gateway.disconnect(self.reply)
+        if reader.rejected:
+            log.warning("Rejected %d frames with a bad MAC from %s", reader.rejected, self.client_address)
+        if reader.buffer:
+            log.debug("Connection from %s closed mid-frame", self.client_address)
+
+
+class LocalBroker(object):
+    """In-process stand-in for the TCP link
+
+    connect() returns a LocalConnection for one client; whatever it sends
+    goes straight to the subscribers, together with a reply callable that
+    lands in that connection's inbox.
+    """
+
+    def __init__(self):
+        self.handlers = []
+        self.messages = 0
+
+    def subscribe(self, handler):
+        """handler(data, reply), e.g. Gateway.submit"""
+        self.handlers.append(handler)
+
+    def connect(self):
+        return LocalConnection(self)
+
+    def deliver(self, data, reply):
+        self.messages += 1
+        for handler in self.handlers:
+            handler(data, reply)
+
+
+class LocalConnection(object):
+    """One client's side of a LocalBroker, with the transport interface GatewayClient uses"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.inbox = deque()
+        self.cond = threading.Condition()
+
+    def send(self, data):
+        self.broker.deliver(data, self._reply)
+
+    def _reply(self, data):
+        with self.cond:
+            self.inbox.append(data)
+            self.cond.notify()
+
+    def receive(self, timeout):
+        with self.cond:
+            if not self.inbox:
+                self.cond.wait(timeout)
+            data = b''.join(self.inbox)
+            self.inbox.clear()
+        return data
+
+    def close(self):
+        pass
+
+
+class TcpTransport(object):
+    """Persistent TCP connection to a gateway; reconnects on the next send after a failure"""
+
+    def __init__(self, address, timeout=5.0):
+        self.address = parse_address(address, DEFAULT_PORT) if isinstance(address, str) else address
+        self.timeout = timeout
+        self.sock = None
+
+    def send(self, data):
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address, timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self.sock.sendall(data)
+        except OSError:
+            self.close()
+            raise
+
+    def receive(self, timeout):
+        """Bytes from the gateway within timeout, b'' if none; OSError once the connection is gone"""
+        sock = self.sock
+        if sock is None:
+            time.sleep(timeout)
+            return b''
+        try:
+            readable, _, _ = select.select([sock], [], [], timeout)
+            if not readable:
+                return b''
+            data = sock.recv(65536)
+        except (OSError, ValueError) as e:
+            self.close()
+            raise ConnectionError(f"gateway connection lost: {e}")
+        if not data:
+            self.close()
+            raise ConnectionError("gateway closed the connection")
+        return data
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+class GatewayClient(object):
+    """Device side: frames packed into a preallocated buffer and sent in batches by a background thread
+
+    publish_sensor() packs and signs a frame in place (no per-message
+    allocation beyond the arguments) and returns; the sender thread writes
+    the buffer when it fills or after max_latency, and at once for events.
+    Sent batches stay in the backlog until the gateway acknowledges their
+    last frame. When the connection fails, or nothing comes back for
+    ack_timeout (longer than the gateway's flush interval) while batches
+    are outstanding, the client reconnects,
+    sends a SYNC with the oldest frame it still holds, and resends every
+    unacknowledged batch. The backlog holds at most max_backlog bytes;
+    beyond that the oldest batches are dropped and logged.
+    """
+
+    def __init__(self, device_id, transport, secret, buffer_bytes=16384, max_latency=0.05, max_backlog=1 << 20,
+                 retry_interval=2.0, ack_timeout=30.0):
+        self.device_id = device_id
+        self.transport = transport
+        self.key = _key(secret)
+        self.buffer_bytes = buffer_bytes
+        self.max_latency = max_latency
+        self.max_backlog = max_backlog
+        self.retry_interval = retry_interval
+        self.ack_timeout = ack_timeout
+        # Start time, so a restarted client's session is newer than any the gateway has seen from it
+        self.session = int(time.time()) & 0xFFFFFFFF
+        self.seq = 0
+        self.buffer = bytearray(buffer_bytes)
+        self.used = 0
+        self.first_at = None   # when the oldest frame in buffer was packed
+        self.backlog = deque()  # (last seq, bytes) not yet sent on the current connection
+        self.unacked = deque()  # (last seq, bytes) sent and waiting for an ACK
+        self.backlog_bytes = 0  # both deques
+        self.acked = 0
+        self.reader = FrameReader(self.key)
+        self.synced = False
+        self.last_heard = time.monotonic()
+        self.cond = threading.Condition()
+        self.running = True
+        self.connected = True
+        self.sent = 0
+        self.resent = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name='gateway-client', daemon=True)
+        self.thread.start()
+
+    def _room(self, size):
+        """Make room for size bytes in the buffer (caller holds the lock)"""
+        if self.used + size > self.buffer_bytes:
+            self._seal()
+        if self.used == 0:
+            if size > self.buffer_bytes:
+                raise ValueError(f"frame of {size} bytes does not fit a {self.buffer_bytes}-byte buffer")
+            # First frame of a batch: the sender starts its max_latency timer
+            self.first_at = time.monotonic()
+            self.cond.notify()
+
+    def _seal(self):
+        """Move the buffered frames to the backlog (caller holds the lock)"""
+        if not self.used:
+            return
+        self.backlog.append((self.seq, bytes(self.buffer[:self.used])))
+        self.backlog_bytes += self.used
+        self.used = 0
+        dropped = 0
+        while self.backlog_bytes > self.max_backlog:
+            # Oldest first: what is waiting for an ACK, then what was never sent
+            _, chunk = (self.unacked or self.backlog).popleft()
+            self.backlog_bytes -= len(chunk)
+            dropped += 1
+        if dropped:
+            self.dropped += dropped
+            self.synced = False  # tell the gateway not to wait for the dropped frames
+            CLIENT_DROPPED.inc(dropped)
+            log.warning("Gateway backlog full, dropped %d unacknowledged batches", dropped)
+        self.cond.notify()
+
+    def publish_sensor(self, timestamp, temperature, humidity, steps, x, y, z, magnitude, feeling, distance=None):
+        with self.cond:
+            self._room(SENSOR_FRAME_SIZE)
+            self.seq += 1
+            start = self.used
+            HEADER.pack_into(self.buffer, start, MAGIC, VERSION, SENSOR, self.device_id, self.session, self.seq,
+                             timestamp, SENSOR_PAYLOAD.size)
+            SENSOR_PAYLOAD.pack_into(self.buffer, start + HEADER.size, temperature, humidity, int(steps),
+                                     x, y, z, magnitude, feeling, math.nan if distance is None else distance)
+            signed = start + HEADER.size + SENSOR_PAYLOAD.size
+            with memoryview(self.buffer) as view:
+                self.buffer[signed:signed + MAC_SIZE] = sign(self.key, view[start:signed])
+            self.used += SENSOR_FRAME_SIZE
+
+    def publish_event(self, kind, message, timestamp=None):
+        """An alert or message; sent without waiting for the batch to fill, kept until acknowledged"""
+        with self.cond:
+            self.seq += 1
+            frame = encode_event(self.key, self.device_id, self.session, self.seq,
+                                 time.time() if timestamp is None else timestamp, kind, message)
+            self._room(len(frame))
+            self.buffer[self.used:self.used + len(frame)] = frame
+            self.used += len(frame)
+            self._seal()
+
+    def _on_ack(self, session, seq):
+        """Drop batches the gateway is done with (caller holds the lock)"""
+        if session != self.session or seq <= self.acked:
+            return
+        self.acked = seq
+        for queue in (self.unacked, self.backlog):
+            while queue and queue[0][0] <= seq:
+                _, chunk = queue.popleft()
+                self.backlog_bytes -= len(chunk)
+        self.cond.notify_all()
+
+    def _oldest_held(self):
+        """First seq the client still holds (caller holds the lock)"""
+        for queue in (self.unacked, self.backlog):
+            if queue:
+                return HEADER.unpack_from(queue[0][1], 0)[5]
+        if self.used:
+            return HEADER.unpack_from(self.buffer, 0)[5]
+        return self.seq + 1
+
+    def _reconnect(self):
+        """Forget the connection: everything unacknowledged goes out again (caller holds the lock)"""
+        self.transport.close()
+        self.reader = FrameReader(self.key)
+        self.synced = False
+        if self.unacked:
+            self.resent += len(self.unacked)
+            CLIENT_RESENT.inc(len(self.unacked))
+            self.backlog.extendleft(reversed(self.unacked))
+            self.unacked.clear()
+
+    def _next_chunk(self):
+        """Next batch to send, or None when there is only waiting for ACKs to do"""
+        with self.cond:
+            while self.running and not self.backlog:
+                if self.unacked:
+                    return None
+                if self.used:
+                    remaining = self.first_at + self.max_latency - time.monotonic()
+                    if remaining <= 0:
+                        self._seal()
+                        break
+                    self.cond.wait(remaining)
+                else:
+                    self.cond.wait()
+            if not self.running:
+                self._seal()
+            if self.backlog:
+                return self.backlog[0]
+            return None
+
+    def _send(self, item):
+        with self.cond:
+            sync = None
+            if not self.synced:
+                sync = encode_frame(self.key, SYNC, self.device_id, self.session, self._oldest_held(), time.time())
+                self.synced = True
+                self.last_heard = time.monotonic()
+        if sync is not None:
+            self.transport.send(sync)
+        self.transport.send(item[1])
+        with self.cond:
+            if self.backlog and self.backlog[0] is item:
+                self.backlog.popleft()
+                self.unacked.append(item)
+            self.sent += 1
+        CLIENT_SENT.inc()
+
+    def _receive(self, timeout):
+        data = self.transport.receive(timeout)
+        if not data:
+            return
+        frames = self.reader.feed(data)
+        with self.cond:
+            self.last_heard = time.monotonic()
+            for frame in frames:
+                if frame.kind == ACK and frame.device == self.device_id:
+                    self._on_ack(frame.session, frame.seq)
+
+    def _run(self):
+        while True:
+            item = self._next_chunk()
+            with self.cond:
+                if item is None and not self.unacked and not self.backlog and not self.running:
+                    return
+            try:
+                if item is not None:
+                    self._send(item)
+                    self._receive(0)
+                else:
+                    # Short waits, so batches published meanwhile do not sit behind a long receive
+                    self._receive(self.max_latency)
+                with self.cond:
+                    if self.unacked and time.monotonic() - self.last_heard > self.ack_timeout:
+                        raise ConnectionError(f"no reply from the gateway for {self.ack_timeout:g}s")
+            except OSError as e:
+                with self.cond:
+                    self._reconnect()
+                    if self.connected:
+                        log.warning("Gateway unreachable (%s), retrying every %.1fs", e, self.retry_interval)
+                        self.connected = False
+                    if not self.running:
+                        return
+                    self.cond.wait(self.retry_interval)
+                continue
+            if not self.connected and item is not None:
+                log.info("Gateway reachable again, %d bytes waiting", self.backlog_bytes)
+                self.connected = True
+
+    def flush(self):
+        with self.cond:
+            self._seal()
+
+    def close(self, timeout=None):
+        """Send what is buffered and wait (within timeout) for the gateway to acknowledge it, then stop"""
+        with self.cond:
+            self.running = False
+            self._seal()
+            self.cond.notify_all()
+        self.thread.join(timeout)
+        self.transport.close()
+
+    def stats(self):
+        return {'seq': self.seq, 'acked': self.acked, 'sent_batches': self.sent, 'resent_batches': self.resent,
+                'dropped_batches': self.dropped, 'backlog_bytes': self.backlog_bytes}
+
+
+def main(argv=None):
+    from log_setup import setup_logging
+
+    parser = argparse.ArgumentParser(description='Forward frames from monitoring devices to Telegram and ThingSpeak')
+    parser.add_argument('--listen', default=f'0.0.0.0:{DEFAULT_PORT}', help='address to accept devices on')
+    parser.add_argument('--config', help='upstream INI file (default MONITOR_UPSTREAM_CONFIG or upstream.ini)')
+    parser.add_argument('--flush-interval', type=float, default=15.0, help='seconds between ThingSpeak uploads')
+    parser.add_argument('--metrics-port', type=int, default=9111)
+    args = parser.parse_args(argv)
+
+    listener = setup_logging()
+    config = UpstreamConfig.load(args.config)
+    if not config.gateway_secret:
+        parser.error("no gateway secret configured ([gateway] secret or GATEWAY_SECRET)")
+    gateway = Gateway(Upstream(config, pool_size=8), secret=config.gateway_secret,
+                      flush_interval=args.flush_interval)
+    gateway.start()
+    metrics.start_http_server(args.metrics_port)
+    server = GatewayServer(gateway, parse_address(args.listen, DEFAULT_PORT))
+    log.info("Gateway listening on %s", args.listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        gateway.stop(timeout=30)
+        listener.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Lower runs first
+SENSOR = 0
+DISPLAY = 10
+
+PRIORITY_NAMES = {SENSOR: 'sensor', DISPLAY: 'display'}
+
+
+class _Waits(object):
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.transactions = 0
+
+
+class I2CArbiter(object):
+    """Priority lock for one I2C bus shared by threads
+
+    When the bus is released it goes to the waiter with the lowest
+    priority value (sensor reads before display writes), first come first
+    served within a priority. Reentrant for the owning thread. Tracks how
+    long each priority waited and how busy the bus was.
+    """
+
+    def __init__(self, bus=None, port=1):
+        if bus is None:
+            import smbus
+            bus = smbus.SMBus(port)
+        self.bus = bus
+        self.cond = threading.Condition()
+        self.owner = None
+        self.depth = 0
+        self.owned_since = 0.0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.busy_seconds = 0.0
+        self.started = time.monotonic()
+        self.waits = {}
+
+    def _stats(self, priority):
+        waits = self.waits.get(priority)
+        if waits is None:
+            waits = self.waits[priority] = _Waits()
+        return waits
+
+    def acquire(self, priority):
+        me = threading.get_ident()
+        with self.cond:
+            if self.owner == me:
+                self.depth += 1
+                return
+            waits = self._stats(priority)
+            waits.acquisitions += 1
+            if self.owner is not None or self.waiters:
+                self._wait_turn((priority, next(self.sequence), me), waits)
+            self.owner = me
+            self.depth = 1
+            self.owned_since = time.monotonic()
+
+    def _wait_turn(self, entry, waits):
+        """Queue entry and wait until it is first and the bus is free (caller holds cond)"""
+        heapq.heappush(self.waiters, entry)
+        waited = time.monotonic()
+        while self.owner is not None or self.waiters[0] is not entry:
+            self.cond.wait()
+        heapq.heappop(self.waiters)
+        waited = time.monotonic() - waited
+        waits.contended += 1
+        waits.wait_seconds += waited
+        waits.max_wait = max(waits.max_wait, waited)
+
+    def yield_to_urgent(self, priority):
+        """Let more urgent waiters use the bus, then take it back ahead of waiters of the same priority
+
+        Only for the owning thread, between two transactions of a sequence
+        that must not be interleaved with other clients at its priority.
+        """
+        me = threading.get_ident()
+        with self.cond:
+            if self.owner != me:
+                raise RuntimeError("cannot yield an I2C bus this thread does not hold")
+            if not self.preempted(priority):
+                return
+            depth = self.depth
+            self.busy_seconds += time.monotonic() - self.owned_since
+            self.owner = None
+            self.cond.notify_all()
+            # Sequence -1 sorts before every queued waiter of the same priority
+            self._wait_turn((priority, -1, me), self._stats(priority))
+            self.owner = me
+            self.depth = depth
+            self.owned_since = time.monotonic()
+
+    def release(self):
+        with self.cond:
+            if self.owner != threading.get_ident():
+                raise RuntimeError("cannot release an I2C bus this thread does not hold")
+            self.depth -= 1
+            if self.depth:
+                return
+            self.busy_seconds += time.monotonic() - self.owned_since
+            self.owner = None
+            if self.waiters:
+                self.cond.notify_all()
+
+    @contextmanager
+    def hold(self, priority):
+        self.acquire(priority)
+        try:
+            yield self.bus
+        finally:
+            self.release()
+
+    def preempted(self, priority):
+        """True when someone more urgent than priority is waiting for the bus"""
+        waiters = self.waiters
+        return bool(waiters) and waiters[0][0] < priority
+
+    def client(self, priority):
+        return ArbitratedBus(self, priority)
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            'utilization': self.busy_seconds / elapsed,
+            'priorities': {PRIORITY_NAMES.get(priority, str(priority)): {
+                'acquisitions': waits.acquisitions,
+                'transactions': waits.transactions,
+                'contended': waits.contended,
+                'wait_seconds': waits.wait_seconds,
+                'max_wait_seconds': waits.max_wait,
+            } for priority, waits in list(self.waits.items())},
+        }
+
+
+class ArbitratedBus(object):
+    """SMBus-like handle whose transactions go through an I2CArbiter at a fixed priority
+
+    Pass it as bus= to adxl345.ADXL345, or put it in place of the LCD
+    driver's SMBus with attach_display(). Inside batch() the calling
+    thread's consecutive transactions keep the bus instead of re-queueing
+    each time. Between two of them the bus goes to a strictly more urgent
+    client when one waits, and comes back before any client of the same
+    priority gets it, so an LCD refresh is never interleaved with another.
+    """
+
+    def __init__(self, arbiter, priority):
+        self.arbiter = arbiter
+        self.priority = priority
+        self.local = threading.local()  # batch depth of each thread using this client
+        self.waits = arbiter._stats(priority)
+
+    @contextmanager
+    def batch(self):
+        arbiter = self.arbiter
+        local = self.local
+        arbiter.acquire(self.priority)
+        local.depth = getattr(local, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            local.depth -= 1
+            arbiter.release()
+
+    def hold(self):
+        """Keep the bus for a whole sequence (e.g. a FIFO drain) without yielding in between"""
+        return self.arbiter.hold(self.priority)
+
+    def _call(self, method, *args):
+        arbiter = self.arbiter
+        if getattr(self.local, 'depth', 0):
+            arbiter.yield_to_urgent(self.priority)
+            self.waits.transactions += 1
+            return getattr(arbiter.bus, method)(*args)
+        arbiter.acquire(self.priority)
+        try:
+            self.waits.transactions += 1
+            return getattr(arbiter.bus, method)(*args)
+        finally:
+            arbiter.release()
+
+    def read_byte_data(self, address, register):
+        return self._call('read_byte_data', address, register)
+
+    def write_byte_data(self, address, register, value):
+        return self._call('write_byte_data', address, register, value)
+
+    def read_i2c_block_data(self, address, register, length):
+        return self._call('read_i2c_block_data', address, register, length)
+
+    def write_i2c_block_data(self, address, register, data):
+        return self._call('write_i2c_block_data', address, register, data)
+
+    def read_byte(self, address):
+        return self._call('read_byte', address)
+
+    def write_byte(self, address, value):
+        return self._call('write_byte', address, value)
+
+    def close(self):
+        pass  # the arbiter owns the underlying bus
+
+
+def attach_display(lcd, arbiter, priority=DISPLAY):
+    """Route an I2C_LCD_driver.lcd through the arbiter; returns its bus client or None
+
+    The driver keeps its SMBus at lcd.lcd_device.bus; drivers laid out
+    differently are left alone.
+    """
+    device = getattr(lcd, 'lcd_device', None)
+    if device is None or not hasattr(device, 'bus'):
+        return None
+    client = arbiter.client(priority)
+    device.bus = client
+    return client
@@ -1,17 +1,43 @@
 import RPi.GPIO as GPIO
+import time
 from time import sleep
+from alert_patterns import PatternOutput
 
 LED_PIN = 24
 
-GPIO.setmode(GPIO.BCM)
-GPIO.setwarnings(False)
-GPIO.setup(LED_PIN, GPIO.OUT)
-
 def blink_led(duration_seconds=5):
     print("🔴 Blinking LED...")
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setwarnings(False)
+    GPIO.setup(LED_PIN, GPIO.OUT)
     end_time = time.time() + duration_seconds
     while time.time() < end_time:
         GPIO.output(LED_PIN, 1)  # Turn LED ON
         sleep(1)                 # ON for 1 second
         GPIO.output(LED_PIN, 0)  # Turn LED OFF
         sleep(1)                 # OFF for 1 second
+
+
+class LedAlert(PatternOutput):
+    """Non-blocking LED patterns for fall, warning, inactivity and normal status"""
+
+    def __init__(self, pin=LED_PIN, scheduler=None):
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        GPIO.setup(pin, GPIO.OUT)
+        self.pin = pin
+        super().__init__(lambda level: GPIO.output(pin, level), scheduler)
+
+    def start_fall_alert(self, duration=60):
+        return self.start_alert(duration, pattern='urgent')
+
+    def start_warning_alert(self, duration=5):
+        return self.start_alert(duration, pattern='warning')
+
+    def start_inactive_warning(self, duration=60):
+        return self.start_alert(duration, pattern='inactive')
+
+    def start_normal_status(self):
+        # Slow heartbeat shown whenever no alert is playing
+        if self.background != 'normal':
+            self.set_background('normal')
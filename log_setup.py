@@ -0,0 +1,115 @@
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# All subsystem loggers live under this name: monitor.accel, monitor.ultrasonic, ...
+ROOT_LOGGER = 'monitor'
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s [%(threadName)s] %(message)s'
+
+# MONITOR_LOG_LEVEL=INFO sets the default, MONITOR_LOG_LEVELS=ultrasonic=DEBUG,accel=WARNING per subsystem
+LEVEL_ENV = 'MONITOR_LOG_LEVEL'
+SUBSYSTEM_LEVELS_ENV = 'MONITOR_LOG_LEVELS'
+
+
+def get_logger(subsystem):
+    return logging.getLogger(f'{ROOT_LOGGER}.{subsystem}')
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most burst records per message template every interval seconds
+
+    Only records at or below max_level are limited; by default that is
+    per-sample debug output, so operational info, warnings and errors
+    always get through. The next record that passes carries the number that
+    were dropped in between, so the console keeps a sampled signal.
+    """
+
+    def __init__(self, interval=5.0, burst=1, max_level=logging.DEBUG):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.max_level = max_level
+        self.windows = {}  # (logger, template) -> [window_start, passed, dropped]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                dropped = window[2] if window else 0
+                self.windows[key] = [now, 1, 0]
+                if len(self.windows) > 512:
+                    self.windows = {k: w for k, w in self.windows.items() if now - w[0] < self.interval}
+                if dropped:
+                    record.msg = f'{record.msg} (+{dropped} similar)'
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves %-formatting to the listener thread
+
+    The stock handler merges msg % args in the calling thread. Our log
+    arguments are numbers and strings, so the record can be queued as-is
+    and the sensor thread only pays for creating it.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def _parse_level(name, default):
+    if not name:
+        return default
+    level = logging.getLevelName(name.strip().upper())
+    return level if isinstance(level, int) else default
+
+
+def setup_logging(level=None, filename=None, console=True, debug_interval=5.0):
+    """Route all monitor.* loggers through one queue and a background listener
+
+    Returns the QueueListener; call its stop() on shutdown to flush.
+    """
+    level = _parse_level(os.environ.get(LEVEL_ENV), logging.INFO) if level is None else level
+
+    handlers = []
+    formatter = logging.Formatter(LOG_FORMAT)
+    if console:
+        stream = logging.StreamHandler()
+        stream.setFormatter(formatter)
+        handlers.append(stream)
+    if filename:
+        rotating = logging.handlers.RotatingFileHandler(filename, maxBytes=1_000_000, backupCount=3)
+        rotating.setFormatter(formatter)
+        handlers.append(rotating)
+
+    log_queue = queue.Queue(-1)
+    handler = DeferredQueueHandler(log_queue)
+    # Filtering runs in the caller, so sampled-out records never reach the queue
+    handler.addFilter(RateLimitFilter(interval=debug_interval, max_level=logging.DEBUG))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    root.propagate = False
+
+    for item in os.environ.get(SUBSYSTEM_LEVELS_ENV, '').split(','):
+        if '=' in item:
+            subsystem, name = item.split('=', 1)
+            get_logger(subsystem.strip()).setLevel(_parse_level(name, level))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
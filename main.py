@@ -1,37 +1,111 @@
-import keypad
-import I2C_LCD_driver
-from threading import Thread
+import bootstrap
+from threading import Thread, Event
 import queue
 import time
-import requests 
-import dht11
 import datetime
 from time import sleep
-import RPi.GPIO as GPIO
 import csv
 import os
 import math
 import random
+from contextlib import nullcontext
+from daily_aggregates import DailyAggregates
+from posture import PostureTracker
+from orientation import orientation_batch, is_moving
+from sampling_profiles import SamplingController
+from calibration import AutoCalibrator
+from fall_detection import FallDetector
+from presence import OccupancyEngine, ENTRY
+from ranging import RangeFinder
+from fall_capture import FallCapture, CaptureStore
+from fall_classifier import FallClassifier
+from activity_fusion import ActivityFusion
+from checkin_scheduler import CheckinScheduler, CheckinConfig, PROMPTED, COMPLETED, MISSED, SKIPPED
+from i2c_arbiter import I2CArbiter, SENSOR, attach_display
+from alert_rules import AlertRuleEngine, make_event, FALL, INACTIVITY, ABSENCE, MISSED_CHECKIN, SENSOR_OFFLINE
+from event_bus import (EventBus, ACCEL, DISTANCE, CLIMATE, KEYPAD, ALERT, OCCUPANCY, FALL_CAPTURE, BLOCK,
+                       AccelSample, DistanceReading, ClimateReading, KeyPress)
+import metrics
+import profiling
+from log_setup import setup_logging, get_logger
+from supervisor import Supervisor
+from shutdown import Shutdown, save_checkpoint, load_checkpoint
+from upstream import UpstreamConfig, Upstream
+from gateway import GatewayClient, TcpTransport
+
+# Hardware and network modules (RPi.GPIO, I2C_LCD_driver, dht11, keypad, requests)
+# are imported lazily by main() so fall detection can start before they load
+GPIO = None
+range_finder = None
+checkin_scheduler = None
 
 # Shared components
 shared_keypad_queue = queue.Queue()
 lcd = None
+fall_detection_ready = Event()  # set once the accelerometer loop has processed a sample
+# Restarts monitoring threads that crash or stop heartbeating, and pings the systemd watchdog
+supervisor = Supervisor()
+# SIGTERM/SIGINT end the main loop; cleanup then runs within SHUTDOWN_DEADLINE seconds
+SHUTDOWN_DEADLINE = 10
+shutdown = Shutdown(deadline=SHUTDOWN_DEADLINE)
+
+# Daily counters and aggregates survive restarts through this checkpoint
+CHECKPOINT_FILE = 'monitor_state.json'
+CHECKPOINT_INTERVAL = 300  # also saved on shutdown; this bounds the loss on a crash
+i2c_arbiter = None  # serializes I2C bus 1 between the LCD and the accelerometer
+display_bus = None  # the LCD's client of i2c_arbiter, for batching screen refreshes
+# Telegram/ThingSpeak directly over pooled connections, or through an edge gateway when one is configured
+upstream = Upstream(UpstreamConfig())
+gateway_client = None
+
+# Per-subsystem loggers; setup_logging() in main() moves formatting and I/O to a listener thread
+log = get_logger('main')
+accel_log = get_logger('accel')
+ultrasonic_log = get_logger('ultrasonic')
+checkin_log = get_logger('checkin')
+net_log = get_logger('net')
+
+# Sensor threads publish here; loggers, detectors and notifiers subscribe
+event_bus = EventBus()
+
+# Metrics, scraped from http://<pi>:9110/metrics (children are bound once, outside the loops)
+METRICS_PORT = 9110
+LOOP_SECONDS = metrics.histogram('loop_duration_seconds', 'Time spent in one loop iteration, excluding the trailing sleep', ('loop',))
+ACCEL_LOOP_SECONDS = LOOP_SECONDS.labels('accelerometer')
+ULTRASONIC_LOOP_SECONDS = LOOP_SECONDS.labels('ultrasonic')
+MAIN_LOOP_SECONDS = LOOP_SECONDS.labels('main')
+ACCEL_SAMPLES = metrics.counter('accel_samples_total', 'Accelerometer samples processed')
+STEPS = metrics.counter('steps_total', 'Steps detected')
+I2C_ERRORS = metrics.counter('i2c_errors_total', 'Failed accelerometer reads')
+ACCEL_POLL_INTERVAL = metrics.gauge('accel_poll_interval_seconds', 'Current accelerometer poll interval')
+ULTRASONIC_INTERVAL = metrics.gauge('ultrasonic_poll_interval_seconds', 'Current delay between ultrasonic readings')
+PRESENCE_CONFIDENCE = metrics.gauge('presence_confidence', 'Confidence that someone is in front of the ultrasonic sensor')
+CHECKINS = metrics.counter('checkins_total', 'Scheduled check-ins by outcome', ('outcome',))
+OCCUPANCY_EVENTS = metrics.counter('occupancy_events_total', 'Room entries and exits', ('kind',))
+ALERTS_SENT = metrics.counter('alerts_sent_total', 'Alerts delivered by channel', ('channel', 'kind'))
+FALL_CANDIDATES = metrics.counter('fall_candidates_total', 'Fall candidates by outcome', ('outcome',))
+FALL_CANDIDATES_CONFIRMED = FALL_CANDIDATES.labels('confirmed')
+FALL_CANDIDATES_REJECTED = FALL_CANDIDATES.labels('rejected')
 
 # Ultrasonic sensor pins
 TRIG_PIN = 23
 ECHO_PIN = 24
 
+# Alert LED (led_alert.LED_PIN is GPIO24, which is the ECHO pin on this board)
+ALERT_LED_PIN = 25
+
 # Daily tracking variables
 daily_data = {
-    'steps_start': 0,
     'eaten_count': 0,
     'walked_count': 0,
-    'feeling_ratings': [],
     'checkins_completed': 0,
     'checkins_missed': 0,
     'last_reset_date': datetime.date.today()
 }
 
+# Running per-day/per-hour aggregates (feeling, steps, active minutes, posture, presence)
+daily_aggregates = DailyAggregates()
+
 # Accelerometer mock class (use real adxl345 if available)
 try:
     import adxl345
@@ -41,16 +115,28 @@ except ImportError:
             R_100 = 0
         class Range:
             G_16 = 0
-        def _init_(self, i2c_port=1, address=0x53):
+        def __init__(self, i2c_port=1, address=0x53, bus=None, calib_file=None):
             pass
         def load_calib_value(self):
             pass
         def set_data_rate(self, rate):
             pass
+        def set_data_rate_hz(self, rate_hz, low_power=False):
+            pass
         def set_range(self, rng, full_res=True):
             pass
         def measure_start(self):
             pass
+        def set_power_mode(self, link=False, auto_sleep=False, wakeup_hz=8):
+            pass
+        def set_activity_detection(self, act_g=0.25, inact_g=0.1875, inact_seconds=30):
+            pass
+        def set_free_fall_detection(self, threshold_g=0.375, time_ms=100):
+            pass
+        def enable_interrupts(self, mask):
+            pass
+        def read_activity_flags(self):
+            return False, False, False
         def get_3_axis_adjusted(self):
             return (
                 random.uniform(-0.05, 0.2),
@@ -60,66 +146,22 @@ except ImportError:
     adxl345 = type('adxl345', (), {'ADXL345': MockADXL345, 'DataRate': MockADXL345.DataRate, 'Range': MockADXL345.Range})
 
 def key_pressed(key):
+    now = time.time()
     shared_keypad_queue.put(key)
+    event_bus.publish(KEYPAD, KeyPress(now, key))
+    if checkin_scheduler:
+        checkin_scheduler.notify_interaction(now)
 
-GPIO.setmode(GPIO.BCM)
-
-# Setup ultrasonic sensor pins
-GPIO.setup(TRIG_PIN, GPIO.OUT)
-GPIO.setup(ECHO_PIN, GPIO.IN)
-
-def get_distance():
-    """Get distance from ultrasonic sensor in cm with debug output"""
-    try:
-        # Send trigger pulse
-        GPIO.output(TRIG_PIN, GPIO.HIGH)
-        time.sleep(0.00001)  # 10 microseconds
-        GPIO.output(TRIG_PIN, GPIO.LOW)
-        
-        # Initialize variables to avoid reference errors
-        pulse_start = 0
-        pulse_end = 0
-        
-        # Measure echo time with timeout
-        timeout = time.time() + 1  # 1 second timeout
-        
-        # Wait for echo start
-        while GPIO.input(ECHO_PIN) == GPIO.LOW:
-            pulse_start = time.time()
-            if pulse_start > timeout:
-                print("ULTRASONIC DEBUG: Timeout waiting for echo start")
-                return None
-        
-        # Wait for echo end
-        while GPIO.input(ECHO_PIN) == GPIO.HIGH:
-            pulse_end = time.time()
-            if pulse_end > timeout:
-                print("ULTRASONIC DEBUG: Timeout waiting for echo end")
-                return None
-        
-        # Validate that we have valid pulse times
-        if pulse_end <= pulse_start:
-            print("ULTRASONIC DEBUG: Invalid pulse timing")
-            return None
-        
-        # Calculate distance
-        pulse_duration = pulse_end - pulse_start
-        distance = pulse_duration * 17150  # Speed of sound = 34300 cm/s, divide by 2
-        distance = round(distance, 2)
-        
-        # Debug output
-        print(f"ULTRASONIC DEBUG: Pulse duration: {pulse_duration:.6f}s, Distance: {distance}cm")
-        
-        # Return distance if within reasonable range
-        if 2 <= distance <= 400:  # Minimum 2cm, maximum 400cm
-            return distance
-        else:
-            print(f"ULTRASONIC DEBUG: Distance {distance}cm out of valid range (2-400cm)")
-            return None
-            
-    except Exception as e:
-        print(f"ULTRASONIC DEBUG: Error reading sensor: {e}")
-        return None
+def setup_ultrasonic():
+    """Import RPi.GPIO and set up temperature-compensated ranging on the ultrasonic sensor"""
+    global GPIO, range_finder
+    import RPi.GPIO as GPIO
+    GPIO.setmode(GPIO.BCM)
+    range_finder = RangeFinder(GPIO, TRIG_PIN, ECHO_PIN)
+    range_finder.setup()
+    # Speed of sound follows the DHT11 readings published by the display refresh
+    event_bus.subscribe(CLIMATE, range_finder.on_climate, name='ranging', maxsize=10)
+    return range_finder
 
 def reset_daily_data_if_new_day():
     """Reset daily tracking data if it's a new day"""
@@ -127,44 +169,66 @@ def reset_daily_data_if_new_day():
     current_date = datetime.date.today()
     
     if current_date != daily_data['last_reset_date']:
-        print(f"New day detected! Resetting daily data from {daily_data['last_reset_date']} to {current_date}")
+        log.info("New day detected, resetting daily data from %s to %s", daily_data['last_reset_date'], current_date)
         
         # Save previous day's summary to file before reset
         save_daily_summary_to_file()
         
-        # Reset counters but preserve step baseline
+        # Reset counters (aggregates roll over to the new date on their own)
         daily_data = {
-            'steps_start': 0,  # Will be updated when accelerometer starts
             'eaten_count': 0,
             'walked_count': 0,
-            'feeling_ratings': [],
             'checkins_completed': 0,
             'checkins_missed': 0,
             'last_reset_date': current_date
         }
 
+def checkpoint_state():
+    """Save daily counters and aggregates for the next start"""
+    save_checkpoint(CHECKPOINT_FILE, {
+        'saved_at': time.time(),
+        'daily_data': dict(daily_data, last_reset_date=daily_data['last_reset_date'].isoformat()),
+        'daily_aggregates': daily_aggregates.to_dict(),
+    })
+
+def restore_state():
+    """Load the last checkpoint; a checkpoint from yesterday is rolled over by reset_daily_data_if_new_day()"""
+    global daily_data
+    state = load_checkpoint(CHECKPOINT_FILE, max_age=2 * 86400)
+    if not state:
+        return False
+    saved = state['daily_data']
+    daily_data = dict(daily_data, **saved)
+    daily_data['last_reset_date'] = datetime.date.fromisoformat(saved['last_reset_date'])
+    daily_aggregates.restore(state['daily_aggregates'])
+    log.info("Restored daily data for %s from checkpoint saved %.0fs ago",
+             daily_data['last_reset_date'], time.time() - state['saved_at'])
+    return True
+
 def save_daily_summary_to_file():
     """Save daily summary to CSV file"""
     filename = "daily_summaries.csv"
     file_exists = os.path.isfile(filename)
     
-    avg_feeling = sum(daily_data['feeling_ratings']) / len(daily_data['feeling_ratings']) if daily_data['feeling_ratings'] else 0
+    summary = daily_aggregates.summary(daily_data['last_reset_date'])
     
     with open(filename, "a", newline="") as csvfile:
         writer = csv.writer(csvfile)
         
         if not file_exists:
             writer.writerow(['Date', 'Steps_Taken', 'Eaten_Count', 'Walked_Count', 'Avg_Feeling', 
-                           'Checkins_Completed', 'Checkins_Missed'])
+                           'Checkins_Completed', 'Checkins_Missed', 'Active_Minutes', 'Presence_Minutes'])
         
         writer.writerow([
             daily_data['last_reset_date'],
-            0,  # Steps will be calculated properly in the actual implementation
+            summary['steps'],
             daily_data['eaten_count'],
             daily_data['walked_count'],
-            round(avg_feeling, 1),
+            round(summary['avg_feeling'], 1),
             daily_data['checkins_completed'],
-            daily_data['checkins_missed']
+            daily_data['checkins_missed'],
+            round(summary['active_minutes'], 1),
+            round(summary['presence_minutes'], 1)
         ])
 
 def display_daily_summary():
@@ -173,8 +237,10 @@ def display_daily_summary():
     
     reset_daily_data_if_new_day()
     
-    # Calculate average feeling
-    avg_feeling = sum(daily_data['feeling_ratings']) / len(daily_data['feeling_ratings']) if daily_data['feeling_ratings'] else 0
+    # Read today's running aggregates
+    summary = daily_aggregates.summary()
+    avg_feeling = summary['avg_feeling']
+    steps_today = summary['steps']
     
     # Determine if user has eaten or walked today
     has_eaten_today = "Yes" if daily_data['eaten_count'] > 0 else "No"
@@ -183,7 +249,7 @@ def display_daily_summary():
     # Display summary across multiple screens
     screens = [
         # Screen 1: Date and Steps
-        [f"Summary {datetime.date.today().strftime('%m/%d')}", f"Steps today: {daily_data.get('steps_today', 0)}"],
+        [f"Summary {datetime.date.today().strftime('%m/%d')}", f"Steps today: {steps_today}"],
         
         # Screen 2: Activities
         [f"Eaten: {has_eaten_today} ({daily_data['eaten_count']}x)", f"Walked: {has_walked_today} ({daily_data['walked_count']}x)"],
@@ -197,23 +263,23 @@ def display_daily_summary():
     
     print("\n=== DAILY SUMMARY ===")
     print(f"Date: {datetime.date.today()}")
-    print(f"Steps taken today: {daily_data.get('steps_today', 0)}")
+    print(f"Steps taken today: {steps_today}")
     print(f"Times eaten: {daily_data['eaten_count']}")
     print(f"Times walked: {daily_data['walked_count']}")
     print(f"Average feeling: {avg_feeling:.1f}/9")
     print(f"Check-ins completed: {daily_data['checkins_completed']}")
     print(f"Check-ins missed: {daily_data['checkins_missed']}")
+    print(f"Active minutes: {summary['active_minutes']:.1f}")
+    print(f"Time present: {summary['presence_minutes']:.1f} min")
+    for posture, seconds in summary['posture_seconds'].items():
+        print(f"{posture}: {seconds / 60:.1f} min")
     print(f"Has eaten today: {has_eaten_today}")
     print(f"Has walked today: {has_walked_today}")
     print("====================\n")
     
     # Display on LCD
     for i, screen in enumerate(screens):
-        lcd.lcd_clear()
-        time.sleep(0.1)
-        lcd.lcd_display_string(screen[0], 1)
-        time.sleep(0.1)
-        lcd.lcd_display_string(screen[1], 2)
+        show_screen(screen[0], screen[1])
         
         if i < len(screens) - 1:  # Don't wait after last screen
             time.sleep(3)  # Show each screen for 3 seconds
@@ -225,11 +291,13 @@ def is_sleep_time():
     current_hour = datetime.datetime.now().hour
     return current_hour >= 22 or current_hour < 6
 
+@profiling.timed('net', 'thingspeak')
 def upload_to_thingspeak(temperature, humidity, steps, x, y, z, magnitude, user_feeling, distance=None):
-    API_KEY = 'AVURSRXZ07INDOZO'  # Replace with your actual ThingSpeak Write API Key
-    url = "https://api.thingspeak.com/update"
-    params = {
-        'api_key': API_KEY,
+    if gateway_client:
+        gateway_client.publish_sensor(time.time(), temperature, humidity, steps, x, y, z, magnitude, user_feeling,
+                                      distance)
+        return True
+    fields = {
         'field1': temperature,
         'field2': humidity,
         'field3': steps,
@@ -239,27 +307,17 @@ def upload_to_thingspeak(temperature, humidity, steps, x, y, z, magnitude, user_
         'field7': magnitude,
         'field8': user_feeling
     }
-    try:
-        response = requests.get(url, params=params, timeout=5)
-        print(f"ThingSpeak response status: {response.status_code}")
-        print(f"ThingSpeak response text: {response.text}")
-        return response.status_code == 200
-    except Exception as e:
-        print(f"Exception during ThingSpeak upload: {e}")
-        return False
+    return upstream.update_thingspeak(fields)
 
-def send_telegram_message(message):
-    TELEGRAM_BOT_TOKEN = '7885273126:AAEpr5Dy9bUXYE3kf9lEH1ww2bXsByE9y5c'
-    TELEGRAM_CHAT_ID = '6101168212'
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    data = {"chat_id": TELEGRAM_CHAT_ID, "text": message}
-    try:
-        response = requests.post(url, data=data, timeout=5)
-        print("Telegram message sent successfully")
+@profiling.timed('net', 'telegram')
+def send_telegram_message(message, kind='message'):
+    if gateway_client:
+        gateway_client.publish_event(kind, message)
         return True
-    except Exception as e:
-        print(f"Failed to send Telegram message: {e}")
-        return False
+    if upstream.send_telegram(message):
+        net_log.info("Telegram message sent")
+        return True
+    return False
 
 def get_magnitude(x, y, z):
     return math.sqrt(x*x + y*y + z*z)  # Fixed the syntax error
@@ -269,222 +327,185 @@ def detect_fall(prev_magnitude, curr_magnitude, threshold=0.1):
         return False
     diff = abs(curr_magnitude - prev_magnitude)
     time.sleep(5)  # Simulate processing delay
-    print(f"Magnitude: {curr_magnitude:.5f}, Prev: {prev_magnitude:.5f}, Diff: {diff:.5f}")
+    accel_log.debug("Magnitude: %.5f, prev: %.5f, diff: %.5f", curr_magnitude, prev_magnitude, diff)
     return diff > threshold
 
 def ultrasonic_monitoring_thread(shared_data):
-    """Thread for ultrasonic sensor monitoring with enhanced debug output"""
-    print("Ultrasonic sensor monitoring started...")
-    print("ULTRASONIC DEBUG: Sensor initialized on pins TRIG={}, ECHO={}".format(TRIG_PIN, ECHO_PIN))
-    
-    # Variables for proximity detection
-    person_present_threshold = 200  # cm - person considered present if closer than 2m
-    person_absent_threshold = 300   # cm - person considered absent if farther than 3m
-    person_present = False
-    last_presence_change = time.time()
-    absence_alert_sent = False
+    """Thread for ultrasonic presence monitoring (filtered, confidence-based occupancy)"""
+    ultrasonic_log.info("Ultrasonic monitoring started on TRIG=%d, ECHO=%d", TRIG_PIN, ECHO_PIN)
+    
+    # Person considered present closer than 2m, absent farther than 3m; the engine
+    # filters readings and reads faster while occupancy is changing
+    occupancy = OccupancyEngine(present_distance=200, absent_distance=300)
+    last_reading_time = None
     prolonged_absence_threshold = 1800  # 30 minutes
+    failed_readings = 0
+    offline_after = 30  # consecutive failed readings before reporting the sensor offline
     
     # Debug counter for periodic status
     debug_counter = 0
     
-    while shared_data['running']:
+    while shared_data['running'] and supervisor.beat():
+        loop_start = time.perf_counter()
         try:
-            distance = get_distance()
+            with profiling.stage('ultrasonic', 'ranging'):
+                distance = range_finder.measure()
             debug_counter += 1
+            current_time = time.time()
+            
+            with profiling.stage('ultrasonic', 'occupancy'):
+                event = occupancy.update(distance, current_time)
+            person_present = occupancy.present
+            PRESENCE_CONFIDENCE.set(occupancy.confidence)
+            
+            # Accumulate time present since the previous reading
+            if person_present and last_reading_time is not None:
+                daily_aggregates.record('presence_seconds', current_time - last_reading_time)
+            last_reading_time = current_time
+            
+            if event:
+                OCCUPANCY_EVENTS.labels(event.kind).inc()
+                if event.kind == ENTRY:
+                    ultrasonic_log.info("Person entered at %.0fcm (confidence %.2f)", event.distance, event.confidence)
+                else:
+                    ultrasonic_log.info("Person left, distance %.0fcm, was present for %.0fs",
+                                        event.distance, event.duration)
+                event_bus.publish(OCCUPANCY, event)
             
             if distance is not None:
-                current_time = time.time()
+                failed_readings = 0
                 
                 # Enhanced debug output every 10 readings
                 if debug_counter % 10 == 0:
-                    print(f"ULTRASONIC STATUS: Distance={distance}cm, Present={person_present}, "
-                          f"Threshold_Present={person_present_threshold}cm, Threshold_Absent={person_absent_threshold}cm")
+                    ultrasonic_log.info("Distance=%scm (filtered %.0fcm), present=%s, confidence=%.2f, interval=%.1fs",
+                                        distance, occupancy.distance or 0, person_present, occupancy.confidence,
+                                        occupancy.interval)
                 
-                # Determine presence status
-                if distance < person_present_threshold:
-                    if not person_present:
-                        person_present = True
-                        last_presence_change = current_time
-                        absence_alert_sent = False
-                        print(f"ULTRASONIC: Person detected at {distance}cm")
-                        
-                elif distance > person_absent_threshold:
-                    if person_present:
-                        person_present = False
-                        last_presence_change = current_time
-                        print(f"ULTRASONIC: Person left area, distance: {distance}cm")
+                # Check for prolonged absence (the rule engine handles wake hours and repeats)
+                absence_duration = 0 if person_present else occupancy.state_duration(current_time)
+                if absence_duration > prolonged_absence_threshold:
+                    absence_minutes = int(absence_duration / 60)
+                    alert_msg = f"⚠ PROLONGED ABSENCE ALERT: No person detected for {absence_minutes} minutes. Please check on the elderly person."
+                    # One alert per absence episode: keyed by when the person left
+                    event_bus.publish(ALERT, make_event(ABSENCE, alert_msg, key=occupancy.state_since,
+                                                        timestamp=current_time))
                 
-                # Check for prolonged absence (only during wake hours)
-                if not person_present and not is_sleep_time():
-                    absence_duration = current_time - last_presence_change
-                    
-                    if absence_duration > prolonged_absence_threshold and not absence_alert_sent:
-                        absence_minutes = int(absence_duration / 60)
-                        alert_msg = f"⚠ PROLONGED ABSENCE ALERT: No person detected for {absence_minutes} minutes. Please check on the elderly person."
-                        print(alert_msg)
-                        send_telegram_message(alert_msg)
-                        absence_alert_sent = True
+                with profiling.stage('ultrasonic', 'publish'):
+                    event_bus.publish(DISTANCE, DistanceReading(current_time, occupancy.distance, person_present,
+                                                                    occupancy.confidence))
                 
                 # Update shared data
-                shared_data.update({
-                    'distance': distance,
-                    'person_present': person_present,
-                    'absence_duration': current_time - last_presence_change if not person_present else 0
-                })
+                with profiling.stage('ultrasonic', 'shared_data'):
+                    shared_data.update({
+                        'distance': round(occupancy.distance, 1),
+                        'person_present': person_present,
+                        'presence_confidence': occupancy.confidence,
+                        'absence_duration': absence_duration
+                    })
                 
             else:
                 shared_data['distance'] = None
+                failed_readings += 1
                 if debug_counter % 5 == 0:  # Show error every 5 attempts
-                    print("ULTRASONIC DEBUG: Failed to get distance reading")
+                    ultrasonic_log.info("Failed to get distance reading (%d in a row)", failed_readings)
+                if failed_readings >= offline_after:
+                    event_bus.publish(ALERT, make_event(
+                        SENSOR_OFFLINE, f"⚠ SENSOR OFFLINE: Ultrasonic sensor failed {failed_readings} readings in a row.",
+                        key='ultrasonic'))
                 
         except Exception as e:
-            print(f"ULTRASONIC DEBUG: Error in monitoring: {e}")
+            ultrasonic_log.exception("Error in monitoring: %s", e)
         
-        time.sleep(1)  # Check every second
+        ULTRASONIC_LOOP_SECONDS.observe(time.perf_counter() - loop_start)
+        # Fast while occupancy is changing, slow once it has been stable
+        ULTRASONIC_INTERVAL.set(occupancy.interval)
+        time.sleep(occupancy.interval)
 
 def scheduled_checkin_thread(shared_data):
-    """Thread for scheduled check-ins every 4 hours during wake hours"""
-    print("Scheduled check-in monitoring started...")
+    """Thread for scheduled check-ins; sleeps until one is due or the user interacts"""
+    global checkin_scheduler
+    checkin_log.info("Scheduled check-in monitoring started")
     
-    checkin_interval = 4 * 3600  # 4 hours in seconds
-    checkin_timeout = 300  # 5 minutes to respond to check-in
-    last_checkin_time = time.time()
-    waiting_for_checkin = False
-    checkin_start_time = 0
+    def on_schedule(next_due, waiting):
+        shared_data.update({
+            'waiting_for_checkin': waiting,
+            'next_checkin_in': 0 if waiting else max(next_due - time.time(), 0)
+        })
     
-    while shared_data['running']:
-        try:
-            current_time = time.time()
-            
-            # Check if it's time for a scheduled check-in (only during wake hours)
-            if not is_sleep_time() and not waiting_for_checkin:
-                time_since_last_checkin = current_time - last_checkin_time
-                
-                if time_since_last_checkin >= checkin_interval:
-                    # Trigger check-in
-                    waiting_for_checkin = True
-                    checkin_start_time = current_time
-                    
-                    # Display check-in prompt on LCD
-                    lcd.lcd_clear()
-                    time.sleep(0.1)
-                    lcd.lcd_display_string("CHECK-IN TIME!", 1)
-                    time.sleep(0.1)
-                    lcd.lcd_display_string("Press 1 or 2", 2)
-                    
-                    # Send telegram notification
-                    checkin_msg = "🔔 SCHEDULED CHECK-IN: Please confirm you are okay by pressing 1 (eaten) or 2 (walked) on the device."
-                    send_telegram_message(checkin_msg)
-                    
-                    print("Scheduled check-in triggered - waiting for user response...")
-            
-            # Check if waiting for check-in response
-            if waiting_for_checkin:
-                time_waiting = current_time - checkin_start_time
-                
-                # Check if user has responded (look for any recent activity)
-                if shared_data.get('last_user_interaction', 0) > checkin_start_time:
-                    # User has responded
-                    waiting_for_checkin = False
-                    last_checkin_time = current_time
-                    daily_data['checkins_completed'] += 1
-                    print("Check-in completed by user interaction")
-                    
-                    # Clear check-in display
-                    show_temp_humidity_display(shared_data.get('dht_instance'))
-                    
-                elif time_waiting > checkin_timeout:
-                    # Check-in timeout - send alert
-                    waiting_for_checkin = False
-                    last_checkin_time = current_time  # Reset to avoid immediate re-trigger
-                    daily_data['checkins_missed'] += 1
-                    
-                    alert_msg = f"🚨 MISSED CHECK-IN ALERT: No response to scheduled check-in for {int(checkin_timeout/60)} minutes. Please check on the elderly person immediately!"
-                    print(alert_msg)
-                    send_telegram_message(alert_msg)
-                    
-                    # Clear check-in display
-                    show_temp_humidity_display(shared_data.get('dht_instance'))
-                    
-                    print("Check-in timeout - alert sent")
-            
-            # Update shared data
-            shared_data.update({
-                'waiting_for_checkin': waiting_for_checkin,
-                'next_checkin_in': checkin_interval - (current_time - last_checkin_time) if not waiting_for_checkin else 0
-            })
-            
-        except Exception as e:
-            print(f"Error in scheduled check-in: {e}")
+    def on_prompt(now):
+        CHECKINS.labels(PROMPTED).inc()
+        # Display check-in prompt on LCD
+        show_screen("CHECK-IN TIME!", "Press 1 or 2")
         
-        time.sleep(10)  # Check every 10 seconds
+        # Send telegram notification
+        checkin_msg = "🔔 SCHEDULED CHECK-IN: Please confirm you are okay by pressing 1 (eaten) or 2 (walked) on the device."
+        send_telegram_message(checkin_msg)
+    
+    def on_completed(now, response_seconds):
+        CHECKINS.labels(COMPLETED).inc()
+        daily_data['checkins_completed'] += 1
+        # Clear check-in display
+        show_temp_humidity_display(shared_data.get('dht_instance'))
+    
+    def on_skipped(now):
+        # The person used the device recently, which is what the check-in asks for
+        CHECKINS.labels(SKIPPED).inc()
+        daily_data['checkins_completed'] += 1
+    
+    def on_missed(now):
+        CHECKINS.labels(MISSED).inc()
+        daily_data['checkins_missed'] += 1
+        timeout_minutes = int(checkin_scheduler.config.response_timeout / 60)
+        alert_msg = f"🚨 MISSED CHECK-IN ALERT: No response to scheduled check-in for {timeout_minutes} minutes. Please check on the elderly person immediately!"
+        event_bus.publish(ALERT, make_event(MISSED_CHECKIN, alert_msg, timestamp=now))
+        # Clear check-in display
+        show_temp_humidity_display(shared_data.get('dht_instance'))
+    
+    checkin_scheduler = CheckinScheduler(
+        CheckinConfig.load(),
+        # Defer while the person is visibly up and about
+        activity=lambda now: activity_fusion.state(now).activity,
+        heartbeat=lambda: shared_data['running'] and supervisor.beat(),
+        on_prompt=on_prompt, on_completed=on_completed, on_missed=on_missed,
+        on_skipped=on_skipped, on_schedule=on_schedule)
+    checkin_scheduler.run()
 
 # Add these global variables after your existing global variables
 buzzer_alert = None
 led_alert = None
+alert_engine = None
+fall_detector = FallDetector()
+# Accelerometer, ultrasonic and keypad evidence combined; gates contradictory alerts
+activity_fusion = ActivityFusion()
 
 # Modify the detect_fall function
 def detect_fall(prev_magnitude, curr_magnitude, threshold=0.1):
     if prev_magnitude is None:
         return False
     diff = abs(curr_magnitude - prev_magnitude)
-    print(f"Magnitude: {curr_magnitude:.5f}, Prev: {prev_magnitude:.5f}, Diff: {diff:.5f}")
+    accel_log.debug("Magnitude: %.5f, prev: %.5f, diff: %.5f", curr_magnitude, prev_magnitude, diff)
     
     # Enhanced fall detection logic
     if diff > threshold:
-        print("⚠️  POTENTIAL FALL DETECTED!")
-        print(f"Magnitude difference: {diff:.5f} (threshold: {threshold})")
+        accel_log.warning("Potential fall: magnitude difference %.5f (threshold %s)", diff, threshold)
         return True
     return False
 
 # Enhanced fall detection and alert function
-def handle_fall_detection(x, y, z, magnitude):
-    """Enhanced fall detection with multiple criteria"""
-    global buzzer_alert, led_alert
-    
-    # Multiple fall detection criteria
-    fall_detected = False
-    fall_reason = ""
-    
-    # Criterion 1: High impact detection (sudden change in acceleration)
-    if hasattr(handle_fall_detection, 'prev_magnitude'):
-        magnitude_diff = abs(magnitude - handle_fall_detection.prev_magnitude)
-        if magnitude_diff > 0.15:  # Adjusted threshold
-            fall_detected = True
-            fall_reason = f"High impact detected (diff: {magnitude_diff:.3f})"
-    
-    # Criterion 2: Orientation check (if person is lying down suddenly)
-    pitch = math.degrees(math.atan2(x, math.sqrt(y*y + z*z)))
-    roll = math.degrees(math.atan2(y, math.sqrt(x*x + z*z)))
-    
-    if abs(pitch) > 70 or abs(roll) > 70:
-        # Check if this is a sudden change to lying position
-        if hasattr(handle_fall_detection, 'prev_pitch') and hasattr(handle_fall_detection, 'prev_roll'):
-            pitch_change = abs(pitch - handle_fall_detection.prev_pitch)
-            roll_change = abs(roll - handle_fall_detection.prev_roll)
-            
-            if pitch_change > 45 or roll_change > 45:
-                fall_detected = True
-                fall_reason = f"Sudden orientation change - Pitch: {pitch:.1f}°, Roll: {roll:.1f}°"
-    
-    # Criterion 3: Low magnitude (free fall detection)
-    if magnitude < 0.5:  # Very low acceleration might indicate free fall
-        fall_detected = True
-        fall_reason = f"Free fall detected (magnitude: {magnitude:.3f})"
-    
-    # Store previous values for next comparison
-    handle_fall_detection.prev_magnitude = magnitude
-    handle_fall_detection.prev_pitch = pitch
-    handle_fall_detection.prev_roll = roll
-    
-    return fall_detected, fall_reason
+def handle_fall_detection(magnitudes, pitches, rolls):
+    """Enhanced fall detection with multiple criteria over every sample of a drain (orientation is
+    computed once by the caller); returns (index of the first flagged sample or None, reason)"""
+    return fall_detector.check_block(magnitudes, pitches, rolls)
+
+def _as_list(values):
+    # Per-sample work is faster on Python floats than on NumPy scalars
+    return values.tolist() if hasattr(values, 'tolist') else values
 
 def activate_fall_emergency_alerts():
     """Activate all emergency alerts for fall detection"""
     global buzzer_alert, led_alert, lcd
     
-    print("🚨 ACTIVATING FALL EMERGENCY ALERTS 🚨")
+    log.warning("Activating fall emergency alerts")
     
     # Activate buzzer with urgent pattern
     if buzzer_alert:
@@ -494,12 +515,9 @@ def activate_fall_emergency_alerts():
     if led_alert:
         led_alert.start_fall_alert(duration=60)  # 1 minute red flashing
     
-    # Display emergency message on LCD
-    lcd.lcd_clear()
-    time.sleep(0.1)
-    lcd.lcd_display_string("🚨 FALL DETECTED! 🚨", 1)
-    time.sleep(0.1)
-    lcd.lcd_display_string("Emergency Alert!", 2)
+    # Display emergency message on LCD (it may still be initializing right after startup)
+    if lcd:
+        show_screen("🚨 FALL DETECTED! 🚨", "Emergency Alert!")
 
 def stop_fall_alerts():
     """Stop all fall-related alerts"""
@@ -511,7 +529,7 @@ def stop_fall_alerts():
     if led_alert:
         led_alert.stop_alert()
     
-    print("Fall alerts stopped")
+    log.info("Fall alerts stopped")
 
 # Modified accelerometer_monitoring_thread function
 def accelerometer_monitoring_thread(shared_data):
@@ -519,109 +537,201 @@ def accelerometer_monitoring_thread(shared_data):
     global buzzer_alert, led_alert
     
     # Accelerometer setup
-    acc = adxl345.ADXL345(i2c_port=1, address=0x53)
+    # Through the arbiter, sensor reads go ahead of queued LCD writes
+    acc = adxl345.ADXL345(i2c_port=1, address=0x53, bus=i2c_arbiter.client(SENSOR) if i2c_arbiter else None)
     acc.load_calib_value()
-    acc.set_data_rate(adxl345.DataRate.R_100)
     acc.set_range(adxl345.Range.G_16, full_res=True)
     acc.measure_start()
     
+    # Data rate and power mode follow activity and night hours
+    sampling = SamplingController(acc, is_night=is_sleep_time)
+    sampling.configure()
+    poll_interval = sampling.profile.poll_interval
+    
+    # Background calibration refinement from still periods during normal wear (real sensor only)
+    calibrator = AutoCalibrator(acc) if hasattr(acc, 'raw') else None
+    calibration_refine_interval = 600
+    last_calibration_refine = time.time()
+    
+    # Decides fall candidates from their whole window when a trained model is installed
+    fall_classifier = FallClassifier.load()
+    
+    # 5s before to 10s after each fall candidate, saved by the capture store on the bus worker.
+    # Sized for the fastest profile: a free-fall interrupt switches to the burst rate for a while
+    capture = FallCapture(pre_seconds=5, post_seconds=10,
+                          max_rate_hz=max(profile.rate_hz for profile in sampling.profiles.values()),
+                          on_snapshot=lambda snapshot: event_bus.publish(FALL_CAPTURE, snapshot))
+    
+    # In stream mode the FIFO keeps the last 32 samples at the device data rate, more than any
+    # profile produces between polls. Each poll drains it, so the capture ring and the fall criteria
+    # see every sample even while the loop polls at 1-2Hz (real sensor only; the mock is read one
+    # sample at a time)
+    use_fifo = hasattr(acc, 'set_fifo_mode')
+    if use_fifo:
+        acc.set_fifo_mode(adxl345.FifoMode.STREAM)
+    last_drain = time.time()
+    
     # Variables for accelerometer
     step_count = 0
     inactive_seconds = 0
+    next_inactivity_alert = 300
     prev_z = None
     step_threshold = 0.0015
     prev_magnitude = None
-    last_fall_time = 0
-    fall_cooldown_seconds = 30  # Increased cooldown to prevent false alarms
+    read_errors = 0
     fall_confirmation_time = 5   # Time to confirm fall before triggering alerts
     potential_fall_start = 0
+    candidate_reason = ""
+    last_tick_time = time.time()
+    last_status_log = 0
+    posture_tracker = PostureTracker()
     
-    # Set initial step count for daily tracking
-    daily_data['steps_start'] = step_count
+    accel_log.info("Accelerometer monitoring started")
     
-    print("Accelerometer monitoring started with enhanced fall detection...")
-    
-    while shared_data['running']:
+    while shared_data['running'] and supervisor.beat():
+        loop_start = time.perf_counter()
         try:
-            x, y, z = acc.get_3_axis_adjusted()
+            with profiling.stage('accelerometer', 'i2c_read'):
+                block = acc.get_fifo_adjusted() if use_fifo else ()
+                if not len(block):
+                    block = [acc.get_3_axis_adjusted()]
+                x, y, z = (float(v) for v in block[-1])
+            read_errors = 0
+            ACCEL_SAMPLES.inc()
+            if not fall_detection_ready.is_set():
+                fall_detection_ready.set()
+            if calibrator:
+                calibrator.add_sample(*acc.raw)
             
             # Step detection
-            if prev_z is not None and abs(z - prev_z) > step_threshold:
-                step_count += 1
-                print(f"Step detected! Total steps: {step_count}")
-            prev_z = z
-            
-            # Update daily steps
-            daily_data['steps_today'] = step_count - daily_data['steps_start']
+            with profiling.stage('accelerometer', 'steps'):
+                if prev_z is not None and abs(z - prev_z) > step_threshold:
+                    step_count += 1
+                    daily_aggregates.record('steps', 1)
+                    STEPS.inc()
+                    accel_log.debug("Step detected, total steps: %d", step_count)
+                prev_z = z
             
-            # Posture detection
-            pitch = math.degrees(math.atan2(x, math.sqrt(y*y + z*z)))
-            roll = math.degrees(math.atan2(y, math.sqrt(x*x + z*z)))
+            # Orientation of the whole drain in one pass, shared by the capture ring, fall detection
+            # and (for the newest sample) posture
+            current_time = time.time()
+            with profiling.stage('accelerometer', 'orientation'):
+                pitches, rolls, magnitudes = orientation_batch(block)
+                count = len(block)
+                # Entries are spread evenly since the last drain, which also follows the slower rate
+                # while the ADXL345 auto-sleeps; a full FIFO overflowed, so its entries are one
+                # data-rate period apart
+                if use_fifo and count >= adxl345.FIFO_DEPTH:
+                    period = 1.0 / sampling.profile.rate_hz
+                else:
+                    period = (current_time - last_drain) / count
+                last_drain = current_time
+                times = [current_time - (count - 1 - k) * period for k in range(count)]
+            with profiling.stage('accelerometer', 'capture'):
+                capture.add_block(times, block, pitches, rolls, magnitudes)
+            pitches, rolls, magnitudes = _as_list(pitches), _as_list(rolls), _as_list(magnitudes)
+            pitch, roll, magnitude = pitches[-1], rolls[-1], magnitudes[-1]
+            moving = is_moving(magnitude)
             
-            if abs(pitch) < 30 and abs(roll) < 30:
-                posture = "Standing or Walking"
-            elif abs(roll) > 60:
-                posture = "Lying Down"
-            else:
-                posture = "Sitting"
+            # Posture detection (filtered, only reports confirmed transitions)
+            with profiling.stage('accelerometer', 'posture'):
+                transition = posture_tracker.update(pitch, roll, current_time)
+                posture = posture_tracker.posture
+                if transition:
+                    accel_log.info("Posture changed: %s -> %s after %.0fs",
+                                   transition.previous, transition.posture, transition.duration)
             
-            # Enhanced fall detection
-            magnitude = get_magnitude(x, y, z)
-            current_time = time.time()
+            # Active and posture time for the daily aggregates, booked per tick so each lands in the
+            # hour and day it was spent in
+            tick_seconds = current_time - last_tick_time
+            last_tick_time = current_time
+            if moving:
+                daily_aggregates.record('active_minutes', tick_seconds / 60)
+            if posture:
+                daily_aggregates.record_posture(posture, tick_seconds)
             
             # Check for fall using enhanced detection
-            fall_detected, fall_reason = handle_fall_detection(x, y, z, magnitude)
+            with profiling.stage('accelerometer', 'fall_detection'):
+                flagged, fall_reason = handle_fall_detection(magnitudes, pitches, rolls)
+            fall_detected = flagged is not None
             
-            if fall_detected and current_time - last_fall_time > fall_cooldown_seconds:
-                if potential_fall_start == 0:
-                    potential_fall_start = current_time
-                    print(f"⚠️  POTENTIAL FALL DETECTED: {fall_reason}")
-                    
-                    # Start warning alerts (not full emergency yet)
-                    if led_alert:
-                        led_alert.start_warning_alert(duration=fall_confirmation_time)
+            fall_confirmed = False
+            if fall_detected and potential_fall_start == 0:
+                # The candidate starts at the flagged sample, which may be earlier in the drain
+                potential_fall_start = times[flagged]
+                candidate_reason = fall_reason
+                accel_log.warning("Potential fall detected: %s", fall_reason)
+                capture.trigger(potential_fall_start, fall_reason)
                 
-                # Check if fall is confirmed (sustained for confirmation time)
-                elif current_time - potential_fall_start >= fall_confirmation_time:
-                    # CONFIRMED FALL - ACTIVATE ALL ALERTS
-                    fall_message = f"🚨 FALL CONFIRMED! {fall_reason}. Immediate assistance required!"
-                    print(fall_message)
-                    
-                    # Send Telegram alert
-                    detailed_message = (
-                        f"🚨 EMERGENCY FALL ALERT 🚨\n"
-                        f"Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                        f"Reason: {fall_reason}\n"
-                        f"Position: Pitch={pitch:.1f}°, Roll={roll:.1f}°\n"
-                        f"Acceleration: {magnitude:.3f}g\n"
-                        f"IMMEDIATE ASSISTANCE REQUIRED!"
-                    )
-                    send_telegram_message(detailed_message)
-                    
-                    # Activate all emergency alerts
-                    activate_fall_emergency_alerts()
-                    
-                    last_fall_time = current_time
-                    potential_fall_start = 0
-                    
-                    # Log fall to CSV immediately
-                    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    write_fall_data_to_csv(timestamp, x, y, z, magnitude, pitch, roll, fall_reason)
-                    
-            else:
+                # Keep full-rate sampling while the fall is being confirmed
+                sampling.hold_active(fall_confirmation_time * 2, current_time)
+                
+                # Start warning alerts (not full emergency yet)
+                if led_alert:
+                    led_alert.start_warning_alert(duration=fall_confirmation_time)
+            
+            elif potential_fall_start != 0 and fall_classifier:
+                # The classifier judges the whole window around the candidate, so it stays open until then
+                if current_time - potential_fall_start >= fall_classifier.post:
+                    with profiling.stage('accelerometer', 'fall_classifier'):
+                        times, values = capture.window(potential_fall_start - fall_classifier.pre)
+                        fall_confirmed, probability = fall_classifier.classify(times, values, potential_fall_start)
+                    if fall_confirmed:
+                        fall_reason = f"{candidate_reason} (P(fall)={probability:.2f})"
+                    else:
+                        accel_log.info("Fall candidate rejected, P(fall)=%.2f: %s", probability, candidate_reason)
+                        FALL_CANDIDATES_REJECTED.inc()
+                        potential_fall_start = 0
+                        capture.label(False, f"classifier P(fall)={probability:.2f}")
+                        if led_alert:
+                            led_alert.stop_alert()  # Stop warning alerts
+            
+            elif potential_fall_start != 0 and not fall_detected:
                 # Reset potential fall if conditions are normal
-                if potential_fall_start != 0:
-                    potential_fall_start = 0
-                    if led_alert:
-                        led_alert.stop_alert()  # Stop warning alerts
+                potential_fall_start = 0
+                FALL_CANDIDATES_REJECTED.inc()
+                capture.label(False, "conditions returned to normal")
+                if led_alert:
+                    led_alert.stop_alert()  # Stop warning alerts
+            
+            # Without a classifier, a fall is confirmed once the criteria hold for the confirmation time
+            elif potential_fall_start != 0 and current_time - potential_fall_start >= fall_confirmation_time:
+                fall_confirmed = True
+            
+            if fall_confirmed:
+                # CONFIRMED FALL - ACTIVATE ALL ALERTS
+                fall_message = f"🚨 FALL CONFIRMED! {fall_reason}. Immediate assistance required!"
+                accel_log.critical("%s", fall_message)
+                FALL_CANDIDATES_CONFIRMED.inc()
+                
+                # Send Telegram alert
+                detailed_message = (
+                    f"🚨 EMERGENCY FALL ALERT 🚨\n"
+                    f"Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    f"Reason: {fall_reason}\n"
+                    f"Position: Pitch={pitch:.1f}°, Roll={roll:.1f}°\n"
+                    f"Acceleration: {magnitude:.3f}g\n"
+                    f"IMMEDIATE ASSISTANCE REQUIRED!"
+                )
+                # Telegram and local emergency alerts (cooldown/escalation live in the rule engine)
+                event_bus.publish(ALERT, make_event(FALL, detailed_message, timestamp=current_time,
+                                                    reason=fall_reason, magnitude=magnitude))
+                
+                potential_fall_start = 0
+                capture.label(True, fall_reason)
+                
+                # Log fall to CSV immediately
+                timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                write_fall_data_to_csv(timestamp, x, y, z, magnitude, pitch, roll, fall_reason)
             
             # Inactivity detection (only during wake hours)
             if not is_sleep_time():
-                if magnitude < 0.02:
-                    inactive_seconds += 1
+                if not moving:
+                    # Counted in seconds since the poll interval varies with the sampling profile
+                    inactive_seconds += tick_seconds
                     
                     # Visual indicator for inactivity
-                    if inactive_seconds == 180 and led_alert:  # 3 minutes
+                    if inactive_seconds >= 180 and inactive_seconds - tick_seconds < 180 and led_alert:  # 3 minutes
                         led_alert.start_inactive_warning(duration=60)
                         
                 else:
@@ -632,63 +742,195 @@ def accelerometer_monitoring_thread(shared_data):
             else:
                 inactive_seconds = 0  # Reset during sleep hours
                 
-            # Inactivity alert (only during wake hours)
-            if inactive_seconds > 300:  # 5 minutes of inactivity
-                inactivity_message = f"⚠ No movement detected for {inactive_seconds} seconds. Please check on the elderly person."
-                print(inactivity_message)
-                send_telegram_message(inactivity_message)
-                inactive_seconds = 0  # Reset to avoid spam
+            # Inactivity alert (only during wake hours) when 5 minutes pass, then a reminder every
+            # 15 minutes while it lasts; the rule engine rate limits and escalates them
+            if inactive_seconds <= 300:
+                next_inactivity_alert = 300
+            elif inactive_seconds > next_inactivity_alert:
+                next_inactivity_alert = inactive_seconds + 900
+                inactivity_message = f"⚠ No movement detected for {int(inactive_seconds)} seconds. Please check on the elderly person."
+                event_bus.publish(ALERT, make_event(INACTIVITY, inactivity_message, timestamp=current_time))
+            
+            with profiling.stage('accelerometer', 'publish'):
+                # Every drained sample, with the orientation computed once above, in one queue operation
+                # per subscriber
+                event_bus.publish_many(ACCEL, [
+                    AccelSample(t, float(sx), float(sy), float(sz), p, r, m)
+                    for t, (sx, sy, sz), p, r, m in zip(times, block, pitches, rolls, magnitudes)])
             
             # Update shared data
-            shared_data.update({
-                'x': x,
-                'y': y,
-                'z': z,
-                'magnitude': magnitude,
-                'steps': step_count,
-                'posture': posture,
-                'inactive_seconds': inactive_seconds,
-                'pitch': pitch,
-                'roll': roll
-            })
+            with profiling.stage('accelerometer', 'shared_data'):
+                shared_data.update({
+                    'x': x,
+                    'y': y,
+                    'z': z,
+                    'magnitude': magnitude,
+                    'steps': step_count,
+                    'posture': posture,
+                    'inactive_seconds': inactive_seconds,
+                    'pitch': pitch,
+                    'roll': roll,
+                    'sedentary_seconds': posture_tracker.sedentary_seconds(current_time)
+                })
+            
+            # Status line every 10 seconds
+            if current_time - last_status_log >= 10:
+                last_status_log = current_time
+                accel_log.info("Steps: %d, posture: %s, inactive: %.0fs, mag: %.3f",
+                               step_count, posture, inactive_seconds, magnitude)
+            
+            if calibrator and current_time - last_calibration_refine > calibration_refine_interval:
+                last_calibration_refine = current_time
+                if calibrator.refine():
+                    accel_log.info("Calibration refined from %d orientations", len(calibrator.points))
             
-            # Print current status (less frequent to reduce spam)
-            if int(time.time()) % 10 == 0:  # Print every 10 seconds
-                print(f"Steps: {step_count}, Posture: {posture}, Inactive: {inactive_seconds}s, Mag: {magnitude:.3f}")
+            # Adapt the data rate to activity; idle and night profiles poll less often
+            poll_interval = sampling.update(moving, current_time)
+            if capture.capturing and not use_fifo:
+                # Without the FIFO, record the post-trigger waveform at the active data rate
+                poll_interval = min(poll_interval, 1.0 / sampling.profiles['active'].rate_hz)
+            ACCEL_POLL_INTERVAL.set(poll_interval)
             
         except Exception as e:
-            print(f"Error in accelerometer monitoring: {e}")
+            accel_log.warning("Error in accelerometer monitoring: %s", e)
+            I2C_ERRORS.inc()
+            read_errors += 1
+            if read_errors >= 10:
+                event_bus.publish(ALERT, make_event(
+                    SENSOR_OFFLINE, f"⚠ SENSOR OFFLINE: Accelerometer failed {read_errors} reads in a row ({e}).",
+                    key='accelerometer'))
         
-        time.sleep(0.1)
+        ACCEL_LOOP_SECONDS.observe(time.perf_counter() - loop_start)
+        time.sleep(poll_interval)
+
+def notify_telegram(message, event):
+    """Alert rule engine channel for Telegram"""
+    ALERTS_SENT.labels('telegram', event.kind).inc()
+    log.warning("Alert (%s): %s", event.kind, message)
+    send_telegram_message(message, event.kind)
+
+def local_alarm(message, event):
+    """Alert rule engine channel for the buzzer/LED/LCD on the device"""
+    ALERTS_SENT.labels('local', event.kind).inc()
+    if event.kind == FALL:
+        activate_fall_emergency_alerts()
+    else:
+        if buzzer_alert:
+            buzzer_alert.start_alert(duration=30, pattern="warning")
+        if led_alert:
+            led_alert.start_warning_alert(duration=60)
+
+def setup_alert_engine():
+    """Create the alert rule engine and attach its notification channels"""
+    global alert_engine
+    alert_engine = AlertRuleEngine(is_quiet=is_sleep_time, gate=activity_fusion.gate)
+    alert_engine.add_notifier('telegram', notify_telegram)
+    alert_engine.add_notifier('local', local_alarm)
+    # Fusion keeps only a few timestamps per source; accelerometer samples arrive in batches
+    event_bus.subscribe(ACCEL, activity_fusion.on_accel, name='fusion_accel', maxsize=1000,
+                        batch_size=50, max_latency=1.0)
+    event_bus.subscribe(DISTANCE, activity_fusion.on_distance, name='fusion_distance', maxsize=100)
+    event_bus.subscribe(KEYPAD, activity_fusion.on_key, name='fusion_keypad', maxsize=100)
+    # Fall waveforms go to disk here, off the accelerometer thread
+    event_bus.subscribe(FALL_CAPTURE, CaptureStore().save, name='fall_capture', maxsize=10)
+    # Alerts are evaluated on the bus worker, so slow Telegram calls don't stall a sensor thread.
+    # They are never dropped: if the queue ever fills, the publisher waits for room
+    event_bus.subscribe(ALERT, alert_engine.submit, name='alert_engine', maxsize=1000, policy=BLOCK,
+                        block_timeout=None)
+    return alert_engine
+
+def register_runtime_metrics():
+    """Scrape-time gauges for the event bus, alert engine and keypad queue"""
+    published = metrics.gauge('event_bus_published', 'Messages published per topic', ('topic',))
+    depth = metrics.gauge('event_bus_queue_depth', 'Messages waiting per subscriber', ('subscriber',))
+    dropped = metrics.gauge('event_bus_dropped', 'Messages dropped per subscriber', ('subscriber',))
+    for topic in (ACCEL, DISTANCE, CLIMATE, KEYPAD, ALERT, OCCUPANCY, FALL_CAPTURE):
+        published.labels(topic).set_function(lambda topic=topic: event_bus.published_count(topic))
+    for subscriptions in event_bus.subscriptions.values():
+        for subscription in subscriptions:
+            depth.labels(subscription.name).set_function(lambda s=subscription: s.depth)
+            dropped.labels(subscription.name).set_function(lambda s=subscription: s.dropped)
+    outcomes = metrics.gauge('alert_engine_events', 'Alert events by kind and outcome', ('kind', 'outcome'))
+    for kind in alert_engine.rules:
+        for outcome in ('sent', 'suppressed', 'gated', 'deduplicated', 'rate_limited'):
+            outcomes.labels(kind, outcome).set_function(
+                lambda key=(kind, outcome): alert_engine.stats.get(key, 0))
+    metrics.gauge('keypad_queue_depth', 'Key presses waiting for the main loop',
+                  func=shared_keypad_queue.qsize)
+    fused = metrics.gauge('activity_fused_score', 'Fused activity evidence from all sensors', ('score',))
+    for score in ('activity', 'presence', 'motion', 'keypad'):
+        fused.labels(score).set_function(lambda score=score: getattr(activity_fusion.state(), score))
+    if i2c_arbiter:
+        metrics.gauge('i2c_bus_utilization', 'Fraction of time I2C bus 1 is held',
+                      func=lambda: i2c_arbiter.stats()['utilization'])
+        wait = metrics.gauge('i2c_wait_seconds', 'Time spent waiting for I2C bus 1', ('client',))
+        contended = metrics.gauge('i2c_contended', 'Bus acquisitions that had to wait', ('client',))
+        for name in ('sensor', 'display'):
+            wait.labels(name).set_function(
+                lambda name=name: i2c_arbiter.stats()['priorities'].get(name, {}).get('wait_seconds', 0.0))
+            contended.labels(name).set_function(
+                lambda name=name: i2c_arbiter.stats()['priorities'].get(name, {}).get('contended', 0))
+
+def setup_network():
+    """Upstream credentials from config; in gateway mode messages go out as frames to the gateway"""
+    global upstream, gateway_client
+    config = UpstreamConfig.load()
+    upstream = Upstream(config)
+    if config.gateway_address and not config.gateway_secret:
+        log.error("Gateway address set without a shared secret, sending to the services directly")
+    elif config.gateway_address:
+        gateway_client = GatewayClient(config.device_id, TcpTransport(config.gateway_address), config.gateway_secret)
+        log.info("Gateway mode: device %d sends to %s", config.device_id, config.gateway_address)
+    return config
+
+def stop_network():
+    if gateway_client:
+        gateway_client.close(timeout=2)
+
+def setup_i2c_arbiter():
+    """Share bus 1 between the LCD and the accelerometer, sensor reads first"""
+    global i2c_arbiter
+    try:
+        i2c_arbiter = I2CArbiter(port=1)
+    except ImportError:
+        return None  # no smbus: the accelerometer is mocked and the LCD keeps its own bus
+    if lcd:
+        attach_lcd()
+    return i2c_arbiter
+
+def attach_lcd():
+    """Send the LCD's bus traffic through the arbiter at display priority"""
+    global display_bus
+    display_bus = attach_display(lcd, i2c_arbiter)
+
+def show_screen(line1, line2=None):
+    """Redraw the LCD as one batch of bus writes
+
+    Through the arbiter the batch still yields to sensor reads between
+    writes, but the screen no longer queues for the bus once per byte.
+    """
+    with display_bus.batch() if display_bus else nullcontext():
+        lcd.lcd_clear()
+        lcd.lcd_display_string(line1, 1)
+        if line2 is not None:
+            lcd.lcd_display_string(line2, 2)
 
 def show_temp_humidity_display(dht_instance):
     """Show temperature and humidity with menu options"""
     global lcd
     
     result = dht_instance.read()
+    event_bus.publish(CLIMATE, ClimateReading(time.time(), result.temperature, result.humidity, result.is_valid()))
     
     if result.is_valid():
-        temp_str = f"T:{result.temperature}C H:{result.humidity}%"
-        lcd.lcd_clear()
-        time.sleep(0.1)
-        lcd.lcd_display_string(temp_str, 1)
-        time.sleep(0.1)
-        lcd.lcd_display_string("1.Eaten 2.Walked", 2)
+        show_screen(f"T:{result.temperature}C H:{result.humidity}%", "1.Eaten 2.Walked")
     else:
-        lcd.lcd_clear()
-        time.sleep(0.1)
-        lcd.lcd_display_string("Sensor Error!", 1)
-        time.sleep(0.1)
-        lcd.lcd_display_string("1.Eaten 2.Walked", 2)
+        show_screen("Sensor Error!", "1.Eaten 2.Walked")
     return result
 
 def knowthembetter():
     global lcd
-    lcd.lcd_clear()
-    time.sleep(0.1)
-    lcd.lcd_display_string("Rate ur feeling", 1)
-    time.sleep(0.1)
-    lcd.lcd_display_string("from 1-9", 2)
+    show_screen("Rate ur feeling", "from 1-9")
     
     # Wait for feeling rating with timeout
     try:
@@ -702,9 +944,7 @@ def knowthembetter():
 
 def ending_speech():
     global lcd
-    lcd.lcd_clear()
-    time.sleep(0.1)
-    lcd.lcd_display_string("Have a nice day!", 1)
+    show_screen("Have a nice day!")
     time.sleep(2)
 
 def write_data_to_csv(timestamp, temperature, humidity, user_status, user_feeling, steps, x, y, z, magnitude, posture, distance=None, person_present=False):
@@ -721,25 +961,65 @@ def write_data_to_csv(timestamp, temperature, humidity, user_status, user_feelin
         writer.writerow([timestamp, temperature, humidity, user_status, user_feeling, 
                         steps, x, y, z, magnitude, posture, distance, person_present])
     
-    print("Data saved to CSV")
+    log.debug("Data saved to CSV")
 
-def main():
-    global lcd
-    lcd = I2C_LCD_driver.lcd()
-    dht_instance = dht11.DHT11(pin=21)
+def write_fall_data_to_csv(timestamp, x, y, z, magnitude, pitch, roll, fall_reason):
+    """One row per confirmed fall; the waveform around it is in the fall capture store"""
+    filename = "fall_events.csv"
+    file_exists = os.path.isfile(filename)
     
-    # Initialize keypad
-    keypad.init(key_pressed)
-    time.sleep(0.5)
+    with open(filename, "a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        
+        if not file_exists:
+            writer.writerow(['Timestamp', 'X_Axis', 'Y_Axis', 'Z_Axis', 'Magnitude', 'Pitch', 'Roll', 'Reason'])
+        
+        writer.writerow([timestamp, x, y, z, magnitude, pitch, roll, fall_reason])
     
-    # Start keypad thread
+    log.debug("Fall saved to CSV")
+
+def setup_lcd():
+    global lcd
+    lcd = bootstrap.lazy_import('I2C_LCD_driver').lcd()
+    if i2c_arbiter:
+        attach_lcd()
+    return lcd
+
+def setup_alert_outputs():
+    """Non-blocking alert outputs (patterns run on a shared timer thread)"""
+    global buzzer_alert, led_alert
+    buzzer_alert = bootstrap.lazy_import('buzzer_alert').BuzzerAlert()
+    led_alert = bootstrap.lazy_import('led_alert').LedAlert(pin=ALERT_LED_PIN)
+
+def setup_keypad():
+    keypad = bootstrap.lazy_import('keypad')
+    keypad.init(key_pressed)
     keypad_thread = Thread(target=keypad.get_key)
     keypad_thread.daemon = True
     keypad_thread.start()
-    time.sleep(0.5)
-    
-    # Reset daily data if new day
-    reset_daily_data_if_new_day()
+
+def stop_workers(shared_data):
+    shared_data['running'] = False
+    if checkin_scheduler:
+        checkin_scheduler.stop()
+    supervisor.stop(timeout=3)
+
+def stop_outputs():
+    if buzzer_alert:
+        buzzer_alert.stop_alert()
+    if led_alert:
+        led_alert.stop_alert()
+    if lcd:
+        lcd.lcd_clear()
+    if GPIO:
+        GPIO.cleanup()
+
+def main():
+    startup = bootstrap.Startup()
+    log_listener = setup_logging()
+    shutdown.install()
+    stack_sampler = profiling.start_from_env()
+    restore_state()
     
     # Shared data between threads
     shared_data = {
@@ -755,37 +1035,71 @@ def main():
         'waiting_for_checkin': False,
         'next_checkin_in': 0,
         'last_user_interaction': 0,
-        'dht_instance': dht_instance
+        'dht_instance': None
     }
     
-    # Start accelerometer monitoring thread
-    accel_thread = Thread(target=accelerometer_monitoring_thread, args=(shared_data,))
-    accel_thread.daemon = True
-    accel_thread.start()
+    # Startup runs inside the try too, so a failed startup still stops what already started
+    started = False
+    try:
+        # Phase 1: fall detection and its alert path come up first
+        startup.step('network', setup_network)
+        startup.step('alert_engine', setup_alert_engine)
+        startup.step('i2c_arbiter', setup_i2c_arbiter)
+        supervisor.add('accelerometer', accelerometer_monitoring_thread, (shared_data,), stall_timeout=10)
+        supervisor.start()
+        startup.parallel({'alert_outputs': setup_alert_outputs})
+        if fall_detection_ready.wait(5):
+            startup.mark('fall_detection_ready')
+        else:
+            log.error("Accelerometer produced no sample within 5s, continuing startup")
     
-    # Start ultrasonic sensor monitoring thread
-    ultrasonic_thread = Thread(target=ultrasonic_monitoring_thread, args=(shared_data,))
-    ultrasonic_thread.daemon = True
-    ultrasonic_thread.start()
+        # Phase 2: everything else, initialized concurrently
+        results = startup.parallel({
+            'lcd': setup_lcd,
+            'dht11': lambda: bootstrap.lazy_import('dht11').DHT11(pin=21),
+            'keypad': setup_keypad,
+            'ultrasonic': setup_ultrasonic,
+            'requests': upstream.session,  # warm the import and the pool for the first upload
+            'metrics_server': lambda: metrics.start_http_server(METRICS_PORT),
+        }, timeout=30)
+        dht_instance = shared_data['dht_instance'] = results.get('dht11')
+        if lcd is None or dht_instance is None:
+            raise RuntimeError("LCD or DHT11 failed to initialize")
+        register_runtime_metrics()
     
-    # Start scheduled check-in thread
-    checkin_thread = Thread(target=scheduled_checkin_thread, args=(shared_data,))
-    checkin_thread.daemon = True
-    checkin_thread.start()
+        # Reset daily data if new day
+        reset_daily_data_if_new_day()
     
-    temp_update_counter = 0
-    last_thingspeak_upload = 0
-    thingspeak_interval = 20  # Upload to ThingSpeak every 20 seconds
+        # Start ultrasonic sensor monitoring thread
+        if GPIO:
+            supervisor.add('ultrasonic', ultrasonic_monitoring_thread, (shared_data,), stall_timeout=15)
     
-    print("Enhanced monitoring system started!")
-    print("Features: Temperature/Humidity, Accelerometer, Ultrasonic Sensor, Scheduled Check-ins, Daily Summary")
-    print("Press 1 for 'Eaten', 2 for 'Walked', 3 to show current stats, 4 for sensor status, 5 for daily summary")
+        # Start scheduled check-in thread
+        supervisor.add('checkin', scheduled_checkin_thread, (shared_data,), stall_timeout=60, critical=False)
     
-    try:
-        while True:
+        startup.mark('ready')
+        supervisor.ready()
+        startup_gauge = metrics.gauge('startup_seconds', 'Seconds from start to each startup milestone', ('milestone',))
+        for milestone, at in startup.report().items():
+            startup_gauge.labels(milestone).set(at)
+    
+        temp_update_counter = 0
+        last_thingspeak_upload = 0
+        thingspeak_interval = 20  # Upload to ThingSpeak every 20 seconds
+        last_checkpoint = time.time()
+    
+        print("Enhanced monitoring system started!")
+        print("Features: Temperature/Humidity, Accelerometer, Ultrasonic Sensor, Scheduled Check-ins, Daily Summary")
+        print("Press 1 for 'Eaten', 2 for 'Walked', 3 to show current stats, 4 for sensor status, 5 for daily summary")
+        started = True
+    
+        while not shutdown.requested:
+            loop_start = time.perf_counter()
+            
             # Update temperature/humidity display every 10 iterations (unless waiting for check-in)
-            if temp_update_counter % 10 == 0 and not shared_data['waiting_for_checkin']:
-                tempandhumi = show_temp_humidity_display(dht_instance)
+            with profiling.stage('main', 'climate_display'):
+                if temp_update_counter % 10 == 0 and not shared_data['waiting_for_checkin']:
+                    tempandhumi = show_temp_humidity_display(dht_instance)
             temp_update_counter += 1
             
             # Check for keypad input
@@ -796,6 +1110,9 @@ def main():
                 # Update last user interaction time
                 shared_data['last_user_interaction'] = time.time()
                 
+                # Someone is at the device, so inactivity alerts are pointless for a while
+                alert_engine.suppress(INACTIVITY, 600)
+                
                 if keyvalue == 1: 
                     print("User has eaten")
                     condition = "eaten"
@@ -803,7 +1120,7 @@ def main():
                     daily_data['eaten_count'] += 1
                     
                     feeling = knowthembetter()
-                    daily_data['feeling_ratings'].append(feeling)
+                    daily_aggregates.record('feeling', feeling)
                     print("Feeling rating:", feeling)
                     time.sleep(1)
                     ending_speech()
@@ -844,7 +1161,7 @@ def main():
                     daily_data['walked_count'] += 1
                     
                     feeling = knowthembetter()
-                    daily_data['feeling_ratings'].append(feeling)
+                    daily_aggregates.record('feeling', feeling)
                     print("Feeling rating:", feeling)
                     time.sleep(1)
                     ending_speech()
@@ -880,26 +1197,16 @@ def main():
                     
                 elif keyvalue == 3:
                     # Display current statistics
-                    lcd.lcd_clear()
-                    time.sleep(0.1)
-                    lcd.lcd_display_string(f"Steps: {shared_data['steps']}", 1)
-                    time.sleep(0.1)
-                    lcd.lcd_display_string(f"Posture: {shared_data['posture'][:16]}", 2)
+                    show_screen(f"Steps: {shared_data['steps']}", f"Posture: {shared_data['posture'][:16]}")
                     time.sleep(3)
                     
                 elif keyvalue == 4:
                     # Display sensor status
-                    lcd.lcd_clear()
-                    time.sleep(0.1)
                     if shared_data['distance'] is not None:
                         presence = "Yes" if shared_data['person_present'] else "No"
-                        lcd.lcd_display_string(f"Dist:{shared_data['distance']:.1f}cm", 1)
-                        time.sleep(0.1)
-                        lcd.lcd_display_string(f"Present: {presence}", 2)
+                        show_screen(f"Dist:{shared_data['distance']:.1f}cm", f"Present: {presence}")
                     else:
-                        lcd.lcd_display_string("Ultrasonic Error", 1)
-                        time.sleep(0.1)
-                        lcd.lcd_display_string("Sensor offline", 2)
+                        show_screen("Ultrasonic Error", "Sensor offline")
                     time.sleep(3)
                     
                 elif keyvalue == 5:
@@ -915,34 +1222,58 @@ def main():
             # Periodic ThingSpeak upload (every 20 seconds) with current sensor data
             current_time = time.time()
             if current_time - last_thingspeak_upload > thingspeak_interval:
-                tempandhumi = show_temp_humidity_display(dht_instance)
+                with profiling.stage('main', 'periodic_upload'):
+                    tempandhumi = show_temp_humidity_display(dht_instance)
+                    summary = daily_aggregates.summary()
                 
-                # Upload background monitoring data
-                upload_success = upload_to_thingspeak(
-                    tempandhumi.temperature if tempandhumi.is_valid() else 0,
-                    tempandhumi.humidity if tempandhumi.is_valid() else 0,
-                    shared_data['steps'], shared_data['x'], shared_data['y'], shared_data['z'],
-                    shared_data['magnitude'], 5,  # Default feeling when no user interaction
-                    shared_data['distance']
-                )
+                    # Upload background monitoring data
+                    upload_success = upload_to_thingspeak(
+                        tempandhumi.temperature if tempandhumi.is_valid() else 0,
+                        tempandhumi.humidity if tempandhumi.is_valid() else 0,
+                        summary['steps'], shared_data['x'], shared_data['y'], shared_data['z'],
+                        shared_data['magnitude'],
+                        # Today's average feeling, default 5 when nothing was rated yet
+                        round(summary['avg_feeling'], 1) if summary['feeling_count'] else 5,
+                        shared_data['distance']
+                    )
                 
                 if upload_success:
-                    print("Periodic data uploaded to ThingSpeak")
+                    net_log.debug("Periodic data uploaded to ThingSpeak")
                 
                 last_thingspeak_upload = current_time
             
+            if current_time - last_checkpoint > CHECKPOINT_INTERVAL:
+                with profiling.stage('main', 'checkpoint'):
+                    checkpoint_state()
+                last_checkpoint = current_time
+            
+            MAIN_LOOP_SECONDS.observe(time.perf_counter() - loop_start)
             time.sleep(0.1)
             
     except KeyboardInterrupt:
-        print("\nShutting down monitoring system...")
-        shared_data['running'] = False
+        shutdown.request('KeyboardInterrupt')
         
     except Exception as e:
-        print(f"Error in main loop: {e}")
-        shared_data['running'] = False
+        log.exception("Error in main loop: %s" if started else "Startup failed: %s", e)
+        shutdown.request('error')
+        if not started:
+            raise  # after the shutdown steps below, so the service manager sees the failure
     
     finally:
-        GPIO.cleanup()
+        # Stop producers first, then drain what they queued, then save state. Each step has its
+        # own budget within SHUTDOWN_DEADLINE, so the checkpoint always gets its turn.
+        shutdown.add('workers', stop_workers, shared_data, budget=3)
+        shutdown.add('alerts', event_bus.close, 3, budget=3)
+        shutdown.add('network', stop_network, budget=2)
+        shutdown.add('outputs', stop_outputs, budget=1)
+        shutdown.add('checkpoint', checkpoint_state, budget=1)
+        shutdown.run()
+        if stack_sampler:
+            stack_sampler.stop()
+        if profiling.ENABLED:
+            for loop, name, count, mean_ms, total in profiling.report():
+                log.info("Stage %s.%s: %d calls, %.3f ms mean, %.1f s total", loop, name, count, mean_ms, total)
+        log_listener.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,200 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        """Child metric for one label combination; keep the result around in hot paths"""
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self.children[values] = child
+        return child
+
+    def _samples(self):
+        if self.labelnames:
+            for values, child in list(self.children.items()):
+                yield from child._child_samples(self.name, _label_text(self.labelnames, values))
+        else:
+            yield from self._child_samples(self.name, '')
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines += [f'{name}{labels} {_format(value)}' for name, labels, value in self._samples()]
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Monotonic counter
+
+    inc() is a plain attribute update: no lock, so concurrent increments from
+    several threads may very rarely lose one. That keeps it well under a
+    microsecond, which matters more here than exact counts.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.value = 0
+
+    def _new_child(self):
+        return Counter(self.name, self.help)
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def _child_samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, or is read from func() at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        super().__init__(name, help_text, labelnames)
+        self.value = 0
+        self.func = func
+
+    def _new_child(self):
+        return Gauge(self.name, self.help)
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, func):
+        self.func = func
+
+    def _child_samples(self, name, labels):
+        if self.func is not None:
+            try:
+                yield name, labels, self.func()
+            except Exception:
+                pass
+        else:
+            yield name, labels, self.value
+
+
+class Histogram(_Metric):
+    """Bucketed distribution; observe() is a bisect and two additions"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _new_child(self):
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def _child_samples(self, name, labels):
+        cumulative = 0
+        prefix = labels[:-1] + ',' if labels else '{'
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield name + '_bucket', f'{prefix}le="{_format(bound)}"}}', cumulative
+        yield name + '_sum', labels, self.sum
+        yield name + '_count', labels, cumulative
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def expose(self):
+        """All metrics in the Prometheus text exposition format"""
+        return '\n'.join(metric.expose() for metric in list(self.metrics.values())) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labelnames=(), registry=REGISTRY):
+    return registry.register(Counter(name, help_text, labelnames))
+
+
+def gauge(name, help_text, labelnames=(), func=None, registry=REGISTRY):
+    return registry.register(Gauge(name, help_text, labelnames, func))
+
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+    return registry.register(Histogram(name, help_text, labelnames, buckets))
+
+
+def start_http_server(port=9110, addr='0.0.0.0', registry=REGISTRY):
+    """Serve /metrics from a daemon thread; returns the server"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.expose().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keep scrapes off the console
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    return server
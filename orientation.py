@@ -0,0 +1,50 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RAD_TO_DEG = 180.0 / math.pi
+
+# The magnitude of a still sensor is gravity alone, so movement is how far it strays from 1g
+GRAVITY_G = 1.0
+MOVEMENT_THRESHOLD = 0.05  # g
+
+
+def orientation(x, y, z):
+    """Pitch and roll in degrees plus magnitude in g, computed once per sample"""
+    xx = x*x
+    yy = y*y
+    zz = z*z
+    pitch = math.atan2(x, math.sqrt(yy + zz)) * RAD_TO_DEG
+    roll = math.atan2(y, math.sqrt(xx + zz)) * RAD_TO_DEG
+    magnitude = math.sqrt(xx + yy + zz)
+    return pitch, roll, magnitude
+
+
+def is_moving(magnitude, threshold=MOVEMENT_THRESHOLD):
+    """True when the acceleration magnitude differs from gravity by at least threshold"""
+    return abs(magnitude - GRAVITY_G) >= threshold
+
+
+def orientation_batch(samples):
+    """Pitch, roll and magnitude arrays for an (N, 3) block of samples (e.g. a FIFO burst)"""
+    if np is None:
+        # Without NumPy fall back to the scalar path, returning lists
+        results = [orientation(x, y, z) for x, y, z in samples]
+        return [r[0] for r in results], [r[1] for r in results], [r[2] for r in results]
+
+    samples = np.asarray(samples, dtype=np.float64)
+    x = samples[:, 0]
+    y = samples[:, 1]
+    z = samples[:, 2]
+    xx = x*x
+    yy = y*y
+    zz = z*z
+    pitch = np.arctan2(x, np.sqrt(yy + zz))
+    pitch *= RAD_TO_DEG
+    roll = np.arctan2(y, np.sqrt(xx + zz))
+    roll *= RAD_TO_DEG
+    magnitude = np.sqrt(xx + yy + zz)
+    return pitch, roll, magnitude
@@ -0,0 +1,123 @@
+import time
+from collections import namedtuple
+
+STANDING = "Standing or Walking"
+SITTING = "Sitting"
+LYING = "Lying Down"
+
+# Base thresholds in degrees (same as the original per-sample rules)
+UPRIGHT_LIMIT = 30
+LYING_LIMIT = 60
+
+# Emitted when the confirmed posture changes; duration is the time spent in previous
+PostureTransition = namedtuple('PostureTransition', ['previous', 'posture', 'timestamp', 'duration'])
+
+
+class PostureTracker(object):
+    """Posture classifier with low-pass filtering, hysteresis and minimum dwell time"""
+
+    def __init__(self, time_constant=0.5, hysteresis=8, min_dwell=2.0, on_transition=None):
+        self.time_constant = time_constant  # seconds, low-pass filter on pitch/roll
+        self.hysteresis = hysteresis        # degrees added around each threshold
+        self.min_dwell = min_dwell          # seconds a new posture must persist
+        self.on_transition = on_transition
+
+        self.pitch = None
+        self.roll = None
+
+        self.posture = None
+        self.posture_since = None
+        self.candidate = None
+        self.candidate_since = None
+        self.last_time = None
+
+        # Cumulative seconds spent in each posture (excluding the current run)
+        self.totals = {STANDING: 0.0, SITTING: 0.0, LYING: 0.0}
+
+    def _filter(self, pitch, roll, now):
+        # Pitch and roll from atan2(v, sqrt(...)) stay within +-90 degrees,
+        # so they can be smoothed directly without wrap-around handling
+        if self.pitch is None:
+            self.pitch, self.roll = pitch, roll
+        else:
+            dt = max(now - self.last_time, 0.0)
+            alpha = dt / (self.time_constant + dt) if self.time_constant > 0 else 1.0
+            self.pitch += alpha * (pitch - self.pitch)
+            self.roll += alpha * (roll - self.roll)
+        self.last_time = now
+
+    def _classify(self, pitch, roll):
+        # Thresholds are widened in favour of the current posture so noise
+        # around a boundary does not flip the label
+        h = self.hysteresis
+        upright = UPRIGHT_LIMIT - h
+        lying = LYING_LIMIT + h
+        if self.posture == STANDING:
+            upright = UPRIGHT_LIMIT + h
+        elif self.posture == LYING:
+            lying = LYING_LIMIT - h
+
+        if abs(pitch) < upright and abs(roll) < upright:
+            return STANDING
+        elif abs(roll) > lying:
+            return LYING
+        return SITTING
+
+    def update(self, pitch, roll, now=None):
+        """Feed one sample's orientation; returns a PostureTransition when the posture changes"""
+        if now is None:
+            now = time.time()
+        self._filter(pitch, roll, now)
+
+        candidate = self._classify(self.pitch, self.roll)
+
+        if self.posture is None:
+            # First sample: accept immediately
+            self.posture = candidate
+            self.posture_since = now
+            return None
+
+        if candidate == self.posture:
+            self.candidate = None
+            return None
+
+        if candidate != self.candidate:
+            self.candidate = candidate
+            self.candidate_since = now
+            return None
+
+        if now - self.candidate_since < self.min_dwell:
+            return None
+
+        # Candidate held long enough: the change took effect when it started
+        changed_at = self.candidate_since
+        duration = changed_at - self.posture_since
+        self.totals[self.posture] += duration
+        transition = PostureTransition(self.posture, candidate, changed_at, duration)
+
+        self.posture = candidate
+        self.posture_since = changed_at
+        self.candidate = None
+
+        if self.on_transition:
+            self.on_transition(transition)
+        return transition
+
+    def current_dwell(self, now=None):
+        """Seconds spent in the current posture so far"""
+        if self.posture_since is None:
+            return 0.0
+        if now is None:
+            now = time.time()
+        return now - self.posture_since
+
+    def time_in_posture(self, now=None):
+        """Cumulative seconds per posture, including the current run"""
+        totals = dict(self.totals)
+        if self.posture is not None:
+            totals[self.posture] += self.current_dwell(now)
+        return totals
+
+    def sedentary_seconds(self, now=None):
+        totals = self.time_in_posture(now)
+        return totals[SITTING] + totals[LYING]
@@ -0,0 +1,214 @@
+import math
+import time
+from collections import namedtuple, deque
+
+ENTRY = 'entry'
+EXIT = 'exit'
+
+# Emitted when the confirmed occupancy changes; duration is the time spent in the previous state
+OccupancyEvent = namedtuple('OccupancyEvent', ['kind', 'timestamp', 'distance', 'confidence', 'duration'])
+
+
+class DistanceFilter(object):
+    """Median-of-N spike removal followed by a 1-D Kalman filter with an innovation gate
+
+    The median drops single-reading glitches (multipath echoes, a cable
+    twitch). The Kalman filter smooths what is left; a reading further
+    than gate standard deviations from the estimate is rejected as an
+    outlier, unless max_rejects readings in a row disagree, in which case
+    the scene really changed (someone walked in) and the filter restarts
+    from the new value.
+    """
+
+    def __init__(self, window=3, process_noise=400.0, measurement_noise=25.0, gate=4.0, max_rejects=3):
+        self.window = deque(maxlen=window)
+        self.process_noise = process_noise          # cm^2 per second the true distance may drift
+        self.measurement_noise = measurement_noise  # cm^2, HC-SR04 jitter
+        self.gate = gate
+        self.max_rejects = max_rejects
+        self.estimate = None
+        self.variance = 0.0
+        self.last_time = None
+        self.rejects = 0
+        self.rejected = 0
+
+    def reset(self):
+        self.window.clear()
+        self.estimate = None
+        self.rejects = 0
+
+    def update(self, distance, now):
+        """Feed one raw reading; returns the filtered distance, or None if it was rejected"""
+        self.window.append(distance)
+        measured = sorted(self.window)[len(self.window) // 2]
+        if self.estimate is None:
+            self.estimate, self.variance, self.last_time = measured, self.measurement_noise, now
+            return self.estimate
+
+        # Predict: distance unchanged, uncertainty grows with elapsed time
+        dt = max(now - self.last_time, 0.0)
+        self.last_time = now
+        variance = self.variance + self.process_noise * dt
+        innovation = measured - self.estimate
+        spread = variance + self.measurement_noise
+        if innovation * innovation > self.gate * self.gate * spread:
+            self.rejects += 1
+            self.rejected += 1
+            if self.rejects < self.max_rejects:
+                self.variance = variance
+                return None
+            # Persistent disagreement: restart at the new distance
+            self.window.clear()
+            self.window.append(distance)
+            self.estimate, self.variance, self.rejects = distance, self.measurement_noise, 0
+            return self.estimate
+
+        self.rejects = 0
+        gain = variance / spread
+        self.estimate += gain * innovation
+        self.variance = (1 - gain) * variance
+        return self.estimate
+
+
+class OccupancyEngine(object):
+    """Present/absent state from ultrasonic distance, with confidence and dwell times
+
+    Each filtered reading is turned into a likelihood of someone being in
+    front of the sensor (a logistic curve centred between the present and
+    absent distances). Confidence follows that likelihood with a time
+    constant, so one odd reading moves it only a little. The state flips
+    when confidence crosses enter_confidence / exit_confidence and stays
+    there for entry_dwell / exit_dwell seconds; exits need longer, since
+    a false "left the room" is what starts absence alerts.
+
+    interval is the suggested delay before the next reading: fast while
+    the state is uncertain or changing, slow once it has been stable for
+    settle_time.
+    """
+
+    def __init__(self, present_distance=200, absent_distance=300, enter_confidence=0.8, exit_confidence=0.2,
+                 entry_dwell=1.0, exit_dwell=5.0, time_constant=2.0, fast_interval=0.2, normal_interval=1.0,
+                 slow_interval=2.0, settle_time=30.0, distance_filter=None, on_event=None):
+        self.midpoint = (present_distance + absent_distance) / 2
+        self.scale = max(absent_distance - present_distance, 1) / 8  # likelihood 0.98/0.02 at the thresholds
+        self.enter_confidence = enter_confidence
+        self.exit_confidence = exit_confidence
+        self.entry_dwell = entry_dwell
+        self.exit_dwell = exit_dwell
+        self.time_constant = time_constant
+        self.fast_interval = fast_interval
+        self.normal_interval = normal_interval
+        self.slow_interval = slow_interval
+        self.settle_time = settle_time
+        self.filter = distance_filter or DistanceFilter()
+        self.on_event = on_event
+
+        self.present = False
+        self.confidence = 0.5
+        self.distance = None
+        self.state_since = None
+        self.candidate_since = None
+        self.last_time = None
+        self.last_change = None  # last time anything pointed at a state change
+        self.readings = 0
+        self.missed = 0
+        self.interval = normal_interval
+
+    def likelihood(self, distance):
+        """Probability that distance means someone is present"""
+        x = (distance - self.midpoint) / self.scale
+        if x > 40:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(x))
+
+    def update(self, distance, now=None):
+        """Feed one raw reading (None for a failed one); returns an OccupancyEvent when the state changes"""
+        if now is None:
+            now = time.time()
+        if self.state_since is None:
+            self.state_since = self.last_change = self.last_time = now
+        dt = max(now - self.last_time, 0.0)
+        self.last_time = now
+
+        filtered = None
+        if distance is None:
+            self.missed += 1
+        else:
+            self.readings += 1
+            filtered = self.filter.update(distance, now)
+
+        if filtered is None:
+            # No usable evidence: hold the state. A rejected reading may be the
+            # start of a real change, so confirm it quickly; a failed one is not
+            if distance is not None or self.candidate_since is not None:
+                self.last_change = now
+                self.interval = self.fast_interval
+            else:
+                self.interval = self.normal_interval
+            return None
+
+        self.distance = filtered
+        alpha = dt / (self.time_constant + dt) if dt > 0 else 1.0 / (self.time_constant + 1.0)
+        self.confidence += alpha * (self.likelihood(filtered) - self.confidence)
+
+        event = self._decide(now)
+        self._schedule(now)
+        return event
+
+    def _decide(self, now):
+        if self.present:
+            wants_change = self.confidence < self.exit_confidence
+            dwell = self.exit_dwell
+        else:
+            wants_change = self.confidence > self.enter_confidence
+            dwell = self.entry_dwell
+
+        if not wants_change:
+            self.candidate_since = None
+            return None
+        self.last_change = now
+        if self.candidate_since is None:
+            self.candidate_since = now
+            return None
+        if now - self.candidate_since < dwell:
+            return None
+
+        # Held long enough: the change took effect when it started
+        changed_at = self.candidate_since
+        event = OccupancyEvent(EXIT if self.present else ENTRY, changed_at, self.distance,
+                               self.confidence, changed_at - self.state_since)
+        self.present = not self.present
+        self.state_since = changed_at
+        self.candidate_since = None
+        if self.on_event:
+            self.on_event(event)
+        return event
+
+    def _schedule(self, now):
+        uncertain = self.exit_confidence <= self.confidence <= self.enter_confidence
+        if self.candidate_since is not None or uncertain:
+            self.last_change = now
+            self.interval = self.fast_interval
+        elif now - self.last_change >= self.settle_time:
+            self.interval = self.slow_interval
+        else:
+            self.interval = self.normal_interval
+
+    def state_duration(self, now=None):
+        """Seconds spent in the current state so far"""
+        if self.state_since is None:
+            return 0.0
+        if now is None:
+            now = time.time()
+        return now - self.state_since
+
+    def stats(self):
+        return {
+            'present': self.present,
+            'confidence': self.confidence,
+            'distance': self.distance,
+            'interval': self.interval,
+            'readings': self.readings,
+            'missed': self.missed,
+            'rejected': self.filter.rejected,
+        }
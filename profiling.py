@@ -0,0 +1,146 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+import metrics
+
+# MONITOR_PROFILE=1 turns stage timing on; MONITOR_PROFILE_STACKS=<file> also samples stacks
+ENABLE_ENV = 'MONITOR_PROFILE'
+STACKS_ENV = 'MONITOR_PROFILE_STACKS'
+
+ENABLED = os.environ.get(ENABLE_ENV, '').lower() in ('1', 'true', 'yes', 'on')
+
+# Stages are mostly microseconds to a few milliseconds (I2C transfers, detection), up to seconds (HTTP)
+STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+STAGE_SECONDS = metrics.histogram('stage_duration_seconds', 'Time per monitoring loop stage',
+                                  ('loop', 'stage'), buckets=STAGE_BUCKETS)
+
+
+class _NullStage(object):
+    """What stage() hands out while profiling is off: entering it does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter_ns() - self.start) / 1e9)
+        return False
+
+
+def stage(loop, name):
+    """Context manager timing one stage of a loop into stage_duration_seconds"""
+    if not ENABLED:
+        return NULL_STAGE
+    return _Stage(STAGE_SECONDS.labels(loop, name))
+
+
+def timed(loop, name=None):
+    """Decorator version of stage(); leaves the function untouched while profiling is off"""
+
+    def decorate(func):
+        if not ENABLED:
+            return func
+        histogram = STAGE_SECONDS.labels(loop, name or func.__name__)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe((time.perf_counter_ns() - start) / 1e9)
+
+        return wrapper
+
+    return decorate
+
+
+def enable(on=True):
+    """Toggle timing at runtime; decorators applied while off stay off"""
+    global ENABLED
+    ENABLED = on
+
+
+def report():
+    """(loop, stage, count, mean_ms, total_s) rows, most total time first"""
+    rows = []
+    for (loop, name), child in list(STAGE_SECONDS.children.items()):
+        count = sum(child.counts)
+        if count:
+            rows.append((loop, name, count, child.sum / count * 1000, child.sum))
+    return sorted(rows, key=lambda row: row[4], reverse=True)
+
+
+class StackSampler(object):
+    """Samples every thread's Python stack and writes collapsed stacks
+
+    The output ("thread;module:func;module:func count" per line) feeds
+    straight into flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, path, interval=0.005):
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                    frames.append(f'{module}:{code.co_name}')
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.dump()
+
+    def dump(self):
+        with open(self.path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def start_from_env():
+    """Start the stack sampler when MONITOR_PROFILE_STACKS names an output file"""
+    path = os.environ.get(STACKS_ENV)
+    if not path:
+        return None
+    return StackSampler(path).start()
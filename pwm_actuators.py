@@ -0,0 +1,239 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+# GPIO pin -> (pwmchip, channel) for the Pi's two hardware PWM channels
+# (needs dtoverlay=pwm or pwm-2chan in /boot/config.txt)
+HARDWARE_PWM_PINS = {12: (0, 0), 18: (0, 0), 13: (0, 1), 19: (0, 1)}
+
+SYSFS_PWM = '/sys/class/pwm'
+
+
+class SysfsPWM(object):
+    """Kernel hardware PWM through /sys/class/pwm/pwmchipN"""
+
+    name = 'sysfs'
+
+    def __init__(self, pin, frequency):
+        if pin not in HARDWARE_PWM_PINS:
+            raise ValueError(f"GPIO{pin} has no hardware PWM channel")
+        chip, channel = HARDWARE_PWM_PINS[pin]
+        chip_path = os.path.join(SYSFS_PWM, f'pwmchip{chip}')
+        if not os.path.isdir(chip_path):
+            raise OSError(f"{chip_path} not found")
+        self.path = os.path.join(chip_path, f'pwm{channel}')
+        if not os.path.isdir(self.path):
+            self._write(os.path.join(chip_path, 'export'), channel)
+            # udev needs a moment to fix permissions on the new files
+            for _ in range(50):
+                if os.access(os.path.join(self.path, 'period'), os.W_OK):
+                    break
+                time.sleep(0.01)
+        self.period_ns = 0
+        self.duty = 0
+        self._write(os.path.join(self.path, 'duty_cycle'), 0)
+        self.set_frequency(frequency)
+        self._write(os.path.join(self.path, 'enable'), 1)
+
+    def _write(self, path, value):
+        with open(path, 'w') as f:
+            f.write(str(value))
+
+    def set_frequency(self, frequency):
+        period_ns = int(1e9 / frequency)
+        # duty_cycle may never exceed period, so shrink it first when needed
+        self._write(os.path.join(self.path, 'duty_cycle'), 0)
+        self._write(os.path.join(self.path, 'period'), period_ns)
+        self.period_ns = period_ns
+        self.set_duty(self.duty)
+
+    def set_duty(self, percent):
+        self.duty = percent
+        self._write(os.path.join(self.path, 'duty_cycle'), int(self.period_ns * percent / 100))
+
+    def stop(self):
+        self._write(os.path.join(self.path, 'duty_cycle'), 0)
+        self._write(os.path.join(self.path, 'enable'), 0)
+
+
+class PigpioPWM(object):
+    """DMA-timed PWM from the pigpio daemon (hardware PWM on the PWM pins)"""
+
+    name = 'pigpio'
+
+    def __init__(self, pin, frequency):
+        import pigpio
+        self.pi = pigpio.pi()
+        if not self.pi.connected:
+            raise OSError("pigpiod is not running")
+        self.pin = pin
+        self.hardware = pin in HARDWARE_PWM_PINS
+        self.frequency = frequency
+        self.duty = 0
+        if not self.hardware:
+            self.pi.set_PWM_range(pin, 1000)
+        self.set_frequency(frequency)
+
+    def set_frequency(self, frequency):
+        self.frequency = frequency
+        if not self.hardware:
+            self.pi.set_PWM_frequency(self.pin, int(frequency))
+        self.set_duty(self.duty)
+
+    def set_duty(self, percent):
+        self.duty = percent
+        if self.hardware:
+            # hardware_PWM duty is in millionths
+            self.pi.hardware_PWM(self.pin, int(self.frequency), int(percent * 10000))
+        else:
+            self.pi.set_PWM_dutycycle(self.pin, int(percent * 10))
+
+    def stop(self):
+        if self.hardware:
+            self.pi.hardware_PWM(self.pin, 0, 0)
+        else:
+            self.pi.set_PWM_dutycycle(self.pin, 0)
+        self.pi.stop()
+
+
+class SoftwarePWM(object):
+    """RPi.GPIO software PWM, started once and then only updated"""
+
+    name = 'software'
+
+    def __init__(self, pin, frequency):
+        import RPi.GPIO as GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        GPIO.setup(pin, GPIO.OUT)
+        self.pwm = GPIO.PWM(pin, frequency)
+        self.pwm.start(0)
+
+    def set_frequency(self, frequency):
+        self.pwm.ChangeFrequency(frequency)
+
+    def set_duty(self, percent):
+        self.pwm.ChangeDutyCycle(percent)
+
+    def stop(self):
+        self.pwm.stop()
+
+
+BACKENDS = {'sysfs': SysfsPWM, 'pigpio': PigpioPWM, 'software': SoftwarePWM}
+
+
+def open_pwm(pin, frequency, prefer=('sysfs', 'pigpio', 'software')):
+    """Open the first backend that works for this pin, falling back to software PWM"""
+    errors = []
+    for name in prefer:
+        try:
+            return BACKENDS[name](pin, frequency)
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+    raise OSError("No PWM backend available (" + "; ".join(errors) + ")")
+
+
+# Declarative sequence steps
+Hold = namedtuple('Hold', ['duty', 'seconds'])
+Ramp = namedtuple('Ramp', ['start', 'end', 'seconds', 'steps'])
+Tone = namedtuple('Tone', ['frequency', 'seconds', 'duty'])
+Rest = namedtuple('Rest', ['seconds'])
+
+
+def beeps(frequency, count, on=0.1, off=0.1, duty=50):
+    """Sequence of count short tones"""
+    sequence = []
+    for _ in range(count):
+        sequence += [Tone(frequency, on, duty), Rest(off)]
+    return sequence
+
+
+class PwmActuator(object):
+    """Plays declarative duty/tone sequences on a PWM backend in a background thread"""
+
+    def __init__(self, pwm):
+        self.pwm = pwm
+        self.lock = threading.Lock()
+        self.cancel = threading.Event()
+        self.thread = None
+        self.updates = []  # (intended, actual) perf_counter times of the last sequence
+
+    def play(self, sequence, repeat=1, blocking=False, release=True):
+        # release: output off (duty 0) once the sequence finishes
+        self.stop_sequence()
+        self.cancel = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(list(sequence), repeat, release, self.cancel),
+                                       daemon=True)
+        self.thread.start()
+        if blocking:
+            self.thread.join()
+
+    def stop_sequence(self):
+        self.cancel.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _set(self, due, duty=None, frequency=None):
+        with self.lock:
+            if frequency is not None:
+                self.pwm.set_frequency(frequency)
+            if duty is not None:
+                self.pwm.set_duty(duty)
+        self.updates.append((due, time.perf_counter()))
+
+    def _run(self, sequence, repeat, release, cancel):
+        # Steps are scheduled against absolute deadlines so errors do not accumulate
+        self.updates = []
+        due = time.perf_counter()
+        for _ in range(repeat):
+            for step in sequence:
+                if isinstance(step, Ramp):
+                    for i in range(step.steps + 1):
+                        self._set(due, duty=step.start + (step.end - step.start) * i / step.steps)
+                        if i == step.steps:
+                            break
+                        due += step.seconds / step.steps
+                        if cancel.wait(max(due - time.perf_counter(), 0)):
+                            return
+                    continue
+                if isinstance(step, Tone):
+                    self._set(due, duty=step.duty, frequency=step.frequency)
+                elif isinstance(step, Hold):
+                    self._set(due, duty=step.duty)
+                else:
+                    self._set(due, duty=0)
+                due += step.seconds
+                if cancel.wait(max(due - time.perf_counter(), 0)):
+                    return
+        if release:
+            self._set(due, duty=0)
+
+    def close(self):
+        self.stop_sequence()
+        self.pwm.stop()
+
+
+class Servo(PwmActuator):
+    """Hobby servo on a 50Hz PWM channel"""
+
+    def __init__(self, pwm, min_duty=3.0, max_duty=12.0, max_angle=180):
+        super().__init__(pwm)
+        self.min_duty = min_duty
+        self.max_duty = max_duty
+        self.max_angle = max_angle
+        self.angle = None
+
+    def duty_for(self, angle):
+        return self.min_duty + (self.max_duty - self.min_duty) * angle / self.max_angle
+
+    def set_angle(self, angle):
+        self.angle = angle
+        self._set(time.perf_counter(), duty=self.duty_for(angle))
+
+    def move(self, angle, seconds=1.0, steps=20, blocking=False):
+        """Ramp smoothly from the current angle instead of jumping"""
+        start = self.duty_for(self.angle if self.angle is not None else angle)
+        self.angle = angle
+        self.play([Ramp(start, self.duty_for(angle), seconds, steps)], blocking=blocking, release=False)
@@ -0,0 +1,160 @@
+import math
+import time
+
+import metrics
+from log_setup import get_logger
+
+log = get_logger('ultrasonic')
+
+READINGS = metrics.counter('ultrasonic_readings_total', 'Ultrasonic readings by result', ('result',))
+READINGS_OK = READINGS.labels('ok')
+READINGS_TIMEOUT = READINGS.labels('timeout')
+READINGS_INVALID = READINGS.labels('invalid')
+READINGS_OUT_OF_RANGE = READINGS.labels('out_of_range')
+READINGS_ERROR = READINGS.labels('error')
+SPEED_OF_SOUND = metrics.gauge('speed_of_sound_meters_per_second', 'Speed of sound used for ultrasonic ranging')
+
+# Lookup table range; readings outside it are clamped
+MIN_TEMPERATURE = -10.0
+MAX_TEMPERATURE = 50.0
+TEMPERATURE_STEP = 0.5  # DHT11 resolution is 1 degree, so this adds no visible error
+HUMIDITY_STEP = 10
+
+# Used until the first valid DHT reading, or when it goes stale
+DEFAULT_TEMPERATURE = 20.0
+DEFAULT_HUMIDITY = 50.0
+
+
+def speed_of_sound(temperature, humidity=DEFAULT_HUMIDITY, pressure=101325.0):
+    """Speed of sound in air in m/s
+
+    Dry air: 331.3 * sqrt(1 + T / 273.15). Water vapour is lighter than
+    air and speeds sound up by about 0.16 times its mole fraction; the
+    saturation pressure comes from the Magnus formula.
+    """
+    dry = 331.3 * math.sqrt(1 + temperature / 273.15)
+    saturation = 610.94 * math.exp(17.625 * temperature / (temperature + 243.04))
+    vapour_fraction = humidity / 100 * saturation / pressure
+    return dry * (1 + 0.16 * vapour_fraction)
+
+
+def _build_table():
+    """Half the speed of sound in cm/s (the echo travels there and back), by temperature step and humidity step"""
+    temperatures = int(round((MAX_TEMPERATURE - MIN_TEMPERATURE) / TEMPERATURE_STEP)) + 1
+    return [tuple(speed_of_sound(MIN_TEMPERATURE + i * TEMPERATURE_STEP, humidity) * 50
+                  for humidity in range(0, 101, HUMIDITY_STEP))
+            for i in range(temperatures)]
+
+
+HALF_SPEED_TABLE = _build_table()
+
+
+def half_speed_cm(temperature, humidity):
+    """Table lookup of half the speed of sound in cm/s, nearest entry"""
+    temperature = min(max(temperature, MIN_TEMPERATURE), MAX_TEMPERATURE)
+    humidity = min(max(humidity, 0), 100)
+    row = HALF_SPEED_TABLE[int((temperature - MIN_TEMPERATURE) / TEMPERATURE_STEP + 0.5)]
+    return row[int(humidity / HUMIDITY_STEP + 0.5)]
+
+
+class RangeFinder(object):
+    """HC-SR04 distance measurement compensated for air temperature and humidity
+
+    The climate comes from the last valid DHT11 reading (update_climate(),
+    or on_climate() as an event bus CLIMATE handler), so ranging never
+    waits on the slow DHT11 protocol. A reading older than climate_max_age
+    falls back to 20 degrees C / 50 %. Speed of sound varies about 3.5 %
+    between 15 and 35 degrees C, which is 9 cm at 250 cm.
+    """
+
+    def __init__(self, gpio, trig_pin, echo_pin, min_distance=2, max_distance=400, echo_timeout=0.1,
+                 climate_max_age=1800):
+        self.gpio = gpio
+        self.trig_pin = trig_pin
+        self.echo_pin = echo_pin
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.echo_timeout = echo_timeout  # the HC-SR04 drops echo after ~38 ms without a target
+        self.climate_max_age = climate_max_age
+        self.temperature = None
+        self.humidity = None
+        self.climate_time = 0.0
+        self.half_speed = half_speed_cm(DEFAULT_TEMPERATURE, DEFAULT_HUMIDITY)
+        SPEED_OF_SOUND.set(self.half_speed / 50)
+
+    def setup(self):
+        self.gpio.setup(self.trig_pin, self.gpio.OUT)
+        self.gpio.setup(self.echo_pin, self.gpio.IN)
+
+    def update_climate(self, temperature, humidity, timestamp=None):
+        self.temperature, self.humidity = temperature, humidity
+        self.climate_time = timestamp if timestamp is not None else time.time()
+        self.half_speed = half_speed_cm(temperature, humidity)
+        SPEED_OF_SOUND.set(self.half_speed / 50)
+
+    def on_climate(self, reading):
+        """Event bus handler for event_bus.ClimateReading"""
+        if reading.valid:
+            self.update_climate(reading.temperature, reading.humidity, reading.timestamp)
+
+    def current_half_speed(self, now=None):
+        if self.temperature is not None:
+            if (now or time.time()) - self.climate_time <= self.climate_max_age:
+                return self.half_speed
+            log.info("Climate reading is stale, ranging at %.0f C", DEFAULT_TEMPERATURE)
+            self.temperature = None
+            self.half_speed = half_speed_cm(DEFAULT_TEMPERATURE, DEFAULT_HUMIDITY)
+            SPEED_OF_SOUND.set(self.half_speed / 50)
+        return self.half_speed
+
+    def pulse_to_distance(self, pulse_duration, now=None):
+        return pulse_duration * self.current_half_speed(now)
+
+    def measure(self):
+        """One ranging cycle; distance in cm, or None on timeout or an implausible echo"""
+        gpio = self.gpio
+        try:
+            # Send trigger pulse
+            gpio.output(self.trig_pin, gpio.HIGH)
+            time.sleep(0.00001)  # 10 microseconds
+            gpio.output(self.trig_pin, gpio.LOW)
+
+            pulse_start = pulse_end = 0
+            timeout = time.perf_counter() + self.echo_timeout
+
+            # Wait for echo start
+            while gpio.input(self.echo_pin) == gpio.LOW:
+                pulse_start = time.perf_counter()
+                if pulse_start > timeout:
+                    log.debug("Timeout waiting for echo start")
+                    READINGS_TIMEOUT.inc()
+                    return None
+
+            # Wait for echo end
+            while gpio.input(self.echo_pin) == gpio.HIGH:
+                pulse_end = time.perf_counter()
+                if pulse_end > timeout:
+                    log.debug("Timeout waiting for echo end")
+                    READINGS_TIMEOUT.inc()
+                    return None
+
+            if pulse_end <= pulse_start:
+                log.debug("Invalid pulse timing")
+                READINGS_INVALID.inc()
+                return None
+
+            pulse_duration = pulse_end - pulse_start
+            distance = round(self.pulse_to_distance(pulse_duration), 2)
+            log.debug("Pulse duration: %.6fs, distance: %scm", pulse_duration, distance)
+
+            if self.min_distance <= distance <= self.max_distance:
+                READINGS_OK.inc()
+                return distance
+            log.debug("Distance %scm out of valid range (%s-%scm)", distance, self.min_distance, self.max_distance)
+            READINGS_OUT_OF_RANGE.inc()
+            return None
+
+        except Exception as e:
+            log.warning("Error reading sensor: %s", e)
+            READINGS_ERROR.inc()
+            return None
@@ -0,0 +1,106 @@
+import time
+
+from log_setup import get_logger
+
+try:
+    from adxl345 import Interrupt
+except ImportError:
+    Interrupt = None  # no smbus: only main's mock sensor runs, and it has no interrupts to arm
+
+log = get_logger('accel')
+
+class SamplingProfile(object):
+    """Accelerometer data rate, power mode and polling interval for one activity state"""
+
+    def __init__(self, name, rate_hz, low_power, poll_interval, auto_sleep=False, wakeup_hz=8):
+        self.name = name
+        self.rate_hz = rate_hz
+        self.low_power = low_power
+        self.poll_interval = poll_interval  # seconds between reads in the monitoring thread
+        self.auto_sleep = auto_sleep        # let the ADXL345 drop to wakeup_hz on inactivity
+        self.wakeup_hz = wakeup_hz
+
+    def __repr__(self):
+        return f"SamplingProfile({self.name}, {self.rate_hz}Hz, low_power={self.low_power})"
+
+
+ACTIVE = SamplingProfile('active', 100, False, 0.1)
+BURST = SamplingProfile('burst', 400, False, 0.05)
+IDLE = SamplingProfile('idle', 50, True, 0.5, auto_sleep=True)
+NIGHT = SamplingProfile('night', 25, True, 1.0, auto_sleep=True, wakeup_hz=8)
+
+PROFILES = {profile.name: profile for profile in (ACTIVE, BURST, IDLE, NIGHT)}
+
+
+class SamplingController(object):
+    """Switches the ADXL345 between sampling profiles based on activity and night hours
+
+    Activity and free-fall interrupts stay armed in every profile, and their
+    latched INT_SOURCE bits are checked on each poll, so an impact during a
+    slow profile still ramps sampling back up on the next read.
+    """
+
+    def __init__(self, acc, is_night=None, idle_after=60, burst_for=10, profiles=PROFILES):
+        self.acc = acc
+        self.is_night = is_night
+        self.idle_after = idle_after  # seconds without motion before slowing down
+        self.burst_for = burst_for    # seconds at the burst rate after a free-fall interrupt
+        self.profiles = profiles
+
+        self.profile = None
+        self.last_motion = time.time()
+        self.burst_until = 0
+        self.switches = 0
+
+    def configure(self):
+        """Arm activity/inactivity/free-fall detection and start in the active profile"""
+        self.acc.set_activity_detection(act_g=0.25, inact_g=0.1875, inact_seconds=self.idle_after)
+        self.acc.set_free_fall_detection(threshold_g=0.375, time_ms=100)
+        if Interrupt is not None:
+            self.acc.enable_interrupts(Interrupt.ACTIVITY | Interrupt.INACTIVITY | Interrupt.FREE_FALL)
+        self.apply(self.profiles['active'])
+
+    def apply(self, profile):
+        if profile is self.profile:
+            return
+        self.acc.set_data_rate_hz(profile.rate_hz, low_power=profile.low_power)
+        self.acc.set_power_mode(link=profile.auto_sleep, auto_sleep=profile.auto_sleep,
+                                wakeup_hz=profile.wakeup_hz)
+        log.info("Sampling profile: %s -> %s", self.profile.name if self.profile else None, profile.name)
+        self.profile = profile
+        self.switches += 1
+
+    def update(self, moving, now=None):
+        """Pick the profile for this poll; returns the seconds to sleep before the next read
+
+        moving is whether the polled sample strays from 1g (orientation.is_moving);
+        the ADXL345 activity flag counts as motion too, since it also sees
+        movement between polls.
+        """
+        if now is None:
+            now = time.time()
+
+        activity, _, free_fall = self.acc.read_activity_flags()
+        if moving or activity:
+            self.last_motion = now
+        if free_fall:
+            self.last_motion = now
+            self.burst_until = now + self.burst_for
+
+        if now < self.burst_until:
+            profile = self.profiles['burst']
+        elif now - self.last_motion < self.idle_after:
+            profile = self.profiles['active']
+        elif self.is_night and self.is_night():
+            profile = self.profiles['night']
+        else:
+            profile = self.profiles['idle']
+
+        self.apply(profile)
+        return profile.poll_interval
+
+    def hold_active(self, seconds, now=None):
+        """Keep at least the active rate for a while (e.g. while confirming a fall)"""
+        if now is None:
+            now = time.time()
+        self.last_motion = max(self.last_motion, now - self.idle_after + seconds)
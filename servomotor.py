@@ -1,15 +1,17 @@
-import RPi.GPIO as GPIO #import RPi.GPIO module
 from time import sleep
+from pwm_actuators import open_pwm, Servo
 
-GPIO.setmode(GPIO.BCM) #choose BCM mode
-GPIO.setwarnings(False)
-GPIO.setup(26,GPIO.OUT) #set GPIO 26 as output
+# 50Hz PWM on GPIO 26 (software PWM; use GPIO 12/13/18/19 for hardware PWM)
+servo = Servo(open_pwm(26, 50), min_duty=3, max_duty=12)
+print('PWM backend:', servo.pwm.name)
 
-PWM=GPIO.PWM(26,50) #set 50Hz PWM output at GPIO26
-while (True):
-    PWM.start(3) #3% duty cycle
-    print('duty cycle:', 3) #3 o'clock position
-    sleep(4) #allow time for movement
-    PWM.start(12) #13% duty cycle
-    print('duty cycle:', 12) #9 o'clock position
-    sleep(4) #allow time for movement
+try:
+    while (True):
+        servo.move(0, seconds=1) #3% duty cycle, 3 o'clock position
+        print('duty cycle:', 3)
+        sleep(4) #allow time for movement
+        servo.move(180, seconds=1) #12% duty cycle, 9 o'clock position
+        print('duty cycle:', 12)
+        sleep(4) #allow time for movement
+except KeyboardInterrupt:
+    servo.close()
@@ -0,0 +1,124 @@
+import json
+import os
+import signal
+import threading
+import time
+
+from log_setup import get_logger
+
+log = get_logger('shutdown')
+
+
+def save_checkpoint(path, state):
+    """Write state as JSON atomically: readers see the old file or the new one, never half of it"""
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path, max_age=None):
+    """State saved by save_checkpoint(), or None if missing, unreadable or older than max_age seconds"""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        log.warning("Ignoring unreadable checkpoint %s: %s", path, e)
+        return None
+    saved_at = state.get('saved_at', 0)
+    if max_age is not None and time.time() - saved_at > max_age:
+        log.info("Ignoring checkpoint %s from %.0fs ago", path, time.time() - saved_at)
+        return None
+    return state
+
+
+class Shutdown(object):
+    """Coordinated shutdown within a fixed deadline
+
+    install() turns SIGTERM and SIGINT into a request that the main loop
+    polls through requested (or waits on with wait()); a second signal
+    exits immediately. run() then calls the registered steps in order,
+    each in its own thread and with its own budget: a step gets at most
+    its budget, and never the time reserved for the budgets of the steps
+    after it, so one stuck on the network cannot starve the rest. Steps
+    still running when their time is up are abandoned and logged.
+    """
+
+    def __init__(self, deadline=10.0):
+        self.deadline = deadline
+        self.event = threading.Event()
+        self.steps = []
+        self.reason = None
+
+    def install(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        for signum in signals:
+            signal.signal(signum, self._handle)
+
+    def _handle(self, signum, frame):
+        if self.event.is_set():
+            os._exit(128 + signum)  # second signal: the operator does not want to wait
+        self.request(signal.Signals(signum).name)
+
+    def request(self, reason):
+        if not self.event.is_set():
+            self.reason = reason
+            self.event.set()
+
+    @property
+    def requested(self):
+        return self.event.is_set()
+
+    def wait(self, timeout=None):
+        return self.event.wait(timeout)
+
+    def add(self, name, func, *args, budget=None):
+        """Register a step; steps run in the order they were added
+
+        budget is the most seconds the step may take, reserved for it from
+        the deadline; None lets it use whatever the later steps leave.
+        """
+        self.steps.append((name, func, args, budget))
+
+    def run(self):
+        """Run every step within the deadline; returns {name: 'ok' | 'failed' | 'timeout' | 'skipped'}"""
+        start = time.monotonic()
+        end = start + self.deadline
+        log.info("Shutting down (%s), %.0fs deadline", self.reason or 'requested', self.deadline)
+        outcomes = {}
+        reserved = sum(step[3] for step in self.steps if step[3] is not None)
+        for name, func, args, budget in self.steps:
+            if budget is not None:
+                reserved -= budget
+            # Whatever the later steps' budgets leave, capped by this step's own budget
+            remaining = end - time.monotonic() - reserved
+            if budget is not None:
+                remaining = min(remaining, budget)
+            if remaining <= 0:
+                outcomes[name] = 'skipped'
+                log.warning("Shutdown step %s skipped, no time left", name)
+                continue
+            result = []
+
+            def call(func=func, args=args, result=result):
+                try:
+                    func(*args)
+                    result.append('ok')
+                except Exception as e:
+                    log.exception("Shutdown step %s failed: %s", name, e)
+                    result.append('failed')
+
+            step_start = time.monotonic()
+            thread = threading.Thread(target=call, name=f'shutdown-{name}', daemon=True)
+            thread.start()
+            thread.join(remaining)
+            outcomes[name] = result[0] if result else 'timeout'
+            if result:
+                log.info("Shutdown step %s: %s in %.3fs", name, outcomes[name], time.monotonic() - step_start)
+            else:
+                log.warning("Shutdown step %s still running after %.1fs, abandoned", name, remaining)
+        log.info("Shutdown finished in %.3fs", time.monotonic() - start)
+        return outcomes
@@ -0,0 +1,249 @@
+import os
+import socket
+import threading
+import time
+
+import metrics
+from log_setup import get_logger
+
+log = get_logger('supervisor')
+
+WORKER_UP = metrics.gauge('worker_up', '1 while a supervised worker is running and heartbeating', ('worker',))
+WORKER_HEARTBEAT_AGE = metrics.gauge('worker_heartbeat_age_seconds', 'Seconds since the last heartbeat', ('worker',))
+WORKER_RESTARTS = metrics.counter('worker_restarts_total', 'Supervised worker restarts by cause', ('worker', 'cause'))
+WATCHDOG_PINGS = metrics.counter('systemd_watchdog_pings_total', 'WATCHDOG=1 notifications sent to systemd')
+
+
+class SystemdNotifier(object):
+    """Minimal sd_notify(3) over the NOTIFY_SOCKET datagram socket
+
+    A no-op when the service was not started by systemd with Type=notify.
+    Watchdog pings are sent when the unit sets WatchdogSec=, e.g.:
+
+        [Service]
+        Type=notify
+        NotifyAccess=all
+        WatchdogSec=30
+        Restart=on-failure
+    """
+
+    def __init__(self, address=None):
+        address = address if address is not None else os.environ.get('NOTIFY_SOCKET')
+        if address and address.startswith('@'):
+            address = '\0' + address[1:]  # abstract namespace
+        self.address = address or None
+        self.sock = None
+        if self.address:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)  # never stall the supervisor on a full socket queue
+        self.watchdog_interval = None
+        usec = os.environ.get('WATCHDOG_USEC')
+        pid = os.environ.get('WATCHDOG_PID')
+        if self.sock and usec and (not pid or int(pid) == os.getpid()):
+            # Ping at half the timeout, as sd_watchdog_enabled(3) recommends
+            self.watchdog_interval = int(usec) / 1e6 / 2
+
+    def notify(self, state):
+        if not self.sock:
+            return False
+        try:
+            self.sock.sendto(state.encode(), self.address)
+            return True
+        except OSError as e:
+            log.warning("sd_notify %r failed: %s", state, e)
+            return False
+
+    def ready(self, status=None):
+        return self.notify('READY=1' + (f'\nSTATUS={status}' if status else ''))
+
+    def status(self, status):
+        return self.notify(f'STATUS={status}')
+
+    def watchdog(self):
+        if self.notify('WATCHDOG=1'):
+            WATCHDOG_PINGS.inc()
+
+    def stopping(self):
+        return self.notify('STOPPING=1')
+
+
+class Worker(object):
+    def __init__(self, name, target, args, stall_timeout, critical):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.stall_timeout = stall_timeout
+        self.critical = critical
+        self.thread = None
+        self.generation = 0
+        self.last_beat = 0.0
+        self.started_at = 0.0
+        self.restart_at = None  # monotonic time of a scheduled restart
+        self.failures = 0       # consecutive failures, drives the backoff
+        self.restarts = 0
+        self.abandoned = 0      # stalled threads left behind (Python threads cannot be killed)
+
+    def heartbeat_age(self, now=None):
+        return (now or time.monotonic()) - self.last_beat
+
+    def healthy(self, now=None):
+        return (self.restart_at is None and self.thread is not None and self.thread.is_alive()
+                and self.heartbeat_age(now) <= self.stall_timeout)
+
+
+class Supervisor(object):
+    """Runs worker threads, watches their heartbeats and restarts them
+
+    Workers are loops that call beat() once per iteration and stop when it
+    returns False:
+
+        while shared_data['running'] and supervisor.beat():
+            ...
+
+    A worker that raises, returns, or goes stall_timeout seconds without a
+    heartbeat is restarted after a backoff that doubles with each
+    consecutive failure up to max_backoff, and resets once the worker has
+    stayed healthy for stable_after seconds. A stalled thread cannot be
+    killed; it is abandoned and beat() returns False in it if it ever
+    wakes up, so two generations never run the loop at once.
+
+    While every critical worker is healthy, WATCHDOG=1 is sent to systemd.
+    If one stays unhealthy (say an I2C read that hangs again after each
+    restart) the pings stop and systemd's WatchdogSec restarts the whole
+    service.
+    """
+
+    def __init__(self, check_interval=1.0, initial_backoff=1.0, max_backoff=60.0, stable_after=60.0,
+                 notifier=None):
+        self.check_interval = check_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.notifier = notifier if notifier is not None else SystemdNotifier()
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_ping = 0.0
+
+    def add(self, name, target, args=(), stall_timeout=30.0, critical=True):
+        worker = Worker(name, target, args, stall_timeout, critical)
+        with self.lock:
+            self.workers[name] = worker
+        WORKER_UP.labels(name).set_function(lambda: 1 if worker.healthy() else 0)
+        WORKER_HEARTBEAT_AGE.labels(name).set_function(lambda: worker.heartbeat_age() if worker.thread else 0)
+        WORKER_RESTARTS.labels(name, 'crashed')
+        WORKER_RESTARTS.labels(name, 'stalled')
+        if self.thread is not None:
+            self._spawn(worker)
+        return worker
+
+    def beat(self):
+        """Record a heartbeat for the calling worker; False once it has been replaced"""
+        worker = getattr(self.local, 'worker', None)
+        if worker is None:
+            return True  # not started by this supervisor
+        if self.local.generation != worker.generation:
+            return False
+        worker.last_beat = time.monotonic()
+        return True
+
+    def _run(self, worker, generation):
+        self.local.worker, self.local.generation = worker, generation
+        try:
+            worker.target(*worker.args)
+        except Exception:
+            log.exception("Worker %s crashed", worker.name)
+        else:
+            if generation == worker.generation and not self.stop_event.is_set():
+                log.error("Worker %s returned unexpectedly", worker.name)
+
+    def _spawn(self, worker):
+        worker.generation += 1
+        worker.restart_at = None
+        worker.started_at = worker.last_beat = time.monotonic()
+        worker.thread = threading.Thread(target=self._run, args=(worker, worker.generation),
+                                         name=f'{worker.name}-{worker.generation}', daemon=True)
+        worker.thread.start()
+
+    def _schedule_restart(self, worker, cause, now):
+        delay = min(self.initial_backoff * 2 ** worker.failures, self.max_backoff)
+        worker.failures += 1
+        worker.restart_at = now + delay
+        if cause == 'stalled':
+            worker.abandoned += 1
+            worker.generation += 1  # the stuck thread exits at its next beat(), if it ever gets one
+        WORKER_RESTARTS.labels(worker.name, cause).inc()
+        log.error("Worker %s %s (heartbeat %.1fs ago), restarting in %.1fs",
+                  worker.name, cause, worker.heartbeat_age(now), delay)
+
+    def check(self, now=None):
+        """One supervision pass; returns True when every critical worker is healthy"""
+        now = now or time.monotonic()
+        all_healthy = True
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    worker.restarts += 1
+                    log.warning("Restarting worker %s (restart %d)", worker.name, worker.restarts)
+                    self._spawn(worker)
+            elif not worker.thread.is_alive():
+                self._schedule_restart(worker, 'crashed', now)
+            elif worker.heartbeat_age(now) > worker.stall_timeout:
+                self._schedule_restart(worker, 'stalled', now)
+            elif worker.failures and now - worker.started_at >= self.stable_after:
+                worker.failures = 0
+            if worker.critical and not worker.healthy(now):
+                all_healthy = False
+        return all_healthy
+
+    def _loop(self):
+        while not self.stop_event.wait(self.check_interval):
+            try:
+                healthy = self.check()
+            except Exception:
+                log.exception("Supervision pass failed")
+                continue
+            now = time.monotonic()
+            interval = self.notifier.watchdog_interval
+            if healthy and interval and now - self.last_ping >= interval:
+                self.last_ping = now
+                self.notifier.watchdog()
+
+    def start(self):
+        """Start every added worker and the supervision thread"""
+        with self.lock:
+            workers = list(self.workers.values())
+        if self.notifier.watchdog_interval:
+            self.check_interval = min(self.check_interval, self.notifier.watchdog_interval)
+        for worker in workers:
+            self._spawn(worker)
+        self.thread = threading.Thread(target=self._loop, name='supervisor', daemon=True)
+        self.thread.start()
+
+    def ready(self):
+        """Tell systemd startup is complete"""
+        self.notifier.ready(f"{len(self.workers)} workers running")
+
+    def stop(self, timeout=2.0):
+        self.notifier.stopping()
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for worker in list(self.workers.values()):
+            worker.generation += 1  # beat() now returns False everywhere
+            if worker.thread is not None:
+                worker.thread.join(max(deadline - time.monotonic(), 0))
+        if self.thread is not None:
+            self.thread.join(max(deadline - time.monotonic(), 0))
+
+    def stats(self):
+        now = time.monotonic()
+        return {name: {
+            'healthy': worker.healthy(now),
+            'heartbeat_age': worker.heartbeat_age(now),
+            'restarts': worker.restarts,
+            'abandoned_threads': worker.abandoned,
+        } for name, worker in list(self.workers.items())}
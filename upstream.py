@@ -0,0 +1,184 @@
+"""Upstream services (Telegram, ThingSpeak): credentials and pooled HTTP connections
+
+Credentials live in an INI file (MONITOR_UPSTREAM_CONFIG, default
+upstream.ini), not in the code:
+
+    [telegram]
+    bot_token = 123456:ABC-DEF...
+    chat_id = 6101168212
+
+    [thingspeak]
+    write_api_key = XXXXXXXXXXXXXXXX
+    # Only needed for bulk updates from a gateway
+    channel_id = 1234567
+
+    [gateway]
+    # Device side: send frames to this gateway instead of calling the services
+    address = 192.168.1.10:1884
+    device_id = 12
+    # Both sides: frames are signed with this, the gateway drops any that are not
+    secret = a-long-random-string
+
+    # Gateway side: where each device's readings go
+    [device 12]
+    name = Room 12
+    thingspeak_channel = 1234568
+    thingspeak_key = YYYYYYYYYYYYYYYY
+
+TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, THINGSPEAK_API_KEY and
+GATEWAY_SECRET in the environment override the file.
+"""
+import configparser
+import datetime
+import json
+import os
+import time
+from collections import namedtuple
+
+import metrics
+from log_setup import get_logger
+
+log = get_logger('net')
+
+CONFIG_ENV = 'MONITOR_UPSTREAM_CONFIG'
+DEFAULT_CONFIG_FILE = 'upstream.ini'
+
+TELEGRAM_URL = 'https://api.telegram.org/bot{token}/sendMessage'
+THINGSPEAK_UPDATE_URL = 'https://api.thingspeak.com/update'
+THINGSPEAK_BULK_URL = 'https://api.thingspeak.com/channels/{channel}/bulk_update.json'
+THINGSPEAK_BULK_LIMIT = 960  # updates per bulk request
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+HTTP_SECONDS = metrics.histogram('http_request_duration_seconds', 'Upstream HTTP request latency', ('service',))
+HTTP_ERRORS = metrics.counter('http_errors_total', 'Failed upstream HTTP requests', ('service',))
+
+DeviceConfig = namedtuple('DeviceConfig', ['device_id', 'name', 'thingspeak_channel', 'thingspeak_key'])
+
+
+class UpstreamConfig(object):
+    def __init__(self, telegram_token=None, telegram_chat_id=None, thingspeak_key=None, thingspeak_channel=None,
+                 gateway_address=None, device_id=0, devices=None, gateway_secret=None):
+        self.telegram_token = telegram_token
+        self.telegram_chat_id = telegram_chat_id
+        self.thingspeak_key = thingspeak_key
+        self.thingspeak_channel = thingspeak_channel
+        self.gateway_address = gateway_address
+        self.device_id = device_id
+        self.gateway_secret = gateway_secret
+        self.devices = devices or {}
+
+    @classmethod
+    def load(cls, path=None):
+        """Config from the upstream INI file and the environment; services without credentials stay disabled"""
+        path = path or os.environ.get(CONFIG_ENV, DEFAULT_CONFIG_FILE)
+        parser = configparser.ConfigParser()
+        if not parser.read(path):
+            log.info("No upstream config at %s", path)
+        devices = {}
+        for section in parser.sections():
+            if section.startswith('device '):
+                device_id = int(section.split()[1])
+                values = parser[section]
+                devices[device_id] = DeviceConfig(device_id, values.get('name', f'Device {device_id}'),
+                                                  values.get('thingspeak_channel'), values.get('thingspeak_key'))
+        config = cls(
+            telegram_token=os.environ.get('TELEGRAM_BOT_TOKEN') or parser.get('telegram', 'bot_token', fallback=None),
+            telegram_chat_id=os.environ.get('TELEGRAM_CHAT_ID') or parser.get('telegram', 'chat_id', fallback=None),
+            thingspeak_key=(os.environ.get('THINGSPEAK_API_KEY')
+                            or parser.get('thingspeak', 'write_api_key', fallback=None)),
+            thingspeak_channel=parser.get('thingspeak', 'channel_id', fallback=None),
+            gateway_address=parser.get('gateway', 'address', fallback=None),
+            device_id=parser.getint('gateway', 'device_id', fallback=0),
+            devices=devices,
+            gateway_secret=os.environ.get('GATEWAY_SECRET') or parser.get('gateway', 'secret', fallback=None),
+        )
+        if not config.telegram_token and not config.gateway_address:
+            log.warning("No Telegram credentials configured, messages will not be sent")
+        return config
+
+    def device(self, device_id):
+        """Routing for one device; unknown devices use the [thingspeak] channel"""
+        device = self.devices.get(device_id)
+        if device is None:
+            return DeviceConfig(device_id, f'Device {device_id}', self.thingspeak_channel, self.thingspeak_key)
+        return device
+
+
+def parse_address(address, default_port):
+    host, _, port = address.rpartition(':')
+    if not host:
+        return port, default_port
+    return host, int(port)
+
+
+class Upstream(object):
+    """Telegram and ThingSpeak calls over one pooled requests.Session
+
+    Connections are kept alive and reused, so only the first call to each
+    host pays for the TCP and TLS handshakes. requests is imported on first
+    use.
+    """
+
+    def __init__(self, config, pool_size=4, timeout=5):
+        self.config = config
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._session = session
+        return self._session
+
+    def _request(self, service, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session().request(method, url, timeout=self.timeout, **kwargs)
+        except Exception as e:
+            HTTP_SECONDS.labels(service).observe(time.perf_counter() - start)
+            HTTP_ERRORS.labels(service).inc()
+            log.warning("%s request failed: %s", service, e)
+            return False
+        HTTP_SECONDS.labels(service).observe(time.perf_counter() - start)
+        log.debug("%s response %s: %s", service, response.status_code, response.text)
+        if response.status_code not in (200, 202):
+            HTTP_ERRORS.labels(service).inc()
+            log.warning("%s request rejected with status %s", service, response.status_code)
+            return False
+        return True
+
+    def send_telegram(self, text):
+        config = self.config
+        if not config.telegram_token or not config.telegram_chat_id:
+            return False
+        return self._request('telegram', 'POST', TELEGRAM_URL.format(token=config.telegram_token),
+                             data={'chat_id': config.telegram_chat_id, 'text': text[:TELEGRAM_MESSAGE_LIMIT]})
+
+    def update_thingspeak(self, fields, api_key=None):
+        """One channel update; fields maps 'field1'.. to values"""
+        api_key = api_key or self.config.thingspeak_key
+        if not api_key:
+            return False
+        return self._request('thingspeak', 'GET', THINGSPEAK_UPDATE_URL, params=dict(fields, api_key=api_key))
+
+    def bulk_update_thingspeak(self, channel, api_key, updates):
+        """Many timestamped updates for one channel; updates are (timestamp, fields) pairs"""
+        if not channel or not api_key:
+            return False
+        ok = True
+        for start in range(0, len(updates), THINGSPEAK_BULK_LIMIT):
+            entries = []
+            for timestamp, fields in updates[start:start + THINGSPEAK_BULK_LIMIT]:
+                created = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+                entries.append(dict(fields, created_at=created.strftime('%Y-%m-%d %H:%M:%S +0000')))
+            ok = self._request('thingspeak', 'POST', THINGSPEAK_BULK_URL.format(channel=channel),
+                               data=json.dumps({'write_api_key': api_key, 'updates': entries}),
+                               headers={'Content-Type': 'application/json'}) and ok
+        return ok